@@ -1,3 +1,203 @@
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.urls import path
+from django.utils import timezone
 
-# Register your models here.
+from .export import CONTENT_TYPES, export_queryset, parse_bound, stream_export
+from .models import ContactSubmission, OutboxMessage
+from .search import search_submissions
+
+CURSOR_VAR = 'before'
+SEARCH_LIMIT = 200
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Change list that pages by primary key instead of OFFSET and COUNT(*).
+
+    Each page is ``WHERE id < <last id of previous page> ORDER BY id DESC
+    LIMIT n``, which is an index range scan however deep the page is.
+    There is no total count and no numbered pages, only newer/older links.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        super().__init__(request, *args, **kwargs)
+        # Keep the cursor out of the search form and filter links
+        self.params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        ranking = getattr(request, 'search_ranking', None)
+        if self.query and ranking is not None:
+            return self.get_search_results(ranking)
+        try:
+            self.cursor = int(request.GET.get(CURSOR_VAR) or 0)
+        except ValueError:
+            raise IncorrectLookupParameters
+        queryset = self.queryset.order_by('-pk')
+        if self.cursor:
+            queryset = queryset.filter(pk__lt=self.cursor)
+
+        rows = list(queryset[:self.list_per_page + 1])
+        self.result_list = rows[:self.list_per_page]
+        self.next_cursor = self.result_list[-1].pk if len(rows) > self.list_per_page else None
+
+        self.result_count = len(self.result_list)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = bool(self.cursor or self.next_cursor)
+        self.paginator = None
+
+    def get_search_results(self, ranking):
+        """
+        Show full-text matches best first, limited to the top ``SEARCH_LIMIT``
+        """
+        rows = self.queryset.order_by().in_bulk([pk for pk, _ in ranking])
+        self.result_list = [rows[pk] for pk, _ in ranking if pk in rows]
+        self.cursor = 0
+        self.next_cursor = None
+        self.result_count = len(self.result_list)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = None
+
+    @property
+    def newest_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR])
+
+    @property
+    def next_page_url(self):
+        if self.next_cursor is None:
+            return None
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+@admin.register(ContactSubmission)
+class ContactSubmissionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'email', 'status', 'created_at')
+    list_filter = ('status',)
+    list_per_page = 50
+    # Searched through the full-text index, see get_search_results()
+    search_fields = ('name', 'email', 'message')
+    ordering = ('-id',)
+    # Sorting by another column would break the keyset
+    sortable_by = ()
+    show_full_result_count = False
+    change_list_template = 'admin/backend/contactsubmission/change_list.html'
+    actions = ['mark_read', 'mark_archived', 'mark_spam']
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        request.search_ranking = search_submissions(search_term, SEARCH_LIMIT)
+        return queryset.filter(pk__in=[pk for pk, _ in request.search_ranking]), False
+
+    def get_urls(self):
+        return [
+            path('search/', self.admin_site.admin_view(self.search_view),
+                 name='backend_contactsubmission_search'),
+            path('export/', self.admin_site.admin_view(self.export_view),
+                 name='backend_contactsubmission_export'),
+        ] + super().get_urls()
+
+    def search_view(self, request):
+        """
+        JSON search API: ``?q=<text>&limit=<n>``, results best match first
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            limit = min(int(request.GET.get('limit', 20)), SEARCH_LIMIT)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid limit')
+        ranking = search_submissions(request.GET.get('q', ''), limit)
+        rows = ContactSubmission.objects.in_bulk([pk for pk, _ in ranking])
+        results = [
+            {
+                'id': pk,
+                'rank': rank,
+                'name': rows[pk].name,
+                'email': rows[pk].email,
+                'status': rows[pk].status,
+                'created_at': rows[pk].created_at.isoformat(),
+                'excerpt': rows[pk].message[:200],
+            }
+            for pk, rank in ranking if pk in rows
+        ]
+        return JsonResponse({'results': results})
+
+    def export_view(self, request):
+        """
+        Stream submissions as CSV or NDJSON, optionally gzipped.
+
+        Query parameters: ``format`` (csv or ndjson), ``since``/``until``
+        (date or ISO datetime), ``status`` and ``gzip=1``.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        fmt = request.GET.get('format', 'csv')
+        compress = request.GET.get('gzip') == '1'
+        try:
+            if fmt not in CONTENT_TYPES:
+                raise ValueError(f'Unknown export format: {fmt!r}')
+            queryset = export_queryset(
+                since=parse_bound(request.GET.get('since')),
+                until=parse_bound(request.GET.get('until'), end=True),
+                status=request.GET.get('status'),
+            )
+        except ValueError as exc:
+            return HttpResponseBadRequest(str(exc))
+
+        filename = f'contact-submissions.{fmt}' + ('.gz' if compress else '')
+        response = StreamingHttpResponse(
+            stream_export(queryset, fmt, compress),
+            content_type='application/gzip' if compress else CONTENT_TYPES[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def _set_status(self, request, queryset, status):
+        updated = queryset.update(status=status)
+        self.message_user(request, f'{updated} submission(s) updated.')
+
+    @admin.action(description='Mark selected submissions as read')
+    def mark_read(self, request, queryset):
+        self._set_status(request, queryset, ContactSubmission.READ)
+
+    @admin.action(description='Archive selected submissions')
+    def mark_archived(self, request, queryset):
+        self._set_status(request, queryset, ContactSubmission.ARCHIVED)
+
+    @admin.action(description='Mark selected submissions as spam')
+    def mark_spam(self, request, queryset):
+        self._set_status(request, queryset, ContactSubmission.SPAM)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('attempts', 'locked_at', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected messages now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status__in=[OutboxMessage.SENT, OutboxMessage.DIGESTED]).update(
+            status=OutboxMessage.PENDING, attempts=0, locked_at=None, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} message(s) scheduled for delivery.')
@@ -0,0 +1,163 @@
+"""
+Small asyncio SMTP client used by the async contact view.
+
+It speaks just enough SMTP (EHLO, STARTTLS, AUTH PLAIN, MAIL, RCPT, DATA)
+to hand a Django ``EmailMessage`` to the configured server without
+blocking a thread, with separate connect and per-command timeouts.
+"""
+import asyncio
+import base64
+import re
+import ssl
+from email.utils import parseaddr
+
+from django.conf import settings
+from django.core.mail.message import sanitize_address
+from django.core.mail.utils import DNS_NAME
+
+SMTP_BACKENDS = (
+    'django.core.mail.backends.smtp.EmailBackend',
+    'backend.mail.PooledEmailBackend',
+)
+
+
+class AsyncSMTPError(Exception):
+    """
+    The server answered a command with an unexpected reply code
+    """
+
+    def __init__(self, code, message):
+        super().__init__(f'{code} {message}')
+        self.code = code
+        self.message = message
+
+
+def envelope_address(address, encoding):
+    """
+    Bare address for MAIL FROM and RCPT TO; display names belong in the headers only
+    """
+    return parseaddr(sanitize_address(address, encoding))[1]
+
+
+def smtp_configured():
+    """
+    Whether ``EMAIL_BACKEND`` delivers over SMTP, so talking SMTP directly is equivalent
+    """
+    return settings.EMAIL_BACKEND in SMTP_BACKENDS
+
+
+class AsyncSMTPClient:
+
+    def __init__(self, host=None, port=None, username=None, password=None,
+                 use_tls=None, use_ssl=None, connect_timeout=None, timeout=None):
+        self.host = host or settings.EMAIL_HOST
+        self.port = port or settings.EMAIL_PORT
+        self.username = settings.EMAIL_HOST_USER if username is None else username
+        self.password = settings.EMAIL_HOST_PASSWORD if password is None else password
+        self.use_tls = settings.EMAIL_USE_TLS if use_tls is None else use_tls
+        self.use_ssl = settings.EMAIL_USE_SSL if use_ssl is None else use_ssl
+        self.connect_timeout = connect_timeout or getattr(settings, 'EMAIL_CONNECT_TIMEOUT', 5)
+        self.timeout = timeout or settings.EMAIL_TIMEOUT or 10
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port,
+                ssl=ssl.create_default_context() if self.use_ssl else None,
+            ),
+            self.connect_timeout,
+        )
+        await self._expect(220)
+        await self.command(f'EHLO {DNS_NAME.get_fqdn()}', 250)
+        if self.use_tls:
+            await self.command('STARTTLS', 220)
+            await asyncio.wait_for(
+                self.writer.start_tls(ssl.create_default_context(), server_hostname=self.host),
+                self.timeout,
+            )
+            await self.command(f'EHLO {DNS_NAME.get_fqdn()}', 250)
+        if self.username and self.password:
+            token = base64.b64encode(f'\0{self.username}\0{self.password}'.encode()).decode()
+            await self.command(f'AUTH PLAIN {token}', 235)
+
+    async def command(self, line, *expected):
+        self.writer.write(line.encode() + b'\r\n')
+        await asyncio.wait_for(self.writer.drain(), self.timeout)
+        return await self._expect(*expected)
+
+    async def send_message(self, email_message):
+        """
+        Send a Django ``EmailMessage``; returns the number of accepted recipients
+        """
+        recipients = email_message.recipients()
+        if not recipients:
+            return 0
+        encoding = email_message.encoding or settings.DEFAULT_CHARSET
+        from_email = envelope_address(email_message.from_email, encoding)
+        data = email_message.message().as_bytes(linesep='\r\n')
+
+        await self.command(f'MAIL FROM:<{from_email}>', 250)
+        for recipient in recipients:
+            await self.command(f'RCPT TO:<{envelope_address(recipient, encoding)}>', 250, 251)
+        await self.command('DATA', 354)
+        # Dot-stuff lines that start with a period (RFC 5321, 4.5.2)
+        data = re.sub(rb'(?m)^\.', b'..', data)
+        if not data.endswith(b'\r\n'):
+            data += b'\r\n'
+        self.writer.write(data + b'.\r\n')
+        await asyncio.wait_for(self.writer.drain(), self.timeout)
+        await self._expect(250)
+        return len(recipients)
+
+    async def close(self):
+        if self.writer is None:
+            return
+        try:
+            await self.command('QUIT', 221)
+        except (AsyncSMTPError, OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.abort()
+
+    def abort(self):
+        """
+        Drop the connection without the QUIT round trip
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = self.reader = None
+
+    async def _expect(self, *expected):
+        code, message = await asyncio.wait_for(self._read_reply(), self.timeout)
+        if code not in expected:
+            raise AsyncSMTPError(code, message)
+        return code, message
+
+    async def _read_reply(self):
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionResetError('SMTP server closed the connection')
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            lines.append(line[4:])
+            # "250-..." continues a multi-line reply, "250 ..." ends it
+            if line[3:4] != '-':
+                return int(line[:3]), '\n'.join(lines)
+
+
+async def send_message(email_message, **kwargs):
+    """
+    Connect, send ``email_message`` and disconnect
+    """
+    client = AsyncSMTPClient(**kwargs)
+    try:
+        await client.connect()
+        sent = await client.send_message(email_message)
+    except BaseException:
+        client.abort()
+        raise
+    await client.close()
+    return sent
@@ -0,0 +1,90 @@
+"""
+Cache backends for multi-worker deployments.
+"""
+import functools
+import hashlib
+import os
+import time
+
+from django.conf import settings
+
+# The lock entry ``atomic_update`` takes on caches without ``update``
+UPDATE_LOCK_TIMEOUT = 1
+UPDATE_LOCK_ATTEMPTS = 50
+UPDATE_LOCK_WAIT = 0.002
+
+
+def _git_head(base_dir):
+    git_dir = os.path.join(base_dir, '.git')
+    try:
+        with open(os.path.join(git_dir, 'HEAD')) as f:
+            head = f.read().strip()
+        if not head.startswith('ref: '):
+            return head
+        ref = head[5:]
+        try:
+            with open(os.path.join(git_dir, ref)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            with open(os.path.join(git_dir, 'packed-refs')) as f:
+                for line in f:
+                    if line.rstrip().endswith(' ' + ref):
+                        return line.split()[0]
+    except OSError:
+        pass
+    return None
+
+
+def _manifest_hash():
+    manifest = os.path.join(settings.STATIC_ROOT or '', 'staticfiles.json')
+    try:
+        with open(manifest, 'rb') as f:
+            return hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+    except OSError:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def deploy_version():
+    """
+    Identify the running deploy: DEPLOY_VERSION if set, else the commit
+    (Render's RENDER_GIT_COMMIT or the checkout's HEAD), else a hash of the
+    collected static manifest. Every worker of one deploy agrees on it.
+    """
+    version = (
+        getattr(settings, 'DEPLOY_VERSION', None)
+        or os.environ.get('RENDER_GIT_COMMIT')
+        or _git_head(settings.BASE_DIR)
+        or _manifest_hash()
+        or 'dev'
+    )
+    return str(version)[:12]
+
+
+def atomic_update(cache, key, func, timeout=None):
+    """
+    Replace ``key`` with ``func(current value or None)`` so that no other
+    worker's update lands in between; ``func`` returns ``(new value,
+    result)`` and a new value of None leaves the entry as it is. Returns
+    ``result``.
+
+    Backends with an ``update`` method (``SharedMemoryCache``,
+    ``TieredCache``) do this under their own lock. Anywhere else the
+    read-modify-write runs under a ``<key>:lock`` entry taken with the
+    cache's atomic ``add``; TimeoutError if it can't be taken in time.
+    """
+    update = getattr(cache, 'update', None)
+    if update is not None:
+        return update(key, func, timeout)
+    lock = f'{key}:lock'
+    for _ in range(UPDATE_LOCK_ATTEMPTS):
+        if cache.add(lock, 1, timeout=UPDATE_LOCK_TIMEOUT):
+            try:
+                value, result = func(cache.get(key))
+                if value is not None:
+                    cache.set(key, value, timeout)
+                return result
+            finally:
+                cache.delete(lock)
+        time.sleep(UPDATE_LOCK_WAIT)
+    raise TimeoutError(f'{key} stayed locked')
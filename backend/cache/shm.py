@@ -0,0 +1,369 @@
+"""
+Cache backend shared by every worker process on a node.
+
+Entries live in a memory-mapped file (on ``/dev/shm`` by default, so it
+never touches disk) laid out as a fixed-size, set-associative hash table:
+a key hashes to one bucket of ``WAYS`` fixed-size slots and can only live in
+that bucket. A full bucket evicts with the CLOCK algorithm, an approximation
+of LRU that only needs a reference bit per slot.
+
+Each bucket is protected by a POSIX byte-range lock (``fcntl.lockf``) so
+processes only contend when they touch the same bucket. Those locks belong
+to the process, so threads within a worker are serialised by a striped
+``threading.Lock`` first. ``add``, ``incr`` and ``update`` run entirely
+under the bucket lock and are atomic across workers, which rate limiting
+relies on.
+
+Values larger than a slot after pickling and compression are not cached.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'backend.cache.shm.SharedMemoryCache',
+            'LOCATION': '/dev/shm/portfolio-cache',
+            'OPTIONS': {'SLOTS': 2048, 'SLOT_SIZE': 16384, 'WAYS': 8},
+        }
+    }
+"""
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PFSHMC01'
+# magic, slots, slot size, ways
+FILE_HEADER = struct.Struct('<8sIII')
+FILE_HEADER_SIZE = 64
+# flags, reference bit, key length, value length, expires at (0 = never), key hash
+SLOT_HEADER = struct.Struct('<BBHIdQ')
+
+USED = 1
+COMPRESSED = 2
+
+COMPRESS_MIN_SIZE = 1024
+LOCK_STRIPES = 64
+
+
+class SharedRegion:
+    """
+    The mapped file plus the locks guarding it, shared by every cache
+    instance in this process that points at the same file
+    """
+
+    def __init__(self, path, slots, slot_size, ways):
+        if slots % ways:
+            raise ValueError(f'SLOTS ({slots}) must be a multiple of WAYS ({ways})')
+        if not 0 < ways < 256:
+            raise ValueError(f'WAYS must be between 1 and 255, not {ways}')
+        if slot_size <= SLOT_HEADER.size + 250:
+            raise ValueError(f'SLOT_SIZE {slot_size} leaves no room for values')
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ways = ways
+        self.buckets = slots // ways
+        # One CLOCK hand per bucket; also the byte locked for that bucket
+        self.hands_offset = FILE_HEADER_SIZE
+        self.slots_offset = FILE_HEADER_SIZE + -(-self.buckets // 4096) * 4096
+        self.size = self.slots_offset + slots * slot_size
+        self.stripes = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.stats = dict.fromkeys(('hits', 'misses', 'sets', 'evictions', 'oversize'), 0)
+        self.pid = os.getpid()
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            header = FILE_HEADER.pack(MAGIC, slots, slot_size, ways)
+            if os.pread(self.fd, FILE_HEADER.size, 0) != header or os.fstat(self.fd).st_size != self.size:
+                # New file or different geometry: start empty. Truncating
+                # to zero first discards stale slots, the file stays sparse.
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+                os.pwrite(self.fd, header, 0)
+            self.map = mmap.mmap(self.fd, self.size)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    def bucket_lock(self, bucket):
+        return _BucketLock(self, bucket)
+
+    def lock_all(self):
+        return _BucketLock(self, None)
+
+
+class _BucketLock:
+
+    def __init__(self, region, bucket):
+        self.region = region
+        self.bucket = bucket
+
+    def __enter__(self):
+        region = self.region
+        if self.bucket is None:
+            for stripe in region.stripes:
+                stripe.acquire()
+            fcntl.lockf(region.fd, fcntl.LOCK_EX)
+        else:
+            region.stripes[self.bucket % LOCK_STRIPES].acquire()
+            fcntl.lockf(region.fd, fcntl.LOCK_EX, 1, region.hands_offset + self.bucket)
+
+    def __exit__(self, *exc_info):
+        region = self.region
+        if self.bucket is None:
+            fcntl.lockf(region.fd, fcntl.LOCK_UN)
+            for stripe in reversed(region.stripes):
+                stripe.release()
+        else:
+            fcntl.lockf(region.fd, fcntl.LOCK_UN, 1, region.hands_offset + self.bucket)
+            region.stripes[self.bucket % LOCK_STRIPES].release()
+
+
+_regions = {}
+_regions_lock = threading.Lock()
+
+
+def get_region(path, slots, slot_size, ways):
+    key = (path, slots, slot_size, ways)
+    with _regions_lock:
+        region = _regions.get(key)
+        if region is None or region.pid != os.getpid():
+            # fcntl locks aren't inherited across fork(), so a forked worker
+            # opens its own descriptor.
+            region = _regions[key] = SharedRegion(path, slots, slot_size, ways)
+    return region
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    Django cache backend on a ``SharedRegion``
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.region = get_region(
+            location,
+            options.get('SLOTS', 2048),
+            options.get('SLOT_SIZE', 16384),
+            options.get('WAYS', 8),
+        )
+
+    # ##### Slot access, callers hold the bucket lock #####
+
+    def _locate(self, key):
+        raw_key = key.encode()
+        key_hash = int.from_bytes(hashlib.blake2b(raw_key, digest_size=8).digest(), 'little')
+        return raw_key, key_hash, key_hash % self.region.buckets
+
+    def _slot_offset(self, bucket, way):
+        region = self.region
+        return region.slots_offset + (bucket * region.ways + way) * region.slot_size
+
+    def _find(self, raw_key, key_hash, bucket, now):
+        """
+        Return ``(offset, header)`` of the live slot holding the key, or None
+        """
+        data = self.region.map
+        for way in range(self.region.ways):
+            offset = self._slot_offset(bucket, way)
+            header = SLOT_HEADER.unpack_from(data, offset)
+            flags, _, key_len, _, expires, slot_hash = header
+            if not flags & USED or slot_hash != key_hash:
+                continue
+            start = offset + SLOT_HEADER.size
+            if data[start:start + key_len] != raw_key:
+                continue
+            if expires and expires <= now:
+                data[offset] = 0
+                return None
+            return offset, header
+        return None
+
+    def _read(self, offset, header):
+        """
+        Copy out a slot's encoded value and mark it recently used
+        """
+        flags, ref, key_len, value_len, _, _ = header
+        data = self.region.map
+        if not ref:
+            data[offset + 1] = 1
+        start = offset + SLOT_HEADER.size + key_len
+        return flags, data[start:start + value_len]
+
+    def _decode(self, flags, value):
+        if flags & COMPRESSED:
+            value = zlib.decompress(value)
+        return pickle.loads(value)
+
+    def _encode(self, value):
+        value = pickle.dumps(value, self.pickle_protocol)
+        if len(value) >= COMPRESS_MIN_SIZE:
+            compressed = zlib.compress(value, 1)
+            if len(compressed) < len(value):
+                return compressed, USED | COMPRESSED
+        return value, USED
+
+    def _victim(self, bucket, now):
+        """
+        Pick a slot for a new key: a free or expired one, else sweep the
+        bucket's CLOCK hand past recently referenced slots
+        """
+        region = self.region
+        data = region.map
+        for way in range(region.ways):
+            offset = self._slot_offset(bucket, way)
+            flags, _, _, _, expires, _ = SLOT_HEADER.unpack_from(data, offset)
+            if not flags & USED or (expires and expires <= now):
+                return offset
+        hand_offset = region.hands_offset + bucket
+        hand = data[hand_offset] % region.ways
+        while True:
+            offset = self._slot_offset(bucket, hand)
+            hand = (hand + 1) % region.ways
+            if data[offset + 1]:
+                data[offset + 1] = 0
+                continue
+            data[hand_offset] = hand
+            region.stats['evictions'] += 1
+            return offset
+
+    def _store(self, raw_key, key_hash, bucket, value, expires, now, offset=None):
+        region = self.region
+        encoded, flags = self._encode(value)
+        if SLOT_HEADER.size + len(raw_key) + len(encoded) > region.slot_size:
+            region.stats['oversize'] += 1
+            if offset is not None:
+                region.map[offset] = 0
+            return False
+        if offset is None:
+            offset = self._victim(bucket, now)
+        start = offset + SLOT_HEADER.size
+        data = region.map
+        data[offset] = 0
+        data[start:start + len(raw_key)] = raw_key
+        data[start + len(raw_key):start + len(raw_key) + len(encoded)] = encoded
+        # Header last, with the used flag, once the payload is in place. The
+        # reference bit starts clear: only a later read protects the entry.
+        SLOT_HEADER.pack_into(data, offset, flags, 0, len(raw_key), len(encoded), expires or 0, key_hash)
+        region.stats['sets'] += 1
+        return True
+
+    # ##### Django cache API #####
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw_key, key_hash, bucket = self._locate(key)
+        now = time.time()
+        with self.region.bucket_lock(bucket):
+            if self._find(raw_key, key_hash, bucket, now):
+                return False
+            return self._store(raw_key, key_hash, bucket, value, self.get_backend_timeout(timeout), now)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw_key, key_hash, bucket = self._locate(key)
+        with self.region.bucket_lock(bucket):
+            found = self._find(raw_key, key_hash, bucket, time.time())
+            if found:
+                encoded = self._read(*found)
+        if not found:
+            self.region.stats['misses'] += 1
+            return default
+        # Unpickle outside the lock
+        self.region.stats['hits'] += 1
+        return self._decode(*encoded)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw_key, key_hash, bucket = self._locate(key)
+        now = time.time()
+        with self.region.bucket_lock(bucket):
+            found = self._find(raw_key, key_hash, bucket, now)
+            self._store(
+                raw_key, key_hash, bucket, value, self.get_backend_timeout(timeout), now,
+                offset=found[0] if found else None,
+            )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw_key, key_hash, bucket = self._locate(key)
+        with self.region.bucket_lock(bucket):
+            found = self._find(raw_key, key_hash, bucket, time.time())
+            if not found:
+                return False
+            struct.pack_into('<d', self.region.map, found[0] + 8, self.get_backend_timeout(timeout) or 0)
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw_key, key_hash, bucket = self._locate(key)
+        now = time.time()
+        with self.region.bucket_lock(bucket):
+            found = self._find(raw_key, key_hash, bucket, now)
+            if not found:
+                raise ValueError("Key '%s' not found" % key)
+            offset, header = found
+            value = self._decode(*self._read(offset, header)) + delta
+            self._store(raw_key, key_hash, bucket, value, header[4], now, offset=offset)
+            return value
+
+    def update(self, key, func, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Replace the value with ``func(current value or None)`` atomically.
+
+        ``func`` returns ``(new value, result)`` and runs under the bucket
+        lock, so it must be quick. A new value of None leaves the entry as
+        it is. Returns ``result``.
+        """
+        key = self.make_and_validate_key(key, version=version)
+        raw_key, key_hash, bucket = self._locate(key)
+        now = time.time()
+        with self.region.bucket_lock(bucket):
+            found = self._find(raw_key, key_hash, bucket, now)
+            value, result = func(self._decode(*self._read(*found)) if found else None)
+            if value is not None:
+                self._store(
+                    raw_key, key_hash, bucket, value, self.get_backend_timeout(timeout), now,
+                    offset=found[0] if found else None,
+                )
+        return result
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw_key, key_hash, bucket = self._locate(key)
+        with self.region.bucket_lock(bucket):
+            found = self._find(raw_key, key_hash, bucket, time.time())
+            if found:
+                self.region.map[found[0]] = 0
+            return bool(found)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        raw_key, key_hash, bucket = self._locate(key)
+        with self.region.bucket_lock(bucket):
+            return bool(self._find(raw_key, key_hash, bucket, time.time()))
+
+    def clear(self):
+        region = self.region
+        with region.lock_all():
+            region.map[region.hands_offset:] = bytes(region.size - region.hands_offset)
+
+    def stats(self):
+        """
+        Hit, miss and eviction counts for this process
+        """
+        stats = dict(self.region.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else None
+        return stats
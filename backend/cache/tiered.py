@@ -0,0 +1,220 @@
+"""
+Two-tier cache: a small in-process LRU (L1) in front of another cache alias
+(L2), typically the node-wide ``SharedMemoryCache``.
+
+Reads are served from L1 when possible and fall through to L2, filling L1
+on the way back. Writes go to L2 first, then L1. L1 entries live at most
+``L1_TIMEOUT`` seconds, which bounds how long one worker can serve a value
+another worker has since replaced or deleted. ``incr``/``decr`` and
+``update`` always go to L2 so counters stay atomic.
+
+Every key is prefixed with the deploy version (see
+``backend.cache.deploy_version``), so a new deploy starts with an empty
+namespace and pages cached by the previous one are never served again; the
+old entries simply age out of L2.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'backend.cache.tiered.TieredCache',
+            'OPTIONS': {'L2': 'shared', 'L1_MAX_ENTRIES': 512, 'L1_TIMEOUT': 5},
+        },
+        'shared': {...},
+    }
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import atomic_update, deploy_version
+
+_MISSING = object()
+
+
+class LRUTier:
+    """
+    Thread-safe, size-bounded LRU of pickled values with per-entry expiry.
+
+    One per process and configuration: Django creates cache instances per
+    thread, and they should all share the same L1.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return _MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            self.delete(key)
+            return
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+_stats = {}
+
+
+class TieredCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options.get('L2', 'shared')
+        self.l1_timeout = options.get('L1_TIMEOUT', 5)
+        name = location or self.l2_alias
+        with _tiers_lock:
+            if name not in _tiers:
+                _tiers[name] = LRUTier(options.get('L1_MAX_ENTRIES', 512))
+                _stats[name] = dict.fromkeys(('l1_hits', 'l1_misses', 'l2_hits', 'l2_misses'), 0)
+        self.l1 = _tiers[name]
+        self._stats = _stats[name]
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def make_key(self, key, version=None):
+        return f'{deploy_version()}:{super().make_key(key, version)}'
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def _l1_ttl(self, timeout):
+        timeout = self._timeout(timeout)
+        return self.l1_timeout if timeout is None else min(self.l1_timeout, timeout)
+
+    def _count(self, name):
+        # Unlocked on purpose: approximate counts are fine for monitoring
+        self._stats[name] += 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value = self.l1.get(key)
+        if value is not _MISSING:
+            self._count('l1_hits')
+            return value
+        self._count('l1_misses')
+        value = self.l2.get(key, _MISSING)
+        if value is _MISSING:
+            self._count('l2_misses')
+            return default
+        self._count('l2_hits')
+        self.l1.set(key, value, self.l1_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = {}
+        for key in keys:
+            made = self.make_and_validate_key(key, version=version)
+            value = self.l1.get(made)
+            if value is _MISSING:
+                missing[made] = key
+            else:
+                found[key] = value
+        self._stats['l1_hits'] += len(found)
+        self._stats['l1_misses'] += len(missing)
+        if missing:
+            from_l2 = self.l2.get_many(missing)
+            self._stats['l2_hits'] += len(from_l2)
+            self._stats['l2_misses'] += len(missing) - len(from_l2)
+            for made, value in from_l2.items():
+                self.l1.set(made, value, self.l1_timeout)
+                found[missing[made]] = value
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.l2.set(key, value, self._timeout(timeout))
+        self.l1.set(key, value, self._l1_ttl(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        made = {self.make_and_validate_key(key, version=version): value for key, value in data.items()}
+        failed = set(self.l2.set_many(made, self._timeout(timeout)))
+        for key, value in made.items():
+            if key not in failed:
+                self.l1.set(key, value, self._l1_ttl(timeout))
+        return [key for key in data if self.make_key(key, version=version) in failed]
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        if not self.l2.add(key, value, self._timeout(timeout)):
+            return False
+        self.l1.set(key, value, self._l1_ttl(timeout))
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.l1.delete(key)
+        return self.l2.touch(key, self._timeout(timeout))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.l1.delete(key)
+        return self.l2.incr(key, delta)
+
+    def update(self, key, func, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.l1.delete(key)
+        return atomic_update(self.l2, key, func, self._timeout(timeout))
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.l1.delete(key)
+        return self.l2.delete(key)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        for key in keys:
+            self.l1.delete(key)
+        self.l2.delete_many(keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self.l1.get(key) is not _MISSING or self.l2.has_key(key)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def stats(self):
+        """
+        Hit and miss counts per tier for this process
+        """
+        stats = dict(self._stats, version=deploy_version(), l1_entries=len(self.l1.entries))
+        for tier in ('l1', 'l2'):
+            lookups = stats[f'{tier}_hits'] + stats[f'{tier}_misses']
+            stats[f'{tier}_hit_ratio'] = round(stats[f'{tier}_hits'] / lookups, 3) if lookups else None
+        if hasattr(self.l2, 'stats'):
+            stats['l2'] = self.l2.stats()
+        return stats
@@ -0,0 +1,415 @@
+"""
+Unused-CSS elimination for the legacy stylesheets.
+
+``prune_stylesheets`` renders CSS_PRUNE_TEMPLATES, collects every class and
+id their markup uses (rendered output and raw source, so both branches of
+``{% if %}`` count), adds the ones CSS_PRUNE_SCRIPTS set or query at
+runtime and CSS_PRUNE_SAFELIST, then rewrites each stylesheet in
+CSS_PRUNE_STYLESHEETS without the selectors nothing can match:
+
+* a selector is kept when every class and id in it (outside ``:not()``)
+  is used; element and attribute selectors always are;
+* rules with no selectors left, empty ``@media`` blocks and ``@keyframes``
+  no kept rule animates are dropped;
+* the result is minified and written to CSS_PRUNE_ROOT as
+  ``<name>.<hash>.css``, with ``manifest.json`` mapping original static
+  names to them. ``CachedStaticFilesStorage`` serves the pruned file in
+  place of the original when CSS_PRUNE_ENABLED.
+"""
+import functools
+import hashlib
+import json
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template import engines
+from django.template.loader import get_template
+
+from .images import static_name
+
+MANIFEST_NAME = 'manifest.json'
+
+# Blocks whose contents are rules, pruned like the top level
+GROUPING_RULES = ('@media', '@supports', '@layer', '@container', '@document')
+KEYFRAMES = ('@keyframes', '@-webkit-keyframes')
+
+_CLASS_ATTRIBUTE = re.compile(r'''\bclass\s*=\s*(["'])(.*?)\1''', re.IGNORECASE | re.DOTALL)
+_ID_ATTRIBUTE = re.compile(r'''\bid\s*=\s*(["'])(.*?)\1''', re.IGNORECASE | re.DOTALL)
+_TEMPLATE_SYNTAX = re.compile(r'{[{%#].*?[}%#]}', re.DOTALL)
+_STRING = re.compile(r'''(["'`])((?:\\.|(?!\1).)*)\1''')
+_JS_CLASS_CALL = re.compile(r'classList\.(?:add|remove|toggle|contains|replace)\(([^)]*)\)')
+_JS_CLASS_NAME = re.compile(r'''className\s*\+?=\s*(["'`])(.*?)\1''')
+_JS_SELECTOR_CALL = re.compile(
+    r'''(?:querySelector(?:All)?|closest|matches|getElementById|getElementsByClassName)\(\s*(["'`])(.*?)\1'''
+)
+_SELECTOR_NAME = re.compile(r'([.#])(-?(?:[_a-zA-Z]|\\.)(?:[\w-]|\\.)*)')
+_FUNCTIONAL_PSEUDO = re.compile(r':(?:not|has)\((?:[^()]|\([^()]*\))*\)')
+_ANIMATION = re.compile(r'(?:^|;)\s*animation(?:-name)?\s*:([^;]*)', re.IGNORECASE)
+_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+_NAME = re.compile(r'-?[_a-zA-Z][\w-]*')
+
+
+# Collecting used selectors
+
+def _names(tokens):
+    # Interpolations (`${...}`, leftovers of template tags) are not names
+    return {token for token in tokens.split() if _NAME.fullmatch(token)}
+
+
+def markup_selectors(html):
+    """
+    ``(classes, ids)`` used by an HTML document or template source
+    """
+    html = _TEMPLATE_SYNTAX.sub(' ', html)
+    classes, ids = set(), set()
+    for _, value in _CLASS_ATTRIBUTE.findall(html):
+        classes |= _names(value)
+    for _, value in _ID_ATTRIBUTE.findall(html):
+        ids |= _names(value)
+    return classes, ids
+
+
+def script_selectors(source):
+    """
+    ``(classes, ids)`` a script adds, toggles or looks up at runtime
+    """
+    classes, ids = set(), set()
+    for arguments in _JS_CLASS_CALL.findall(source):
+        for _, value in _STRING.findall(arguments):
+            classes |= _names(value)
+    for _, value in _JS_CLASS_NAME.findall(source):
+        classes |= _names(value)
+    for match in _JS_SELECTOR_CALL.finditer(source):
+        call, value = match.group(0), match.group(2)
+        if call.startswith('getElementById'):
+            ids.add(value)
+        elif call.startswith('getElementsByClassName'):
+            classes |= _names(value)
+        else:
+            for kind, name in _SELECTOR_NAME.findall(value):
+                (classes if kind == '.' else ids).add(name)
+    # Markup built in strings: innerHTML = '<div class="...">'
+    more_classes, more_ids = markup_selectors(source.replace('\\"', '"').replace("\\'", "'"))
+    return classes | more_classes, ids | more_ids
+
+
+def render_template(name):
+    """
+    ``(rendered, source)`` of a template name or a template file path
+    """
+    if os.path.isabs(name):
+        with open(name, encoding='utf-8') as f:
+            source = f.read()
+        template = engines['django'].from_string(source)
+    else:
+        template = get_template(name)
+        source = template.template.source
+    # No request: {% csrf_token %} renders nothing instead of warning
+    return template.render({'csrf_token': 'NOTPROVIDED'}), source
+
+
+def used_selectors(templates, scripts):
+    classes, ids = set(), set()
+    for name in templates:
+        for html in render_template(name):
+            more_classes, more_ids = markup_selectors(html)
+            classes |= more_classes
+            ids |= more_ids
+    for name in scripts:
+        path = finders.find(name)
+        if not path:
+            continue
+        with open(path, encoding='utf-8') as f:
+            more_classes, more_ids = script_selectors(f.read())
+        classes |= more_classes
+        ids |= more_ids
+    return classes, ids
+
+
+# Parsing
+
+def _skip_string(css, i):
+    quote = css[i]
+    i += 1
+    while i < len(css) and css[i] != quote:
+        i += 2 if css[i] == '\\' else 1
+    return i + 1
+
+
+def _block_end(css, i):
+    """
+    Index just past the ``}`` closing the block whose body starts at ``i``
+    """
+    depth = 1
+    while i < len(css):
+        char = css[i]
+        if char in '"\'':
+            i = _skip_string(css, i)
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def parse(css):
+    """
+    Nodes of a stylesheet: ``('statement', text)``, ``('rule', selector, body)``
+    or ``('group', prelude, [nodes])``. Comments are dropped.
+    """
+    css = _COMMENT.sub('', css)
+    nodes, i, start = [], 0, 0
+    while i < len(css):
+        char = css[i]
+        if char in '"\'':
+            i = _skip_string(css, i)
+        elif char == ';':
+            statement = css[start:i].strip()
+            if statement:
+                nodes.append(('statement', statement))
+            i = start = i + 1
+        elif char == '{':
+            prelude = css[start:i].strip()
+            end = _block_end(css, i + 1)
+            body = css[i + 1:end - 1]
+            if prelude.lower().startswith(GROUPING_RULES + KEYFRAMES):
+                nodes.append(('group', prelude, parse(body)))
+            else:
+                nodes.append(('rule', prelude, body))
+            i = start = end
+        elif char == '}':
+            # Stray closing brace: skip it like a browser would
+            i = start = i + 1
+        else:
+            i += 1
+    return nodes
+
+
+# Pruning
+
+def _split_top_level(text, separator):
+    parts, depth, current, i = [], 0, [], 0
+    while i < len(text):
+        char = text[i]
+        if char in '"\'':
+            end = _skip_string(text, i)
+            current.append(text[i:end])
+            i = end
+            continue
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        if char == separator and depth == 0:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    parts.append(''.join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _unescape(name):
+    return re.sub(r'\\(.)', r'\1', name)
+
+
+def selector_matches(selector, classes, ids, safelist):
+    """
+    Whether every class and id the selector requires is in use
+    """
+    selector = _FUNCTIONAL_PSEUDO.sub('', re.sub(r'\[[^\]]*\]', '', selector))
+    for kind, name in _SELECTOR_NAME.findall(selector):
+        name = _unescape(name)
+        if name in (classes if kind == '.' else ids) or any(pattern.fullmatch(name) for pattern in safelist):
+            continue
+        return False
+    return True
+
+
+def prune(nodes, classes, ids, safelist):
+    """
+    Return ``(kept_nodes, rules_seen, rules_removed)``
+    """
+    kept, seen, removed = [], 0, 0
+    for node in nodes:
+        if node[0] == 'rule' and not node[1].startswith('@'):
+            seen += 1
+            selectors = [s for s in _split_top_level(node[1], ',')
+                         if selector_matches(s, classes, ids, safelist)]
+            if selectors:
+                kept.append(('rule', ', '.join(selectors), node[2]))
+            else:
+                removed += 1
+        elif node[0] == 'group' and node[1].lower().startswith(GROUPING_RULES):
+            children, child_seen, child_removed = prune(node[2], classes, ids, safelist)
+            seen += child_seen
+            removed += child_removed
+            if children:
+                kept.append(('group', node[1], children))
+        else:
+            kept.append(node)
+    return kept, seen, removed
+
+
+def _animation_names(nodes):
+    names = set()
+    for node in nodes:
+        if node[0] == 'rule':
+            for value in _ANIMATION.findall(node[2]):
+                names |= set(re.findall(r'[-\w]+', value))
+        elif node[0] == 'group':
+            names |= _animation_names(node[2])
+    return names
+
+
+def drop_unused_keyframes(nodes, names=None):
+    names = _animation_names(nodes) if names is None else names
+    kept = []
+    for node in nodes:
+        if node[0] == 'group':
+            prelude = node[1].lower()
+            if prelude.startswith(KEYFRAMES):
+                if node[1].split(None, 1)[-1].strip() not in names:
+                    continue
+            elif prelude.startswith(GROUPING_RULES):
+                node = ('group', node[1], drop_unused_keyframes(node[2], names))
+        kept.append(node)
+    return kept
+
+
+# Minifying
+
+def _collapse(text):
+    # Whitespace inside strings is content
+    parts = _STRING.split(text)
+    out = []
+    for i in range(0, len(parts), 3):
+        out.append(re.sub(r'\s+', ' ', parts[i]))
+        if i + 2 < len(parts):
+            out.append(f'{parts[i + 1]}{parts[i + 2]}{parts[i + 1]}')
+    return ''.join(out).strip()
+
+
+def _minify_selector(selector):
+    return re.sub(r'\s*([>+~,])\s*', r'\1', _collapse(selector))
+
+
+def _minify_body(body):
+    declarations = []
+    for declaration in _split_top_level(body, ';'):
+        prop, colon, value = declaration.partition(':')
+        if not colon:
+            continue
+        value = re.sub(r'\s*!\s*important', '!important', _collapse(value))
+        value = re.sub(r'\s*,\s*', ',', value)
+        declarations.append(f'{prop.strip()}:{value}')
+    return ';'.join(declarations)
+
+
+def serialize(nodes):
+    out = []
+    for node in nodes:
+        if node[0] == 'statement':
+            out.append(_collapse(node[1]) + ';')
+        elif node[0] == 'rule':
+            body = _minify_body(node[2])
+            if body:
+                out.append(f'{_minify_selector(node[1])}{{{body}}}')
+        else:
+            out.append(f'{_collapse(node[1])}{{{serialize(node[2])}}}')
+    return ''.join(out)
+
+
+# Build stage
+
+def prune_settings():
+    return {
+        'stylesheets': list(getattr(settings, 'CSS_PRUNE_STYLESHEETS', [])),
+        'templates': list(getattr(settings, 'CSS_PRUNE_TEMPLATES', [])),
+        'scripts': list(getattr(settings, 'CSS_PRUNE_SCRIPTS', [])),
+        'safelist': list(getattr(settings, 'CSS_PRUNE_SAFELIST', [])),
+        'root': getattr(settings, 'CSS_PRUNE_ROOT', None) or os.path.join(settings.BASE_DIR, 'static', 'pruned'),
+    }
+
+
+def prune_stylesheets():
+    """
+    Write pruned copies of CSS_PRUNE_STYLESHEETS; return one report dict per stylesheet
+    """
+    config = prune_settings()
+    classes, ids = used_selectors(config['templates'], config['scripts'])
+    safelist = [re.compile(pattern) for pattern in config['safelist']]
+    root = config['root']
+    os.makedirs(root, exist_ok=True)
+    previous = load_manifest(root)
+
+    manifest, reports = {}, []
+    for name in config['stylesheets']:
+        path = finders.find(name)
+        if not path:
+            reports.append({'name': name, 'error': 'not found'})
+            continue
+        with open(path, encoding='utf-8') as f:
+            original = f.read()
+        nodes, seen, removed = prune(parse(original), classes, ids, safelist)
+        css = serialize(drop_unused_keyframes(nodes))
+        digest = hashlib.blake2b(css.encode(), digest_size=6).hexdigest()
+        stem = os.path.splitext(name)[0]
+        output = f'{stem}.{digest}.css'
+        destination = os.path.join(root, output)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with open(destination + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(css)
+        os.replace(destination + '.tmp', destination)
+        if previous.get(name) not in (None, output):
+            _remove(os.path.join(root, previous[name]))
+        manifest[name] = output
+        reports.append({
+            'name': name, 'output': output,
+            'before': len(original.encode()), 'after': len(css.encode()),
+            'rules': seen, 'rules_removed': removed,
+        })
+
+    for name in set(previous) - set(manifest):
+        _remove(os.path.join(root, previous[name]))
+    with open(os.path.join(root, MANIFEST_NAME + '.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(os.path.join(root, MANIFEST_NAME + '.tmp'), os.path.join(root, MANIFEST_NAME))
+    return reports
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def load_manifest(root=None):
+    root = root or prune_settings()['root']
+    try:
+        with open(os.path.join(root, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@functools.lru_cache(maxsize=None)
+def pruned_stylesheets():
+    """
+    ``{static name: pruned static name}``, read once per process
+    """
+    root = prune_settings()['root']
+    name = static_name(os.path.join(root, 'x'))
+    if name is None:
+        # Not under STATICFILES_DIRS, so collectstatic never picks the files up
+        return {}
+    prefix = name[:-1]
+    return {name: prefix + output for name, output in load_manifest(root).items()}
@@ -0,0 +1,313 @@
+"""
+Pooled database connections.
+
+Point a ``DATABASES`` entry's ``ENGINE`` at ``backend.dbpool.sqlite3`` or
+``backend.dbpool.postgresql`` and Django checks raw connections out of a
+per-process pool instead of opening one per request. Closing the Django
+connection (which happens at the end of every request with
+``CONN_MAX_AGE = 0``) rolls back and returns it to the pool.
+
+Pool options live under the entry's ``POOL`` key::
+
+    'POOL': {
+        'MIN_SIZE': 1,            # connections kept open even when idle
+        'MAX_SIZE': 10,           # hard cap, checked-out plus idle
+        'TIMEOUT': 5,             # seconds to wait for a free connection
+        'MAX_IDLE': 300,          # close spare connections idle this long
+        'MAX_LIFETIME': 3600,     # recycle connections older than this
+        'HEALTH_CHECK_AFTER': 5,  # SELECT 1 before reusing one idle this long
+    }
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.utils import OperationalError
+
+logger = logging.getLogger(__name__)
+
+POOL_DEFAULTS = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5,
+    'MAX_IDLE': 300,
+    'MAX_LIFETIME': 3600,
+    'HEALTH_CHECK_AFTER': 5,
+}
+
+
+class PoolTimeout(OperationalError):
+    """
+    Raised when no pooled database connection became free in time
+    """
+
+
+def ping(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+class ConnectionPool:
+    """
+    A bounded pool of raw DB-API connections.
+
+    ``acquire(connect)`` hands out the most recently used idle connection,
+    opening a new one with ``connect()`` while below ``max_size`` and
+    otherwise waiting up to ``timeout`` seconds for a release.
+    """
+
+    def __init__(self, min_size=1, max_size=10, timeout=5, max_idle=300, max_lifetime=3600,
+                 health_check_after=5, health_check=ping):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f'Invalid pool size: min {min_size}, max {max_size}')
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.health_check = health_check
+        self.pid = os.getpid()
+        self._idle = deque()
+        self._opened_at = {}
+        self._size = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'acquisitions': 0,
+            'connections_opened': 0,
+            'connections_reused': 0,
+            'connections_discarded': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def acquire(self, connect):
+        """
+        Return ``(connection, reused)``
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            with self._cond:
+                self._waiting += 1
+                try:
+                    while not self._idle and self._size >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats['timeouts'] += 1
+                            raise PoolTimeout(
+                                f'No database connection available after {self.timeout}s '
+                                f'({self._size} open, max {self.max_size})'
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                if self._idle:
+                    # Most recently used first, so spare connections age out
+                    connection, released_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    connection = None
+
+            if connection is None:
+                connection = self._open(connect)
+                reused = False
+            elif self._is_usable(connection, time.monotonic() - released_at):
+                reused = True
+            else:
+                self.discard(connection)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._stats['acquisitions'] += 1
+                self._stats['connections_reused' if reused else 'connections_opened'] += 1
+                self._stats['wait_seconds_total'] += waited
+                self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+            if not reused:
+                self._fill(connect)
+            return connection, reused
+
+    def release(self, connection):
+        now = time.monotonic()
+        if now - self._opened_at.get(id(connection), now) > self.max_lifetime:
+            self.discard(connection)
+            return
+        with self._cond:
+            self._idle.append((connection, now))
+            self._cond.notify()
+        self._reap(now)
+
+    def discard(self, connection):
+        with self._cond:
+            self._opened_at.pop(id(connection), None)
+            self._size -= 1
+            self._stats['connections_discarded'] += 1
+            self._cond.notify()
+        try:
+            connection.close()
+        except Exception:
+            logger.debug('Error closing pooled database connection', exc_info=True)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self.discard(connection)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(
+                self._stats,
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                waiting=self._waiting,
+                min_size=self.min_size,
+                max_size=self.max_size,
+            )
+        acquisitions = stats['acquisitions']
+        stats['avg_wait_ms'] = (
+            round(stats['wait_seconds_total'] / acquisitions * 1000, 3) if acquisitions else None
+        )
+        return stats
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._opened_at[id(connection)] = time.monotonic()
+        return connection
+
+    def _fill(self, connect):
+        # Top up to min_size right after the pool had to open a connection,
+        # so the next burst of requests finds warm connections waiting.
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._open(connect)
+            except Exception:
+                logger.warning('Could not pre-open pooled database connection', exc_info=True)
+                return
+            with self._cond:
+                self._stats['connections_opened'] += 1
+            self.release(connection)
+
+    def _reap(self, now):
+        expired = []
+        with self._cond:
+            while (
+                self._idle and self._size - len(expired) > self.min_size
+                and now - self._idle[0][1] > self.max_idle
+            ):
+                expired.append(self._idle.popleft()[0])
+        for connection in expired:
+            self.discard(connection)
+
+    def _is_usable(self, connection, idle_for):
+        if time.monotonic() - self._opened_at.get(id(connection), 0) > self.max_lifetime:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        try:
+            self.health_check(connection)
+        except Exception:
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+            return False
+        return True
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict):
+    """
+    Return this process's pool for a database alias, creating it if needed
+    """
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None or pool.pid != os.getpid():
+            # A pool inherited across fork() shares sockets with the parent;
+            # drop it without closing anything and start afresh.
+            options = dict(POOL_DEFAULTS, **settings_dict.get('POOL', {}))
+            pool = _pools[alias] = ConnectionPool(
+                min_size=options['MIN_SIZE'],
+                max_size=options['MAX_SIZE'],
+                timeout=options['TIMEOUT'],
+                max_idle=options['MAX_IDLE'],
+                max_lifetime=options['MAX_LIFETIME'],
+                health_check_after=options['HEALTH_CHECK_AFTER'],
+            )
+    return pool
+
+
+def get_metrics():
+    """
+    In-use, idle and wait-time statistics for every pool in this process
+    """
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {alias: pool.stats() for alias, pool in pools if pool.pid == os.getpid()}
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        if pool.pid == os.getpid():
+            pool.close()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mixed in ahead of a backend's ``DatabaseWrapper`` to pool its connections
+    """
+
+    pool_reused = False
+
+    @property
+    def connection_pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        def connect():
+            return super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params)
+
+        connection, self.pool_reused = self.connection_pool.acquire(connect)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = self.connection_pool
+        if self.in_atomic_block or (self.errors_occurred and not self.is_usable()):
+            # Closed mid-transaction, Django keeps referring to the connection
+            # until the atomic block exits, so it can't go back to the pool.
+            pool.discard(self.connection)
+            return
+        try:
+            self.connection.rollback()
+        except Exception:
+            pool.discard(self.connection)
+        else:
+            pool.release(self.connection)
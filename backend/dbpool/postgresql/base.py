@@ -0,0 +1,19 @@
+"""
+``ENGINE = 'backend.dbpool.postgresql'``: Django's PostgreSQL backend with
+pooling that works with psycopg2 as well as psycopg 3. Leave
+``OPTIONS['pool']`` unset, that enables Django's own psycopg 3 pool instead.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgreSQLDatabaseWrapper
+
+from backend.dbpool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, PostgreSQLDatabaseWrapper):
+
+    def get_connection_params(self):
+        if self.settings_dict['OPTIONS'].get('pool'):
+            raise ImproperlyConfigured(
+                "backend.dbpool.postgresql does its own pooling; remove OPTIONS['pool']."
+            )
+        return super().get_connection_params()
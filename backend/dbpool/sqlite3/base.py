@@ -0,0 +1,10 @@
+"""
+``ENGINE = 'backend.dbpool.sqlite3'``: Django's SQLite backend with pooling
+"""
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+
+from backend.dbpool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, SQLiteDatabaseWrapper):
+    pass
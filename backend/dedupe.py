@@ -0,0 +1,126 @@
+"""
+Duplicate contact submission filter.
+
+Submissions are fingerprinted from their normalized (name, email, message)
+and recorded in a rotating Bloom filter kept in the cache, so every worker
+sees the same filter and memory stays fixed however many submissions
+arrive. A filter generation lasts ``CONTACT_DEDUPE_WINDOW`` seconds and the
+previous generation is checked too, so a repeat is caught for at least one
+window after the original.
+
+The filter is split into blocks and all bits for a fingerprint fall in one
+block, so a check reads two small cache values and writes one. Concurrent
+writes to the same block can lose bits; that only lets an occasional
+duplicate through, never blocks a new message.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(name, email, message):
+    """
+    A 16 byte digest of the submission, ignoring case and whitespace differences
+    """
+    normalized = '\0'.join(' '.join(part.split()).casefold() for part in (name, email, message))
+    return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+
+class RotatingBloomFilter:
+
+    def __init__(self, name, window, block_bits=4096, blocks=16, hashes=7, cache_alias='default'):
+        self.name = name
+        self.window = window
+        self.block_bits = block_bits
+        self.blocks = blocks
+        self.hashes = hashes
+        self.cache = caches[cache_alias]
+
+    def _locate(self, digest):
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        block = h1 % self.blocks
+        # Double hashing (Kirsch-Mitzenmacher) for the k bit positions
+        positions = [(h1 + i * h2) % self.block_bits for i in range(1, self.hashes + 1)]
+        return block, positions
+
+    @staticmethod
+    def _contains(bits, positions):
+        return bits is not None and all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def _keys(self, digest, now):
+        now = time.time() if now is None else now
+        generation = int(now // self.window)
+        block, positions = self._locate(digest)
+        current = f'bloom:{self.name}:{generation}:{block}'
+        previous = f'bloom:{self.name}:{generation - 1}:{block}'
+        return current, previous, positions
+
+    def contains(self, digest, now=None):
+        """
+        Whether ``digest`` was added in this or the previous window
+        """
+        current, previous, positions = self._keys(digest, now)
+        found = self.cache.get_many([current, previous])
+        return any(self._contains(found.get(key), positions) for key in (current, previous))
+
+    def add(self, digest, now=None):
+        current, _, positions = self._keys(digest, now)
+        bits = bytearray(self.cache.get(current) or bytes(self.block_bits // 8))
+        for p in positions:
+            bits[p >> 3] |= 1 << (p & 7)
+        self.cache.set(current, bytes(bits), timeout=self.window * 2 + 1)
+
+    def check_and_add(self, digest, now=None):
+        """
+        Record ``digest`` and return whether it was already present
+        """
+        if self.contains(digest, now):
+            return True
+        self.add(digest, now)
+        return False
+
+
+def get_filter():
+    return RotatingBloomFilter(
+        'contact',
+        window=getattr(settings, 'CONTACT_DEDUPE_WINDOW', 600),
+        block_bits=getattr(settings, 'CONTACT_DEDUPE_BLOCK_BITS', 4096),
+        blocks=getattr(settings, 'CONTACT_DEDUPE_BLOCKS', 16),
+        hashes=getattr(settings, 'CONTACT_DEDUPE_HASHES', 7),
+        cache_alias=getattr(settings, 'CONTACT_DEDUPE_CACHE_ALIAS', 'default'),
+    )
+
+
+def is_duplicate(name, email, message):
+    """
+    Whether the same submission was accepted recently. Only ``remember``
+    records one, so a submission that failed to store can be retried.
+    """
+    if not getattr(settings, 'CONTACT_DEDUPE_WINDOW', 600):
+        return False
+    try:
+        duplicate = get_filter().contains(fingerprint(name, email, message))
+    except Exception:
+        logger.exception('Duplicate check failed')
+        return False
+    if duplicate:
+        logger.info('Ignoring duplicate contact submission from %s', email)
+    return duplicate
+
+
+def remember(name, email, message):
+    """
+    Record an accepted submission so repeats of it are dropped
+    """
+    if not getattr(settings, 'CONTACT_DEDUPE_WINDOW', 600):
+        return
+    try:
+        get_filter().add(fingerprint(name, email, message))
+    except Exception:
+        logger.exception('Could not record contact submission fingerprint')
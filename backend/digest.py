@@ -0,0 +1,104 @@
+"""
+Digest mode for contact form notifications.
+
+With ``CONTACT_DIGEST_ENABLED`` submissions are held in the outbox and the
+``deliver_outbox`` worker folds them into one summary email every
+``CONTACT_DIGEST_INTERVAL`` minutes, or sooner once
+``CONTACT_DIGEST_MAX_MESSAGES`` are waiting. Messages containing one of
+``CONTACT_DIGEST_URGENT_KEYWORDS`` skip the digest and go out immediately.
+
+Once digest mode is switched off the worker releases anything still held,
+and those messages go out one by one like any other.
+"""
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxMessage
+from .outbox import enqueue
+
+
+def digest_enabled():
+    return getattr(settings, 'CONTACT_DIGEST_ENABLED', False)
+
+
+def is_urgent(message):
+    keywords = getattr(settings, 'CONTACT_DIGEST_URGENT_KEYWORDS', [])
+    return any(re.search(rf'\b{re.escape(keyword)}\b', message, re.IGNORECASE) for keyword in keywords)
+
+
+def should_hold(message):
+    """
+    Whether a contact message should wait for the next digest
+    """
+    return digest_enabled() and not is_urgent(message)
+
+
+def digest_due(now=None):
+    """
+    Whether enough held messages, or old enough ones, are waiting to send a digest
+    """
+    now = now or timezone.now()
+    held = OutboxMessage.objects.filter(status=OutboxMessage.HELD)
+    max_messages = getattr(settings, 'CONTACT_DIGEST_MAX_MESSAGES', 25)
+    interval = timedelta(minutes=getattr(settings, 'CONTACT_DIGEST_INTERVAL', 15))
+    if held.filter(created_at__lte=now - interval).exists():
+        return True
+    return held[:max_messages].count() >= max_messages
+
+
+def release_held():
+    """
+    Queue held messages for delivery on their own; returns how many
+    """
+    return OutboxMessage.objects.filter(status=OutboxMessage.HELD).update(status=OutboxMessage.PENDING)
+
+
+def build_digest(messages):
+    count = len(messages)
+    subject = f'Contact form digest: {count} new message{"s" if count != 1 else ""}'
+    separator = '\n\n' + '-' * 40 + '\n\n'
+    body = separator.join(
+        f'Received {message.created_at:%Y-%m-%d %H:%M} UTC\n\n{message.body}' for message in messages
+    )
+    return subject, body
+
+
+def flush_digest(force=False):
+    """
+    Fold held messages into one digest email queued in the outbox.
+
+    Returns the queued ``OutboxMessage``, or None if no digest was due.
+    """
+    if not force and not digest_due():
+        return None
+
+    now = timezone.now()
+    max_messages = getattr(settings, 'CONTACT_DIGEST_MAX_MESSAGES', 25)
+    with transaction.atomic():
+        return _flush(now, max_messages)
+
+
+def _flush(now, max_messages):
+    candidates = list(
+        OutboxMessage.objects.filter(status=OutboxMessage.HELD)
+        .order_by('created_at', 'id')
+        .values_list('pk', flat=True)[:max_messages]
+    )
+    # Claim the rows so a second worker flushing at the same time skips them
+    OutboxMessage.objects.filter(pk__in=candidates, status=OutboxMessage.HELD).update(
+        status=OutboxMessage.DIGESTED, locked_at=now
+    )
+    messages = list(
+        OutboxMessage.objects.filter(pk__in=candidates, status=OutboxMessage.DIGESTED, locked_at=now)
+        .order_by('created_at', 'id')
+    )
+    if not messages:
+        return None
+
+    subject, body = build_digest(messages)
+    to = messages[0].recipients()
+    return enqueue(subject, body, to)
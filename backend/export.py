@@ -0,0 +1,116 @@
+"""
+Streaming export of contact submissions as CSV or NDJSON.
+
+Rows are read with ``QuerySet.iterator(chunk_size=...)`` (a server-side
+cursor on Postgres) and encoded one chunk at a time, optionally through a
+streaming gzip compressor, so memory use doesn't depend on table size.
+"""
+import csv
+import io
+import json
+import zlib
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import ContactSubmission
+
+EXPORT_FIELDS = ['id', 'name', 'email', 'message', 'status', 'created_at']
+CHUNK_SIZE = 2000
+# Spreadsheets run cells starting with these as formulas (CSV injection)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def parse_bound(value, end=False):
+    """
+    Parse a ``since``/``until`` bound given as a date or an ISO datetime
+    """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value!r}')
+        # A bare date as an upper bound includes the whole day
+        parsed = parse_datetime(f'{day.isoformat()}T23:59:59.999999' if end else f'{day.isoformat()}T00:00:00')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_queryset(since=None, until=None, status=None):
+    """
+    Submissions to export, filtered on the indexed created_at/status columns
+    """
+    queryset = ContactSubmission.objects.order_by('created_at', 'id')
+    if since:
+        queryset = queryset.filter(created_at__gte=since)
+    if until:
+        queryset = queryset.filter(created_at__lte=until)
+    if status:
+        queryset = queryset.filter(status=status)
+    return queryset.values_list(*EXPORT_FIELDS)
+
+
+def _csv_cell(value):
+    """
+    A cell value a spreadsheet shows as text rather than evaluating
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_csv_cell(value) for value in row[:-1]] + [row[-1].isoformat()])
+        if count % CHUNK_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _ndjson_chunks(rows):
+    lines = []
+    for row in rows:
+        record = dict(zip(EXPORT_FIELDS, row))
+        record['created_at'] = record['created_at'].isoformat()
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) == CHUNK_SIZE:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def gzip_stream(chunks, level=6):
+    """
+    Compress an iterable of byte chunks into a gzip stream, chunk by chunk
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_export(queryset, fmt='csv', compress=False):
+    """
+    Yield the encoded export of ``queryset`` (from ``export_queryset``) as bytes
+    """
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f'Unknown export format: {fmt!r}')
+    rows = queryset.iterator(chunk_size=CHUNK_SIZE)
+    chunks = _csv_chunks(rows) if fmt == 'csv' else _ndjson_chunks(rows)
+    return gzip_stream(chunks) if compress else chunks
@@ -0,0 +1,10 @@
+from django import forms
+
+
+class ContactForm(forms.Form):
+    """
+    Validates the fields posted by the contact form
+    """
+    name = forms.CharField(max_length=200)
+    email = forms.EmailField()
+    message = forms.CharField(max_length=5000)
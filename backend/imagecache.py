@@ -0,0 +1,223 @@
+"""
+Resized image variants rendered on demand for ``/img/<width>/<format>/<path>``.
+
+Variants are rendered with Pillow on a small thread pool and kept in a
+size-capped directory (IMAGE_CACHE_DIR, at most IMAGE_CACHE_MAX_BYTES). A
+hit bumps the file's mtime, and when the directory outgrows its cap the
+least recently used files are deleted until it is back under 90%.
+
+Identical requests arriving together share one render: within a process
+they wait on the same future, and across workers an ``flock`` on the
+variant's lock file makes the second worker find the first one's output.
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.urls import reverse
+from django.utils._os import safe_join
+
+from .images import FORMATS, available_formats, content_hash, render_variant
+
+logger = logging.getLogger(__name__)
+
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+CONTENT_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+class Overloaded(Exception):
+    """
+    Raised when too many renders are already queued
+    """
+
+
+def allowed_widths():
+    return set(getattr(settings, 'IMAGE_RESIZE_WIDTHS', ()))
+
+
+def allowed_formats():
+    return set(available_formats(getattr(settings, 'IMAGE_RESIZE_FORMATS', ['webp', 'jpeg'])))
+
+
+# path -> (size, mtime, digest): one entry per source image, however often it changes
+_source_hashes = {}
+
+
+def source_hash(path):
+    """
+    Content hash of a source image, memoised on its size and mtime
+    """
+    stat = os.stat(path)
+    size, mtime, digest = _source_hashes.get(path, (None, None, None))
+    if (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+        digest = content_hash(path, digest_size=8)
+        _source_hashes[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def find_source(path):
+    """
+    Locate a source image among the static files, or return None
+    """
+    if not path.lower().endswith(SOURCE_EXTENSIONS) or '..' in path.split('/'):
+        return None
+    try:
+        found = finders.find(path)
+        if not found and settings.STATIC_ROOT:
+            candidate = safe_join(settings.STATIC_ROOT, path)
+            found = candidate if os.path.isfile(candidate) else None
+    except SuspiciousFileOperation:
+        return None
+    return found
+
+
+def resized_image_url(path, width, format_name):
+    """
+    URL of a variant, versioned by the source's content so it can be cached forever
+    """
+    url = reverse('resized_image', args=[width, format_name, path])
+    source = find_source(path)
+    return f'{url}?v={source_hash(source)}' if source else url
+
+
+class DiskCache:
+    """
+    Directory of files evicted least recently used first once it grows past ``max_bytes``
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, name, data):
+        path = self.path(name)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self.lock:
+            self.size += len(data)
+            over = self.size > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def evict(self):
+        # Rescan rather than trust this process's count: other workers
+        # write to and evict from the same directory.
+        with self.lock:
+            entries = []
+            stale_locks = time.time() - 3600
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(tuple(f'.{name}' for name in FORMATS)):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.endswith(('.lock', '.tmp')) and stat.st_mtime < stale_locks:
+                    self._remove(entry.path)
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                self._remove(path)
+                total -= size
+            self.size = total
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class VariantRenderer:
+    """
+    Bounded pool that renders variants into a ``DiskCache``, coalescing duplicates
+    """
+
+    def __init__(self, cache, workers=2, max_queue=16, quality=None):
+        self.cache = cache
+        self.max_queue = max_queue
+        self.quality = quality or {}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='imgresize')
+        self.lock = threading.Lock()
+        self.inflight = {}
+
+    def get(self, source, width, format_name, timeout=10):
+        """
+        Return ``(path, etag)`` of the variant, rendering it if needed
+        """
+        digest = source_hash(source)
+        name = f'{digest}-{width}.{format_name}'
+        etag = f'"{digest}-{width}-{format_name}"'
+        path = self.cache.get(name)
+        if path:
+            return path, etag
+        with self.lock:
+            future = self.inflight.get(name)
+            if future is None:
+                if len(self.inflight) >= self.max_queue:
+                    raise Overloaded(f'{len(self.inflight)} image renders already queued')
+                future = self.inflight[name] = self.pool.submit(self._render, source, width, format_name, name)
+                future.add_done_callback(lambda _: self._done(name))
+        return future.result(timeout=timeout), etag
+
+    def _done(self, name):
+        with self.lock:
+            self.inflight.pop(name, None)
+
+    def _render(self, source, width, format_name, name):
+        with open(self.cache.path(name + '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                path = self.cache.get(name)
+                if path:
+                    # Another worker rendered it while we waited for the lock
+                    return path
+                data = render_variant(source, width, format_name, self.quality.get(format_name))
+                return self.cache.put(name, data)
+            finally:
+                # Left in place: unlinking a lock file another worker is
+                # blocked on would let a third one lock a fresh file.
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = VariantRenderer(
+                DiskCache(settings.IMAGE_CACHE_DIR, getattr(settings, 'IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+                workers=getattr(settings, 'IMAGE_RESIZE_WORKERS', 2),
+                max_queue=getattr(settings, 'IMAGE_RESIZE_MAX_QUEUE', 16),
+                quality=getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', {}),
+            )
+    return _renderer
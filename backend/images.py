@@ -0,0 +1,373 @@
+"""
+Responsive image derivatives.
+
+``build_derivatives`` resizes every JPEG/PNG under IMAGE_SOURCE_DIRS to each
+width in IMAGE_DERIVATIVE_WIDTHS, in each of IMAGE_DERIVATIVE_FORMATS, and
+writes them to IMAGE_DERIVATIVE_ROOT as ``<name>_<suffix>.<ext>``, the naming
+``static/responsive-images.js`` asks for (``IMG_9169_mobile.webp``,
+``IMG_9169_desktop.jpg``...). EXIF data is dropped after applying its
+orientation, and JPEGs are written progressive.
+
+``manifest.json`` in the output root records, per source, its content hash
+and the derivatives written for it; sources whose hash and settings are
+unchanged are skipped on the next run.
+
+``build_index`` then writes IMAGE_INDEX_PATH: for every image among the
+static files, its dimensions, dominant colour, a tiny base64 placeholder
+and its derivatives, keyed by static path. ``image_index`` loads it once
+per process for the ``{% picture %}`` tag.
+"""
+import base64
+import functools
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+try:
+    import pillow_avif  # noqa: F401  registers the AVIF plugin on older Pillow
+except ImportError:
+    pillow_avif = None
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+INDEX_VERSION = 1
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+INDEX_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+FORMATS = {
+    # name: (Pillow format, extension, save options)
+    'avif': ('AVIF', '.avif', {'speed': 6}),
+    'webp': ('WEBP', '.webp', {'method': 5}),
+    'jpeg': ('JPEG', '.jpg', {'progressive': True, 'optimize': True}),
+}
+
+
+def available_formats(formats):
+    """
+    Drop formats this Pillow build can't write (AVIF needs libavif)
+    """
+    Image.init()
+    return [name for name in formats if FORMATS[name][0] in Image.SAVE]
+
+
+def derivative_settings():
+    return {
+        'widths': dict(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', {})),
+        'formats': available_formats(getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', ['webp', 'jpeg'])),
+        'quality': dict(getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', {})),
+        'min_width': getattr(settings, 'IMAGE_DERIVATIVE_MIN_WIDTH', 400),
+    }
+
+
+def content_hash(path, digest_size=16):
+    digest = hashlib.blake2b(digest_size=digest_size)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_sources(source_dirs):
+    """
+    Yield ``(path, name)`` pairs, ``name`` relative to its source directory
+    """
+    for source_dir in source_dirs:
+        for dirpath, _, filenames in os.walk(source_dir):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(SOURCE_EXTENSIONS):
+                    path = os.path.join(dirpath, filename)
+                    yield path, os.path.relpath(path, source_dir).replace(os.sep, '/')
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _convert(image, format_name):
+    """
+    RGB(A) for the encoder: alpha is kept for WebP/AVIF, flattened onto white for JPEG
+    """
+    if not _has_alpha(image):
+        return image if image.mode == 'RGB' else image.convert('RGB')
+    image = image.convert('RGBA')
+    if format_name != 'jpeg':
+        return image
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def render_derivatives(path, name, output_root, config, source_hash):
+    """
+    Write every derivative of one source image; runs in a worker process
+    """
+    try:
+        with Image.open(path) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+            icc_profile = original.info.get('icc_profile')
+    except (UnidentifiedImageError, OSError) as exc:
+        # Recorded so an unchanged broken file isn't retried on every run
+        return name, {'hash': source_hash, 'error': str(exc), 'derivatives': []}
+    width, height = image.size
+    entry = {'hash': source_hash, 'width': width, 'height': height, 'derivatives': []}
+    if width < config['min_width']:
+        return name, entry
+
+    stem = os.path.splitext(name)[0]
+    os.makedirs(os.path.join(output_root, os.path.dirname(stem)), exist_ok=True)
+    for suffix, target_width in sorted(config['widths'].items(), key=lambda item: item[1]):
+        # Never upscale: narrow originals are written at their own size
+        target_width = min(target_width, width)
+        target_height = round(height * target_width / width)
+        resized = image if target_width == width else image.resize(
+            (target_width, target_height), Image.Resampling.LANCZOS, reducing_gap=3.0,
+        )
+        for format_name in config['formats']:
+            pillow_format, extension, options = FORMATS[format_name]
+            out = _convert(resized, format_name)
+            relative = f'{stem}_{suffix}{extension}'
+            destination = os.path.join(output_root, relative)
+            out.save(
+                destination + '.tmp', pillow_format,
+                quality=config['quality'].get(format_name, 80),
+                icc_profile=icc_profile,
+                **options,
+            )
+            os.replace(destination + '.tmp', destination)
+            entry['derivatives'].append({
+                'name': relative,
+                'format': format_name,
+                'width': target_width,
+                'height': target_height,
+                'bytes': os.path.getsize(destination),
+            })
+    return name, entry
+
+
+def render_variant(path, width, format_name, quality=None):
+    """
+    Resize one image to ``width`` (never upscaling) and return the encoded bytes
+    """
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+        icc_profile = original.info.get('icc_profile')
+    if width < image.width:
+        height = round(image.height * width / image.width)
+        image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    pillow_format, _, options = FORMATS[format_name]
+    if quality is None:
+        quality = getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', {}).get(format_name, 80)
+    out = io.BytesIO()
+    _convert(image, format_name).save(out, pillow_format, quality=quality, icc_profile=icc_profile, **options)
+    return out.getvalue()
+
+
+def load_manifest(output_root):
+    try:
+        with open(os.path.join(output_root, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'version': MANIFEST_VERSION, 'images': {}}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'images': {}}
+    return manifest
+
+
+def _write_manifest(output_root, manifest):
+    path = os.path.join(output_root, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _remove(output_root, entry):
+    for derivative in entry.get('derivatives', []):
+        try:
+            os.remove(os.path.join(output_root, derivative['name']))
+        except FileNotFoundError:
+            pass
+
+
+def build_derivatives(source_dirs=None, output_root=None, workers=None, force=False):
+    """
+    Bring IMAGE_DERIVATIVE_ROOT up to date.
+
+    Returns lists of source names: ``(built, skipped, removed, failed)``.
+    """
+    source_dirs = source_dirs or getattr(settings, 'IMAGE_SOURCE_DIRS', [])
+    output_root = output_root or settings.IMAGE_DERIVATIVE_ROOT
+    config = derivative_settings()
+    signature = hashlib.blake2b(json.dumps(config, sort_keys=True).encode(), digest_size=8).hexdigest()
+    os.makedirs(output_root, exist_ok=True)
+    manifest = load_manifest(output_root)
+    previous = manifest['images']
+
+    pending, skipped, seen = [], [], set()
+    for path, name in find_sources(source_dirs):
+        seen.add(name)
+        source_hash = content_hash(path)
+        entry = previous.get(name)
+        up_to_date = (
+            entry and entry['hash'] == source_hash and entry.get('config') == signature
+            and all(os.path.exists(os.path.join(output_root, d['name'])) for d in entry['derivatives'])
+        )
+        if up_to_date and not force:
+            skipped.append(name)
+        else:
+            pending.append((path, name, output_root, config, source_hash))
+
+    images = {name: previous[name] for name in skipped}
+    if workers == 1 or len(pending) < 2:
+        results = [render_derivatives(*job) for job in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(render_derivatives, *zip(*pending)))
+    for name, entry in results:
+        entry['config'] = signature
+        images[name] = entry
+
+    removed = sorted(set(previous) - seen)
+    for name in removed:
+        _remove(output_root, previous[name])
+    manifest['images'] = images
+    _write_manifest(output_root, manifest)
+    built = [name for name, entry in results if 'error' not in entry]
+    failed = [(name, entry['error']) for name, entry in results if 'error' in entry]
+    return built, skipped, removed, failed
+
+
+def index_path():
+    return getattr(settings, 'IMAGE_INDEX_PATH', None) or os.path.join(settings.IMAGE_DERIVATIVE_ROOT, 'index.json')
+
+
+def static_name(path):
+    """
+    Name a file under STATICFILES_DIRS is served as, or None
+    """
+    path = os.path.abspath(path)
+    for entry in settings.STATICFILES_DIRS:
+        prefix, root = entry if isinstance(entry, (list, tuple)) else ('', entry)
+        root = os.path.abspath(root)
+        if path.startswith(root + os.sep):
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            return f'{prefix}/{name}' if prefix else name
+    return None
+
+
+def find_static_images(exclude=()):
+    """
+    Yield ``(name, path)`` for every image among the static files, first finder wins
+    """
+    exclude = tuple(os.path.abspath(directory) + os.sep for directory in exclude)
+    seen = set()
+    for finder in finders.get_finders():
+        for relative, storage in finder.list(['CVS', '.*', '*~']):
+            prefix = getattr(storage, 'prefix', None)
+            name = relative.replace(os.sep, '/')
+            name = f'{prefix}/{name}' if prefix else name
+            if name in seen or not name.lower().endswith(INDEX_EXTENSIONS):
+                continue
+            seen.add(name)
+            path = os.path.abspath(storage.path(relative))
+            if not (exclude and path.startswith(exclude)):
+                yield name, path
+
+
+def image_metadata(path, placeholder_width=16):
+    """
+    Dimensions, dominant colour and a ``data:`` URI placeholder for one image
+    """
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    width, height = image.size
+    flat = _convert(image, 'jpeg')
+
+    sample = flat.copy()
+    sample.thumbnail((64, 64))
+    palette = sample.quantize(colors=5, method=Image.Quantize.MEDIANCUT)
+    _, index = max(palette.getcolors())
+    red, green, blue = palette.getpalette()[index * 3:index * 3 + 3]
+
+    placeholder = _convert(image, 'webp')
+    placeholder.thumbnail((placeholder_width, placeholder_width * 4), Image.Resampling.BOX)
+    out = io.BytesIO()
+    placeholder.save(out, 'WEBP', quality=40)
+    return {
+        'width': width,
+        'height': height,
+        'color': f'#{red:02x}{green:02x}{blue:02x}',
+        'alpha': _has_alpha(image),
+        'lqip': 'data:image/webp;base64,' + base64.b64encode(out.getvalue()).decode('ascii'),
+    }
+
+
+def build_index(output_root=None, source_dirs=None, force=False):
+    """
+    Write IMAGE_INDEX_PATH from the static images and the derivative manifest.
+
+    Entries whose content hash is unchanged are carried over. Returns
+    ``(indexed, failed)``; ``failed`` pairs names with the error.
+    """
+    output_root = output_root or settings.IMAGE_DERIVATIVE_ROOT
+    source_dirs = source_dirs or getattr(settings, 'IMAGE_SOURCE_DIRS', [])
+    placeholder_width = getattr(settings, 'IMAGE_PLACEHOLDER_WIDTH', 16)
+    derivatives = {}
+    output_name = static_name(os.path.join(output_root, 'x'))
+    if output_name:
+        # Derivatives are only linked when they are themselves static files
+        output_prefix = output_name[:-1]
+        manifest = load_manifest(output_root)['images']
+        for source_dir in source_dirs:
+            for name, entry in manifest.items():
+                derivatives[os.path.abspath(os.path.join(source_dir, name))] = [
+                    {'name': output_prefix + d['name'], 'format': d['format'], 'width': d['width']}
+                    for d in entry.get('derivatives', [])
+                ]
+
+    path = index_path()
+    previous = load_index(path)
+    images, failed = {}, []
+    for name, source in find_static_images(exclude=[output_root]):
+        # The same digest imagecache uses for ?v=, so on-demand URLs built from it match
+        digest = content_hash(source, digest_size=8)
+        entry = previous.get(name)
+        if force or not entry or entry['hash'] != digest:
+            try:
+                entry = dict(image_metadata(source, placeholder_width), hash=digest)
+            except (UnidentifiedImageError, OSError) as exc:
+                failed.append((name, str(exc)))
+                continue
+        entry['derivatives'] = derivatives.get(source, [])
+        images[name] = entry
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'images': images}, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    return sorted(images), failed
+
+
+def load_index(path=None):
+    try:
+        with open(path or index_path()) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return index.get('images', {}) if index.get('version') == INDEX_VERSION else {}
+
+
+@functools.lru_cache(maxsize=None)
+def image_index():
+    """
+    The image index, read once per process; rebuilt indexes reach workers on restart
+    """
+    return load_index()
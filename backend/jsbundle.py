@@ -0,0 +1,347 @@
+"""
+Script bundles for the legacy pages.
+
+``build_bundles`` concatenates the files of each JS_BUNDLES entry in order,
+minifies them and writes ``<name>.<hash>.js`` plus a version 3 source map
+to JS_BUNDLE_ROOT, with ``manifest.json`` mapping bundle names to them.
+``{% js_bundle %}`` (``asset_bundles``) links the bundle when
+JS_BUNDLE_ENABLED and the separate files otherwise.
+
+Minifying is deliberately line-preserving: comments, indentation, blank
+lines and the whitespace around punctuation go, but every remaining line
+stays a line of its own. That keeps automatic semicolon insertion behaving
+exactly as in the source, and makes the source map a single segment per
+line. Strings, template literals and regular expressions are copied as is.
+"""
+import functools
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+from .images import static_name
+
+MANIFEST_NAME = 'manifest.json'
+
+# After these a `/` starts a regular expression, not a division
+_REGEX_AFTER_CHARS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_AFTER_WORDS = {
+    'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void', 'throw',
+    'instanceof', 'yield', 'await',
+}
+_IDENTIFIER = re.compile(r'[\w$\\]|[^\x00-\x7f]')
+_LAST_WORD = re.compile(r'[\w$]+$')
+# A file starting with one of these would continue the previous file's last statement
+_CONTINUATION = ('(', '[', '`', '+', '-', '/')
+_BASE64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+
+# Minifying
+
+class _Line:
+
+    def __init__(self, number, in_literal):
+        self.number = number
+        self.in_literal = in_literal
+        self.pieces = []
+
+    def add(self, text, literal=False):
+        if self.pieces and self.pieces[-1][0] == literal:
+            self.pieces[-1] = (literal, self.pieces[-1][1] + text)
+        else:
+            self.pieces.append((literal, text))
+
+    def text(self):
+        pieces = [
+            (literal, text if literal else re.sub(r'\s+', ' ', text)) for literal, text in self.pieces
+        ]
+        if pieces and not pieces[0][0]:
+            pieces[0] = (False, pieces[0][1].lstrip())
+        if pieces and not pieces[-1][0]:
+            pieces[-1] = (False, pieces[-1][1].rstrip())
+        out = ''
+        for index, (literal, text) in enumerate(pieces):
+            if literal:
+                out += text
+                continue
+            following = next((t for _, t in pieces[index + 1:] if t), '')
+            for position, char in enumerate(text):
+                if char == ' ':
+                    before = out[-1:]
+                    after = text[position + 1:position + 2] or following[:1]
+                    if not _space_needed(before, after):
+                        continue
+                out += char
+        return out
+
+
+def _space_needed(before, after):
+    if not before or not after:
+        return False
+    if _IDENTIFIER.match(before) and _IDENTIFIER.match(after):
+        return True
+    # a + +b, a - -b, and anything next to a possible regular expression
+    if before in '+-' and after in '+-':
+        return True
+    return '/' in (before, after) or (before == '.' and after.isdigit()) or (before.isdigit() and after == '.')
+
+
+def _previous_code(lines, current):
+    for line in [current] + lines[::-1]:
+        for literal, text in reversed(line.pieces):
+            stripped = text.rstrip()
+            if stripped:
+                return (')' if literal else stripped[-1]), ('' if literal else stripped)
+    return None, ''
+
+
+def _starts_regex(lines, current):
+    char, text = _previous_code(lines, current)
+    if char is None or char in _REGEX_AFTER_CHARS:
+        return True
+    word = _LAST_WORD.search(text)
+    return bool(word) and word.group(0) in _REGEX_AFTER_WORDS
+
+
+def minify_lines(source):
+    """
+    ``[(source line number, minified text)]`` for a script, blank lines omitted
+    """
+    lines, line = [], _Line(0, False)
+    # Brace depth of each `${` we are inside; the top one ends at its own `}`
+    substitutions = []
+    i, n = 0, len(source)
+
+    def newline(in_literal):
+        nonlocal line
+        lines.append(line)
+        line = _Line(line.number + 1, in_literal)
+
+    def literal_until(end_chars, i, template=False):
+        # Copy a string or template literal; return the index after it
+        while i < n:
+            char = source[i]
+            if char == '\\':
+                line.add(source[i:i + 2], True)
+                if source[i + 1:i + 2] == '\n':
+                    newline(True)
+                i += 2
+                continue
+            if template and source.startswith('${', i):
+                line.add('${', True)
+                return i + 2, True
+            if char == '\n':
+                line.add('', True)
+                newline(True)
+                i += 1
+                continue
+            line.add(char, True)
+            i += 1
+            if char in end_chars:
+                return i, False
+        return i, False
+
+    while i < n:
+        char = source[i]
+        if char == '\n':
+            newline(False)
+            i += 1
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end == -1 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            for _ in range(source.count('\n', i, end)):
+                newline(False)
+            line.add(' ')
+            i = end
+        elif char in '\'"':
+            line.add(char, True)
+            i, _ = literal_until(char, i + 1)
+        elif char == '`' or (char == '}' and substitutions and substitutions[-1] == 0):
+            if char == '}':
+                substitutions.pop()
+            line.add(char, True)
+            i, substituted = literal_until('`', i + 1, template=True)
+            if substituted:
+                substitutions.append(0)
+        elif char == '/' and _starts_regex(lines, line):
+            in_class, j = False, i + 1
+            while j < n and source[j] != '\n':
+                if source[j] == '\\':
+                    j += 2
+                    continue
+                if source[j] == '[':
+                    in_class = True
+                elif source[j] == ']':
+                    in_class = False
+                elif source[j] == '/' and not in_class:
+                    break
+                j += 1
+            line.add(source[i:j + 1], True)
+            i = j + 1
+        else:
+            if substitutions and char in '{}':
+                substitutions[-1] += 1 if char == '{' else -1
+            line.add(char)
+            i += 1
+    lines.append(line)
+
+    out = []
+    for line in lines:
+        text = line.text()
+        if text:
+            out.append((line.number, text))
+    return out
+
+
+def minify(source):
+    return '\n'.join(text for _, text in minify_lines(source))
+
+
+# Source maps
+
+def _vlq(value):
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    encoded = ''
+    while True:
+        digit, value = value & 31, value >> 5
+        encoded += _BASE64[digit | (32 if value else 0)]
+        if not value:
+            return encoded
+
+
+def source_map_mappings(lines):
+    """
+    ``mappings`` for ``[(source index, source line, source column)]``, one per generated line
+    """
+    segments, previous = [], (0, 0, 0)
+    for position in lines:
+        segments.append('A' + ''.join(_vlq(now - before) for now, before in zip(position, previous)))
+        previous = position
+    return ';'.join(segments)
+
+
+# Build stage
+
+def bundle_settings():
+    return {
+        'bundles': dict(getattr(settings, 'JS_BUNDLES', {})),
+        'root': getattr(settings, 'JS_BUNDLE_ROOT', None) or os.path.join(settings.BASE_DIR, 'static', 'bundles'),
+    }
+
+
+def bundle(name, files, root):
+    """
+    Write one bundle and its source map to ``root``; return its report
+    """
+    output_lines, positions, sources, contents = [], [], [], []
+    bundle_static = static_name(os.path.join(root, name))
+    before = gzip_before = 0
+    for index, file_name in enumerate(files):
+        path = finders.find(file_name)
+        if not path:
+            raise FileNotFoundError(f'{file_name} is not a static file')
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        before += len(source.encode())
+        gzip_before += len(gzip.compress(source.encode(), compresslevel=9, mtime=0))
+        source_lines = source.split('\n')
+        minified = minify_lines(source)
+        if minified and output_lines and minified[0][1].startswith(_CONTINUATION):
+            minified[0] = (minified[0][0], ';' + minified[0][1])
+        for number, text in minified:
+            column = len(source_lines[number]) - len(source_lines[number].lstrip())
+            output_lines.append(text)
+            positions.append((index, number, column))
+        sources.append(
+            posixpath.relpath(file_name, posixpath.dirname(bundle_static)) if bundle_static else file_name
+        )
+        contents.append(source)
+
+    code = '\n'.join(output_lines) + '\n'
+    digest = hashlib.blake2b(code.encode(), digest_size=6).hexdigest()
+    output = f'{name}.{digest}.js'
+    source_map = {
+        'version': 3, 'file': output, 'sources': sources, 'sourcesContent': contents,
+        'names': [], 'mappings': source_map_mappings(positions),
+    }
+    code += f'//# sourceMappingURL={output}.map\n'
+    _write(os.path.join(root, output), code)
+    _write(os.path.join(root, output + '.map'), json.dumps(source_map, separators=(',', ':')))
+    return {
+        'name': name, 'files': len(files), 'output': output,
+        'before': before, 'after': len(code.encode()),
+        'gzip_before': gzip_before, 'gzip_after': len(gzip.compress(code.encode(), compresslevel=9, mtime=0)),
+    }
+
+
+def build_bundles():
+    """
+    Write every JS_BUNDLES entry; return one report dict per bundle
+    """
+    config = bundle_settings()
+    root = config['root']
+    os.makedirs(root, exist_ok=True)
+    previous = load_manifest(root)
+
+    manifest, reports = {}, []
+    for name, files in config['bundles'].items():
+        try:
+            report = bundle(name, files, root)
+        except (OSError, UnicodeDecodeError) as e:
+            reports.append({'name': name, 'error': str(e)})
+            continue
+        if previous.get(name) not in (None, report['output']):
+            _remove(os.path.join(root, previous[name]))
+            _remove(os.path.join(root, previous[name] + '.map'))
+        manifest[name] = report['output']
+        reports.append(report)
+
+    for name in set(previous) - set(manifest):
+        _remove(os.path.join(root, previous[name]))
+        _remove(os.path.join(root, previous[name] + '.map'))
+    _write(os.path.join(root, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True))
+    return reports
+
+
+def _write(path, text):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(path + '.tmp', path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def load_manifest(root=None):
+    root = root or bundle_settings()['root']
+    try:
+        with open(os.path.join(root, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@functools.lru_cache(maxsize=None)
+def js_bundles():
+    """
+    ``{bundle name: static name of the built bundle}``, read once per process
+    """
+    root = bundle_settings()['root']
+    name = static_name(os.path.join(root, 'x'))
+    if name is None:
+        # Not under STATICFILES_DIRS, so collectstatic never picks the files up
+        return {}
+    prefix = name[:-1]
+    return {bundle_name: prefix + output for bundle_name, output in load_manifest(root).items()}
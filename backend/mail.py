@@ -0,0 +1,241 @@
+"""
+Email backend that keeps a small pool of authenticated SMTP connections.
+
+Opening an SMTP connection costs a TCP connect, EHLO, STARTTLS and AUTH.
+``PooledEmailBackend`` pays that once per pooled connection and reuses it
+for later messages, health-checking connections that have been idle.
+"""
+import logging
+import smtplib
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(smtplib.SMTPException):
+    """
+    Raised when no pooled SMTP connection became free in time
+    """
+
+
+class SMTPConnectionPool:
+    """
+    A bounded pool of open ``smtp.EmailBackend`` instances
+    """
+
+    def __init__(self, connect, max_size=2, max_idle=60, health_check_after=10, timeout=10):
+        self.connect = connect
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'connections_opened': 0,
+            'connections_reused': 0,
+            'connections_discarded': 0,
+            'health_check_failures': 0,
+            'messages_sent': 0,
+            'send_failures': 0,
+            'send_seconds_total': 0.0,
+            'send_seconds_max': 0.0,
+        }
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f'No SMTP connection available after {self.timeout}s')
+                    self._cond.wait(remaining)
+                if self._idle:
+                    # Most recently used first, so spare connections age out
+                    backend, released_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    backend = None
+
+            if backend is None:
+                return self._open()
+            if self._is_usable(backend, time.monotonic() - released_at):
+                self._record(connections_reused=1)
+                return backend
+            self.discard(backend)
+
+    def release(self, backend):
+        with self._cond:
+            self._idle.append((backend, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, backend):
+        try:
+            backend.close()
+        except Exception:
+            logger.debug('Error closing pooled SMTP connection', exc_info=True)
+        with self._cond:
+            self._size -= 1
+            self._stats['connections_discarded'] += 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for backend, _ in idle:
+            self.discard(backend)
+
+    def record_send(self, seconds, ok):
+        with self._cond:
+            self._stats['messages_sent' if ok else 'send_failures'] += 1
+            self._stats['send_seconds_total'] += seconds
+            self._stats['send_seconds_max'] = max(self._stats['send_seconds_max'], seconds)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats, open=self._size, idle=len(self._idle))
+        attempts = stats['messages_sent'] + stats['send_failures']
+        checkouts = stats['connections_opened'] + stats['connections_reused']
+        stats['avg_send_ms'] = round(stats['send_seconds_total'] / attempts * 1000, 2) if attempts else None
+        stats['reuse_ratio'] = round(stats['connections_reused'] / checkouts, 3) if checkouts else None
+        return stats
+
+    def _open(self):
+        try:
+            backend = self.connect()
+            backend.open()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._record(connections_opened=1)
+        return backend
+
+    def _is_usable(self, backend, idle_for):
+        if backend.connection is None or idle_for > self.max_idle:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        try:
+            return backend.connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            self._record(health_check_failures=1)
+            return False
+
+    def _record(self, **counts):
+        with self._cond:
+            for key, value in counts.items():
+                self._stats[key] += value
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(**smtp_kwargs):
+    """
+    Return the pool for the given connection parameters, creating it if needed
+    """
+    probe = SMTPBackend(**smtp_kwargs)
+    key = (probe.host, probe.port, probe.username, probe.use_tls, probe.use_ssl)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SMTPConnectionPool(
+                lambda: SMTPBackend(fail_silently=False, **smtp_kwargs),
+                max_size=getattr(settings, 'EMAIL_POOL_SIZE', 2),
+                max_idle=getattr(settings, 'EMAIL_POOL_MAX_IDLE', 60),
+                health_check_after=getattr(settings, 'EMAIL_POOL_HEALTH_CHECK_AFTER', 10),
+                timeout=getattr(settings, 'EMAIL_POOL_TIMEOUT', 10),
+            )
+    return pool
+
+
+def get_metrics():
+    """
+    Connection reuse and latency statistics for every pool in this process
+    """
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {f'{host}:{port}': pool.stats() for (host, port, *_), pool in pools}
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class PooledEmailBackend(BaseEmailBackend):
+    """
+    Django email backend that sends over pooled SMTP connections.
+
+    ``open()`` checks a connection out of the pool and ``close()`` returns it,
+    so ``with get_connection() as connection:`` holds one connection for a
+    batch of sends. ``send_messages`` outside of that checks a connection out
+    for the duration of the batch.
+    """
+
+    def __init__(self, fail_silently=False, **kwargs):
+        super().__init__(fail_silently=fail_silently)
+        self.smtp_kwargs = kwargs
+        self.pool = get_pool(**kwargs)
+        self.connection = None
+
+    def open(self):
+        if self.connection is not None:
+            return False
+        try:
+            self.connection = self.pool.acquire()
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return None
+        return True
+
+    def close(self):
+        if self.connection is not None:
+            self.pool.release(self.connection)
+            self.connection = None
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        new_conn_created = self.open()
+        if self.connection is None:
+            return 0
+        sent = 0
+        try:
+            for message in email_messages:
+                started = time.perf_counter()
+                try:
+                    sent += self.connection.send_messages([message])
+                except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                    # The server rejected this message; the connection is still fine
+                    self.pool.record_send(time.perf_counter() - started, ok=False)
+                    raise
+                except Exception:
+                    # Anything else leaves the connection in an unknown state
+                    self.pool.record_send(time.perf_counter() - started, ok=False)
+                    self.pool.discard(self.connection)
+                    self.connection = None
+                    raise
+                self.pool.record_send(time.perf_counter() - started, ok=True)
+        except Exception:
+            if not self.fail_silently:
+                raise
+        finally:
+            if new_conn_created:
+                self.close()
+        return sent
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+from backend.models import ContactSubmission
+
+
+def _worker(seconds, results):
+    """
+    Write sessions and contact rows like a busy web worker would
+    """
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+    i = 0
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            session = SessionStore()
+            session['visits'] = i
+            session.create()
+            with transaction.atomic():
+                ContactSubmission.objects.create(name=f'Bench {os.getpid()}', email='bench@example.com',
+                                                 message=f'Message {i}')
+                ContactSubmission.objects.filter(email='bench@example.com').count()
+        except OperationalError:
+            errors += 1
+        else:
+            latencies.append(time.perf_counter() - started)
+        i += 1
+    connections.close_all()
+    results.put((latencies, errors))
+
+
+class Command(BaseCommand):
+    help = ('Benchmark concurrent SQLite writes from several worker processes, '
+            'with and without SQLITE_PRAGMAS, on a scratch database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            self.stderr.write('The default database is not SQLite')
+            return
+        pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+        self.stdout.write(f"{'mode':<10} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for label, mode_pragmas in (('default', {}), ('tuned', pragmas)):
+            self.stdout.write(self.run(label, mode_pragmas, options['workers'], options['seconds']))
+
+    def run(self, label, pragmas, workers, seconds):
+        connection = connections['default']
+        with tempfile.TemporaryDirectory() as tmp:
+            connection.close()
+            original_name = connection.settings_dict['NAME']
+            original_pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+            connection.settings_dict['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+            settings.SQLITE_PRAGMAS = pragmas
+            try:
+                call_command('migrate', verbosity=0)
+                connection.close()
+                # Forked workers each open their own connection, like gunicorn workers
+                context = multiprocessing.get_context('fork')
+                results = context.Queue()
+                processes = [context.Process(target=_worker, args=(seconds, results)) for _ in range(workers)]
+                for process in processes:
+                    process.start()
+                outcomes = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+            finally:
+                connection.close()
+                connection.settings_dict['NAME'] = original_name
+                settings.SQLITE_PRAGMAS = original_pragmas
+
+        latencies = sorted(l for worker_latencies, _ in outcomes for l in worker_latencies)
+        errors = sum(e for _, e in outcomes)
+        if not latencies:
+            return f'{label:<10} {"-":>8} {"-":>8} {"-":>8} {errors:>7}'
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+        return f'{label:<10} {len(latencies) / seconds:>8.0f} {p50:>8.2f} {p99:>8.2f} {errors:>7}'
@@ -0,0 +1,102 @@
+import time
+from datetime import timedelta
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from backend.admin import CURSOR_VAR
+from backend.models import ContactSubmission
+from backend.search import search_submissions
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Seed a large ContactSubmission table and compare OFFSET/COUNT(*) paging '
+            'with the keyset-paginated admin at deep offsets. Rolls back unless --keep.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--offsets', default='0,1000,100000,500000,990000',
+                            help='Comma separated row offsets to measure')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Rolled back seeded rows')
+
+    def run(self, options):
+        rows, page_size = options['rows'], options['page_size']
+        started = time.perf_counter()
+        self.seed(rows)
+        self.stdout.write(f'Seeded {rows} rows in {time.perf_counter() - started:.1f}s')
+
+        admin_user = get_user_model().objects.create_superuser('benchmark-admin', 'bench@example.com', None)
+        model_admin = admin.site._registry[ContactSubmission]
+        factory = RequestFactory()
+        queryset = ContactSubmission.objects.order_by('-pk')
+
+        self.stdout.write(f"{'offset':>10} {'OFFSET+COUNT ms':>16} {'keyset query ms':>16} {'admin page ms':>14}")
+        for offset in [int(o) for o in options['offsets'].split(',') if o]:
+            if offset >= rows:
+                continue
+            # The cursor for this page is the last id of the page before it
+            cursor = queryset.values_list('pk', flat=True)[offset - 1] if offset else None
+
+            def offset_page():
+                queryset.count()
+                return list(queryset[offset:offset + page_size])
+
+            def keyset_page():
+                qs = queryset.filter(pk__lt=cursor) if cursor else queryset
+                return list(qs[:page_size + 1])
+
+            def admin_page():
+                request = factory.get('/admin/backend/contactsubmission/',
+                                      {CURSOR_VAR: cursor} if cursor else {})
+                request.user = admin_user
+                return model_admin.changelist_view(request).render()
+
+            self.stdout.write(
+                f'{offset:>10} {self.time(offset_page, options["repeat"]):>16.2f} '
+                f'{self.time(keyset_page, options["repeat"]):>16.2f} '
+                f'{self.time(admin_page, options["repeat"]):>14.2f}'
+            )
+
+        for term in ('visitor42@example.com', 'benchmark message 12345'):
+            elapsed = self.time(lambda: search_submissions(term, 20), options['repeat'])
+            self.stdout.write(f'Full-text search {term!r}: {elapsed:.2f} ms')
+
+    def seed(self, rows, batch_size=10_000):
+        start = timezone.now() - timedelta(seconds=rows)
+        for first in range(0, rows, batch_size):
+            ContactSubmission.objects.bulk_create([
+                ContactSubmission(
+                    name=f'Visitor {i}',
+                    email=f'visitor{i % 5000}@example.com',
+                    message=f'Benchmark message {i}',
+                    created_at=start + timedelta(seconds=i),
+                )
+                for i in range(first, min(first + batch_size, rows))
+            ], batch_size=batch_size)
+
+    def time(self, func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
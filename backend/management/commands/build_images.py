@@ -0,0 +1,43 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backend.images import build_derivatives, build_index, derivative_settings, index_path
+
+
+class Command(BaseCommand):
+    help = ('Generate resized WebP/AVIF/progressive JPEG derivatives of the images in '
+            'IMAGE_SOURCE_DIRS, skipping images that have not changed, then index the '
+            'dimensions, colour and placeholder of every static image')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes (1 renders in this process)')
+        parser.add_argument('--force', action='store_true', help='Rebuild images even if unchanged')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        config = derivative_settings()
+        self.stdout.write(
+            f"Formats: {', '.join(config['formats'])}; widths: "
+            + ', '.join(f'{suffix}={width}' for suffix, width in config['widths'].items())
+        )
+        built, skipped, removed, failed = build_derivatives(workers=options['workers'], force=options['force'])
+        for name in built:
+            self.stdout.write(f'  built    {name}')
+        for name in removed:
+            self.stdout.write(f'  removed  {name}')
+        for name, error in failed:
+            self.stderr.write(f'  skipped  {name}: {error}')
+        self.stdout.write(
+            f'{len(built)} built, {len(skipped)} unchanged, {len(removed)} removed, {len(failed)} unreadable '
+            f'in {time.perf_counter() - started:.2f}s -> {settings.IMAGE_DERIVATIVE_ROOT}'
+        )
+
+        indexed, unreadable = build_index(force=options['force'])
+        for name, error in unreadable:
+            if not any(name.endswith('/' + failed_name) for failed_name, _ in failed):
+                self.stderr.write(f'  skipped  {name}: {error}')
+        self.stdout.write(f'{len(indexed)} images indexed -> {index_path()}')
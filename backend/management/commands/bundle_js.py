@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.jsbundle import build_bundles, bundle_settings
+
+
+class Command(BaseCommand):
+    help = ('Concatenate, minify and fingerprint each JS_BUNDLES entry into one script with a source map '
+            'for {% js_bundle %}')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        reports = build_bundles()
+        for report in reports:
+            if 'error' in report:
+                raise CommandError(f"{report['name']}: {report['error']}")
+            self.stdout.write(
+                f"  {report['name']:<12} {report['files']} files {report['before'] / 1024:>6.1f} KB -> "
+                f"{report['after'] / 1024:>5.1f} KB, gzip {report['gzip_before'] / 1024:.1f} KB -> "
+                f"{report['gzip_after'] / 1024:.1f} KB -> {report['output']}"
+            )
+        self.stdout.write(
+            f'{len(reports)} bundles in {time.perf_counter() - started:.2f}s -> {bundle_settings()["root"]}'
+        )
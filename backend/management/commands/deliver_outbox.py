@@ -0,0 +1,65 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from backend.digest import digest_enabled, flush_digest, release_held
+from backend.mail import close_pools, get_metrics
+from backend.outbox import deliver_due
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox emails, retrying failures with exponential backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no more messages are due instead of polling')
+        parser.add_argument('--interval', type=float,
+                            default=getattr(settings, 'OUTBOX_POLL_INTERVAL', 5),
+                            help='Seconds to wait between polls when the outbox is empty')
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'OUTBOX_BATCH_SIZE', 50))
+        parser.add_argument('--concurrency', type=int,
+                            default=getattr(settings, 'OUTBOX_CONCURRENCY', 2),
+                            help='Maximum number of SMTP connections used at once')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self._stop)
+
+        while self.running:
+            close_old_connections()
+            if digest_enabled():
+                while flush_digest():
+                    pass
+            elif release_held():
+                # Digest mode was switched off with messages still held
+                self.stdout.write('Released held message(s) from digest mode')
+            sent, failed = deliver_due(options['batch_size'], options['concurrency'])
+            if sent or failed:
+                self.stdout.write(f'Delivered {sent} message(s), {failed} failed')
+                if options['verbosity'] > 1:
+                    self._write_metrics()
+                continue
+            if options['once']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
+
+        self._write_metrics()
+        close_pools()
+
+    def _write_metrics(self):
+        for server, stats in get_metrics().items():
+            self.stdout.write(
+                f"SMTP {server}: {stats['connections_opened']} opened, "
+                f"{stats['connections_reused']} reused, {stats['messages_sent']} sent, "
+                f"avg {stats['avg_send_ms']} ms/message"
+            )
+
+    def _stop(self, signum, frame):
+        self.running = False
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.export import CONTENT_TYPES, export_queryset, parse_bound, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Stream contact submissions to a CSV or NDJSON file without loading them into memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(CONTENT_TYPES), default='csv')
+        parser.add_argument('--since', help='Date or ISO datetime (inclusive)')
+        parser.add_argument('--until', help='Date or ISO datetime (inclusive)')
+        parser.add_argument('--status')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('-o', '--output', help='File to write; defaults to stdout')
+
+    def handle(self, *args, **options):
+        try:
+            queryset = export_queryset(
+                since=parse_bound(options['since']),
+                until=parse_bound(options['until'], end=True),
+                status=options['status'],
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        chunks = stream_export(queryset, options['format'], options['gzip'])
+        if options['output']:
+            with open(options['output'], 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        else:
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
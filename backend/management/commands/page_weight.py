@@ -0,0 +1,70 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.pageweight import PageWeigher, baseline_path, compare, load_baseline, write_baseline
+from backend.warmup import warm_hosts
+
+
+def _kb(size):
+    return '-' if size is None else f'{size / 1024:.1f}'
+
+
+class Command(BaseCommand):
+    help = ('Render pages, resolve every asset they load and report raw, gzip and Brotli '
+            'sizes; fail if a page got heavier than the committed baseline allows')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Page to measure (repeatable); defaults to PAGE_WEIGHT_PATHS')
+        parser.add_argument('--host', help='Host header to render with; defaults to the first warmup host')
+        parser.add_argument('--baseline', help='Baseline JSON; defaults to PAGE_WEIGHT_BASELINE')
+        parser.add_argument('--update', action='store_true', help='Write the measurements as the new baseline')
+        parser.add_argument('--json', action='store_true', help='Print the measurements as JSON')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or getattr(settings, 'PAGE_WEIGHT_PATHS', ['/'])
+        weigher = PageWeigher(options['host'] or warm_hosts()[0])
+        results = [weigher.measure(path) for path in paths]
+        baseline_file = options['baseline'] or baseline_path()
+        baseline = load_baseline(baseline_file)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            for result in results:
+                self.report(result, baseline.get('pages', {}).get(result['path']))
+
+        if options['update']:
+            write_baseline(results, baseline_file)
+            self.stdout.write(f'Baseline written to {baseline_file}')
+            return
+        regressions = [message for result in results for message in compare(result, baseline)]
+        for message in regressions:
+            self.stderr.write(f'  regression  {message}')
+        if regressions:
+            raise CommandError(f'{len(regressions)} page-weight regression(s) against {baseline_file}')
+
+    def report(self, result, previous):
+        self.stdout.write(f"{result['path']}")
+        self.stdout.write(f"  {'kind':<11} {'raw KB':>8} {'gzip KB':>8} {'br KB':>8} {'change':>8}  url")
+        before = (previous or {}).get('assets', {})
+        for asset in result['assets']:
+            status = '' if asset['status'] in (200, None) else f"  [{asset['status']}]"
+            if asset['url'] not in before:
+                change = 'new' if previous else ''
+            elif asset['gzip'] is None or before[asset['url']] is None:
+                change = ''
+            else:
+                change = f"{(asset['gzip'] - before[asset['url']]) / 1024:+.1f}"
+            self.stdout.write(
+                f"  {asset['kind']:<11} {_kb(asset['raw']):>8} {_kb(asset['gzip']):>8} "
+                f"{_kb(asset['brotli']):>8} {change:>8}  {asset['url']}{status}"
+            )
+        totals = result['totals']
+        line = (f"  {'total':<11} {_kb(totals['raw']):>8} {_kb(totals['gzip']):>8} "
+                f"{_kb(totals['brotli']):>8} {'':>8}  {totals['requests']} requests")
+        if previous:
+            line += f" (baseline {_kb(previous.get('gzip'))} KB gzip, {previous.get('requests')} requests)"
+        self.stdout.write(line)
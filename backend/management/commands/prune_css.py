@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.cssprune import prune_settings, prune_stylesheets
+
+
+class Command(BaseCommand):
+    help = ('Write minified copies of CSS_PRUNE_STYLESHEETS without the selectors that the markup '
+            'of CSS_PRUNE_TEMPLATES and the classes CSS_PRUNE_SCRIPTS add can never match')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        reports = prune_stylesheets()
+        before = after = 0
+        for report in reports:
+            if 'error' in report:
+                raise CommandError(f"{report['name']}: {report['error']}")
+            before += report['before']
+            after += report['after']
+            self.stdout.write(
+                f"  {report['name']:<20} {report['before'] / 1024:>7.1f} KB -> {report['after'] / 1024:>6.1f} KB "
+                f"(-{report['before'] - report['after']} bytes, {report['rules_removed']} of "
+                f"{report['rules']} rules removed) -> {report['output']}"
+            )
+        saved = 100 * (before - after) / before if before else 0
+        self.stdout.write(
+            f'{len(reports)} stylesheets, {before - after} bytes removed ({saved:.1f}%) '
+            f"in {time.perf_counter() - started:.2f}s -> {prune_settings()['root']}"
+        )
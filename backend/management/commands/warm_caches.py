@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.warmup import TASKS, warm
+
+
+class Command(BaseCommand):
+    help = ('Prerender and cache pages, compile templates and build compressed static files '
+            'so the first visitors after a deploy hit warm caches')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=TASKS, dest='tasks',
+                            help='Task to run (repeatable); defaults to all of them')
+        parser.add_argument('--host', action='append', dest='hosts',
+                            help='Host to render pages for (repeatable); defaults to WARM_CACHE_HOSTS')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to render (repeatable); defaults to WARM_CACHE_PATHS')
+        parser.add_argument('--scheme', choices=['http', 'https'])
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--strict', action='store_true', help='Exit non-zero if any task failed')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        results = warm(
+            tasks=options['tasks'] or TASKS,
+            workers=options['workers'],
+            hosts=options['hosts'],
+            paths=options['paths'],
+            scheme=options['scheme'],
+        )
+        failures = []
+        for task, (seconds, done, task_failures) in results.items():
+            self.stdout.write(f'{task:<10} {done:>5} done {seconds * 1000:>9.1f} ms')
+            for failure in task_failures:
+                self.stderr.write(f'  {failure}')
+            failures += task_failures
+        self.stdout.write(f"{'total':<10} {'':>10} {(time.perf_counter() - started) * 1000:>9.1f} ms")
+        if failures and options['strict']:
+            raise CommandError(f'{len(failures)} warmup step(s) failed')
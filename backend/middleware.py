@@ -1,8 +1,28 @@
-from django.utils.cache import patch_cache_control
+from django.utils.cache import get_cache_key, get_max_age, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
 from django.http import HttpResponse
 from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.middleware.cache import FetchFromCacheMiddleware, UpdateCacheMiddleware
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import io
+import logging
+import random
+import re
+import sys
+import threading
 import time
 
+from .storage import static_cache_control
+
+logger = logging.getLogger(__name__)
+query_logger = logging.getLogger('backend.queries')
+
 class StaticFilesCacheMiddleware:
     """
     Middleware to add cache headers to static files
@@ -12,19 +32,282 @@ class StaticFilesCacheMiddleware:
 
     def __call__(self, request):
         response = self.get_response(request)
-        
+
         # Add cache headers for static files
-        if request.path.startswith('/static/'):
-            # Cache static files for 1 year
-            max_age = getattr(settings, 'STATIC_FILE_MAX_AGE', 31536000)
-            response['Cache-Control'] = f'public, max-age={max_age}, immutable'
-            response['Expires'] = time.strftime('%a, %d %b %Y %H:%M:%S GMT', 
-                                              time.gmtime(time.time() + max_age))
-            # Add ETag for better caching
-            if 'Last-Modified' in response:
-                response['ETag'] = f'"static-{hash(response["Last-Modified"])}"'
-            
+        if request.path.startswith(settings.STATIC_URL) and response.status_code in (200, 304):
+            name = request.path[len(settings.STATIC_URL):]
+            # Hashed files for a year, the rest per the storage
+            cache_control = static_cache_control(name, request.GET.get('v'))
+            if cache_control is None:
+                max_age = getattr(settings, 'STATIC_FILE_MAX_AGE', 31536000)
+                cache_control = f'public, max-age={max_age}, immutable'
+            response['Cache-Control'] = cache_control
+            max_age = get_max_age(response)
+            if max_age:
+                response['Expires'] = http_date(time.time() + max_age)
+            elif 'Expires' in response:
+                del response['Expires']
+
             # Force cache headers even if they exist
             response['X-Static-Cache'] = 'enabled'
-            
-        return response
\ No newline at end of file
+
+        return response
+
+
+# Lists of placeholders and literals vary between otherwise identical queries
+_PLACEHOLDER_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+
+
+def statement_shape(sql):
+    """
+    Normalise SQL so repeated queries that differ only in values compare equal
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _PLACEHOLDER_LIST.sub('%s, ...', sql)
+
+
+class QueryRecorder:
+    """
+    ``execute_wrapper`` that times every statement run on a connection
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    def summary(self, slowest=3, repeat_threshold=5):
+        total = sum(duration for _, duration in self.queries)
+        # Count by exact SQL first: far fewer distinct strings than queries
+        shapes = Counter()
+        for sql, count in Counter(sql for sql, _ in self.queries).items():
+            shapes[statement_shape(sql)] += count
+        return {
+            'count': len(self.queries),
+            'time_ms': round(total * 1000, 2),
+            'slowest': [
+                (round(duration * 1000, 2), sql)
+                for sql, duration in sorted(self.queries, key=lambda q: q[1], reverse=True)[:slowest]
+            ],
+            'repeated': [(shape, count) for shape, count in shapes.most_common() if count >= repeat_threshold],
+        }
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record the SQL each request runs: query count, total DB time, the slowest
+    statements and statement shapes repeated often enough to look like N+1.
+
+    Off unless QUERY_INSTRUMENTATION_ENABLED; QUERY_INSTRUMENTATION_SAMPLE_RATE
+    picks the fraction of requests instrumented, unsampled requests only pay
+    for one ``random()`` call. Findings are logged to ``backend.queries`` and,
+    with QUERY_INSTRUMENTATION_HEADERS, returned as ``X-DB-*`` headers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_INSTRUMENTATION_ENABLED', False)
+        self.sample_rate = getattr(settings, 'QUERY_INSTRUMENTATION_SAMPLE_RATE', 1.0)
+        self.headers = getattr(settings, 'QUERY_INSTRUMENTATION_HEADERS', False)
+        self.repeat_threshold = getattr(settings, 'QUERY_INSTRUMENTATION_REPEAT_THRESHOLD', 5)
+        self.slowest = getattr(settings, 'QUERY_INSTRUMENTATION_SLOWEST', 3)
+        self.slow_ms = getattr(settings, 'QUERY_INSTRUMENTATION_SLOW_MS', 200)
+
+    def __call__(self, request):
+        if not self.enabled or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        summary = recorder.summary(self.slowest, self.repeat_threshold)
+        self.report(request, response, summary)
+        if self.headers:
+            response['X-DB-Query-Count'] = str(summary['count'])
+            response['X-DB-Time-Ms'] = str(summary['time_ms'])
+            response['X-DB-Repeated-Queries'] = str(sum(count for _, count in summary['repeated']))
+        return response
+
+    def report(self, request, response, summary):
+        query_logger.debug(
+            '%s %s: %d queries in %.2fms',
+            request.method, request.path, summary['count'], summary['time_ms'],
+        )
+        for shape, count in summary['repeated']:
+            query_logger.warning(
+                'Possible N+1 on %s %s: %d x %s', request.method, request.path, count, shape,
+            )
+        if summary['time_ms'] >= self.slow_ms:
+            query_logger.warning(
+                'Slow database time on %s %s: %d queries in %.2fms; slowest: %s',
+                request.method, request.path, summary['count'], summary['time_ms'],
+                '; '.join(f'{ms}ms {sql}' for ms, sql in summary['slowest']),
+            )
+
+
+# Marks the internal request that regenerates a stale page. Keys containing
+# a dot can't be set through HTTP headers, so clients can't forge it.
+REVALIDATE_FLAG = 'backend.revalidate'
+
+Envelope = namedtuple('Envelope', ['fresh_until', 'value'])
+
+
+class StaleWhileRevalidateCache:
+    """
+    Wraps a cache so entries written with ``set`` stay stored ``grace``
+    seconds past their timeout, alongside the time they stop being fresh.
+    ``get`` returns the value, fresh or stale; ``get_envelope`` tells them apart.
+    """
+
+    def __init__(self, cache, grace):
+        self._cache = cache
+        self.grace = grace
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def get_envelope(self, key):
+        value = self._cache.get(key)
+        if value is None or isinstance(value, Envelope):
+            return value
+        # Written by the plain cache middleware: treat as fresh
+        return Envelope(float('inf'), value)
+
+    def get(self, key, default=None, version=None):
+        value = self._cache.get(key, default, version=version)
+        return value.value if isinstance(value, Envelope) else value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self._cache.default_timeout
+        if timeout is None:
+            self._cache.set(key, Envelope(float('inf'), value), None, version=version)
+        else:
+            self._cache.set(key, Envelope(time.time() + timeout, value), timeout + self.grace, version=version)
+
+
+def stale_cache(alias):
+    return StaleWhileRevalidateCache(caches[alias], getattr(settings, 'CACHE_MIDDLEWARE_STALE_SECONDS', 0))
+
+
+class StaleUpdateCacheMiddleware(UpdateCacheMiddleware):
+    """
+    ``UpdateCacheMiddleware`` that keeps pages CACHE_MIDDLEWARE_STALE_SECONDS
+    past expiry so ``StaleFetchFromCacheMiddleware`` can serve them stale
+    """
+
+    @property
+    def cache(self):
+        return stale_cache(self.cache_alias)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_handler = None
+
+
+def _revalidation_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CACHE_REVALIDATE_WORKERS', 2),
+                thread_name_prefix='revalidate',
+            )
+    return _executor
+
+
+def _regenerate(environ, cache_alias, lock_key):
+    """
+    Render the page again through the full middleware stack; the update
+    middleware stores the fresh copy
+    """
+    global _handler
+    try:
+        if _handler is None:
+            _handler = WSGIHandler()
+        response = _handler(environ, lambda status, headers, exc_info=None: None)
+        for _ in response:
+            pass
+        response.close()
+    except Exception:
+        logger.exception('Background revalidation of %s failed', environ.get('PATH_INFO'))
+    finally:
+        caches[cache_alias].delete(lock_key)
+        connections.close_all()
+
+
+class StaleFetchFromCacheMiddleware(FetchFromCacheMiddleware):
+    """
+    ``FetchFromCacheMiddleware`` with stale-while-revalidate.
+
+    An expired page still within its grace period is served as is, and the
+    first request to see it regenerates it in the background. The
+    regeneration lock is a ``cache.add``, so with a cache shared between
+    workers exactly one request per page regenerates, across threads and
+    processes alike.
+    """
+
+    @property
+    def cache(self):
+        return stale_cache(self.cache_alias)
+
+    def process_request(self, request):
+        if request.META.get(REVALIDATE_FLAG):
+            request._cache_update_cache = True
+            return None
+        if request.method not in ('GET', 'HEAD'):
+            request._cache_update_cache = False
+            return None
+
+        cache = self.cache
+        cache_key = get_cache_key(request, self.key_prefix, 'GET', cache=cache)
+        envelope = cache.get_envelope(cache_key) if cache_key else None
+        if envelope is None and cache_key and request.method == 'HEAD':
+            cache_key = get_cache_key(request, self.key_prefix, 'HEAD', cache=cache)
+            envelope = cache.get_envelope(cache_key) if cache_key else None
+        if envelope is None:
+            request._cache_update_cache = True
+            return None
+
+        fresh_until, response = envelope
+        if time.time() >= fresh_until:
+            self.revalidate(request, cache_key)
+        if (max_age := get_max_age(response)) is not None and (
+            expires := parse_http_date_safe(response['Expires'])
+        ) is not None:
+            response['Age'] = max(0, max_age - (expires - int(time.time())))
+        request._cache_update_cache = False
+        return response
+
+    def revalidate(self, request, cache_key):
+        lock_key = f'{cache_key}.revalidating'
+        if not self.cache.add(lock_key, 1, getattr(settings, 'CACHE_REVALIDATE_LOCK_TIMEOUT', 30)):
+            return None
+        environ = {key: value for key, value in request.META.items() if '.' not in key}
+        environ.update({
+            'REQUEST_METHOD': 'GET',
+            'CONTENT_LENGTH': '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.META.get('wsgi.url_scheme', 'http'),
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            REVALIDATE_FLAG: True,
+        })
+        future = _revalidation_executor().submit(_regenerate, environ, self.cache_alias, lock_key)
+        request._cache_revalidation = future
+        return future
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('dead', 'Dead letter'), ('held', 'Held for digest'), ('digested', 'Sent in digest')], default='pending', max_length=10),
+        ),
+    ]
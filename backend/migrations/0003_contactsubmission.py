@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_outbox_digest_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContactSubmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('email', models.EmailField(max_length=254)),
+                ('message', models.TextField()),
+                ('status', models.CharField(choices=[('new', 'New'), ('read', 'Read'), ('archived', 'Archived'), ('spam', 'Spam')], default='new', max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['created_at'], name='submission_created_idx'), models.Index(fields=['email'], name='submission_email_idx'), models.Index(fields=['status', 'created_at'], name='submission_status_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,87 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class ContactSubmission(models.Model):
+    """
+    A message sent through the contact form
+    """
+    NEW = 'new'
+    READ = 'read'
+    ARCHIVED = 'archived'
+    SPAM = 'spam'
+    STATUS_CHOICES = [
+        (NEW, 'New'),
+        (READ, 'Read'),
+        (ARCHIVED, 'Archived'),
+        (SPAM, 'Spam'),
+    ]
+
+    name = models.CharField(max_length=200)
+    email = models.EmailField()
+    message = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=NEW)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    # The full-text index (migration 0004) lives outside the model. On SQLite
+    # it is maintained by triggers, which a table-rebuilding migration drops;
+    # such migrations must recreate them.
+
+    class Meta:
+        # Newest first by primary key, which the admin pages through with a keyset
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['created_at'], name='submission_created_idx'),
+            models.Index(fields=['email'], name='submission_email_idx'),
+            models.Index(fields=['status', 'created_at'], name='submission_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} <{self.email}>'
+
+
+class OutboxMessage(models.Model):
+    """
+    An email waiting to be delivered by the ``deliver_outbox`` worker
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    HELD = 'held'
+    DIGESTED = 'digested'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead letter'),
+        (HELD, 'Held for digest'),
+        (DIGESTED, 'Sent in digest'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.TextField(help_text='Comma separated list of recipients')
+    reply_to = models.CharField(max_length=254, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} ({self.status})'
+
+    def recipients(self):
+        return [address for address in self.to.split(',') if address]
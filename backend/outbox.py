@@ -0,0 +1,207 @@
+"""
+Durable outbox for outgoing email.
+
+Views write messages to the ``OutboxMessage`` table and return immediately;
+the ``deliver_outbox`` management command picks them up and talks to SMTP.
+"""
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def build_contact_email(name, email, message):
+    """
+    Return the subject and body of the notification sent for a contact message
+    """
+    subject = f'New Contact Form Message from {name}'
+    body = f'''New contact form submission:
+
+Name: {name}
+Email: {email}
+Message:
+{message}
+
+Reply to: {email}'''
+    return subject, body
+
+
+def enqueue(subject, body, to, reply_to='', status=OutboxMessage.PENDING):
+    """
+    Store an email in the outbox so the delivery worker can send it
+    """
+    return OutboxMessage.objects.create(
+        subject=subject[:255],
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=','.join(to),
+        reply_to=reply_to,
+        status=status,
+        next_attempt_at=timezone.now(),
+    )
+
+
+def enqueue_contact_message(name, email, message, hold=False):
+    """
+    Queue the admin notification for a contact form submission.
+
+    With ``hold`` the message waits for the next digest instead of being
+    sent on its own.
+    """
+    admin_email = getattr(settings, 'ADMIN_EMAIL', 'admin@example.com')
+    subject, body = build_contact_email(name, email, message)
+    status = OutboxMessage.HELD if hold else OutboxMessage.PENDING
+    return enqueue(subject, body, [admin_email], reply_to=email, status=status)
+
+
+def backoff_delay(attempts):
+    """
+    Seconds to wait before retrying a message that has failed ``attempts`` times
+    """
+    base = getattr(settings, 'OUTBOX_BACKOFF_BASE', 30)
+    cap = getattr(settings, 'OUTBOX_BACKOFF_MAX', 3600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    # Up to 10% jitter so messages that failed together don't retry together
+    return delay + random.uniform(0, delay * 0.1)
+
+
+def _due_filter(now):
+    lock_timeout = getattr(settings, 'OUTBOX_LOCK_TIMEOUT', 300)
+    return (
+        Q(status=OutboxMessage.PENDING, next_attempt_at__lte=now)
+        # Messages claimed by a worker that died mid-send
+        | Q(status=OutboxMessage.SENDING, locked_at__lt=now - timedelta(seconds=lock_timeout))
+    )
+
+
+def claim_due_messages(limit):
+    """
+    Claim up to ``limit`` due messages for this worker.
+
+    Each row is claimed with a conditional UPDATE, so several workers can
+    poll the same table without sending a message twice.
+    """
+    now = timezone.now()
+    due = _due_filter(now)
+    candidates = list(
+        OutboxMessage.objects.filter(due)
+        .order_by('next_attempt_at', 'id')
+        .values_list('pk', flat=True)[:limit]
+    )
+    claimed = [
+        pk for pk in candidates
+        if OutboxMessage.objects.filter(due, pk=pk).update(
+            status=OutboxMessage.SENDING, locked_at=now
+        )
+    ]
+    return list(OutboxMessage.objects.filter(pk__in=claimed).order_by('next_attempt_at', 'id'))
+
+
+def record_failure(message, exc):
+    """
+    Schedule a retry for ``message``, or dead-letter it once attempts run out
+    """
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 6)
+    message.attempts += 1
+    message.locked_at = None
+    message.last_error = f'{type(exc).__name__}: {exc}'[:2000]
+    if message.attempts >= max_attempts:
+        message.status = OutboxMessage.DEAD
+        logger.error('Outbox message %s dead-lettered after %s attempts: %s',
+                     message.pk, message.attempts, message.last_error)
+    else:
+        message.status = OutboxMessage.PENDING
+        message.next_attempt_at = timezone.now() + timedelta(seconds=backoff_delay(message.attempts))
+        logger.warning('Outbox message %s failed (attempt %s), retrying at %s: %s',
+                       message.pk, message.attempts, message.next_attempt_at, message.last_error)
+    message.save(update_fields=['attempts', 'locked_at', 'last_error', 'status', 'next_attempt_at'])
+
+
+def record_success(message):
+    message.attempts += 1
+    message.status = OutboxMessage.SENT
+    message.locked_at = None
+    message.last_error = ''
+    message.sent_at = timezone.now()
+    message.save(update_fields=['attempts', 'status', 'locked_at', 'last_error', 'sent_at'])
+
+
+def deliver_message(message, connection=None):
+    """
+    Send one outbox message, returning True if SMTP accepted it
+    """
+    email = EmailMessage(
+        message.subject,
+        message.body,
+        message.from_email,
+        message.recipients(),
+        reply_to=[message.reply_to] if message.reply_to else None,
+        connection=connection,
+    )
+    try:
+        email.send(fail_silently=False)
+    except Exception as exc:
+        record_failure(message, exc)
+        return False
+    record_success(message)
+    return True
+
+
+def _deliver_chunk(messages):
+    """
+    Deliver ``messages`` over a single SMTP connection
+    """
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        for message in messages:
+            record_failure(message, exc)
+        return 0
+    try:
+        return sum(deliver_message(message, connection) for message in messages)
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            logger.debug('Error closing SMTP connection', exc_info=True)
+
+
+def _deliver_chunk_in_thread(messages):
+    try:
+        return _deliver_chunk(messages)
+    finally:
+        db_connection.close()
+
+
+def deliver_due(batch_size=None, concurrency=None):
+    """
+    Deliver the messages that are currently due.
+
+    At most ``concurrency`` SMTP connections are used at once. Returns a
+    ``(sent, failed)`` tuple.
+    """
+    batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', 50)
+    concurrency = concurrency or getattr(settings, 'OUTBOX_CONCURRENCY', 2)
+    messages = claim_due_messages(batch_size)
+    if not messages:
+        return 0, 0
+
+    workers = max(1, min(concurrency, len(messages)))
+    if workers == 1:
+        sent = _deliver_chunk(messages)
+    else:
+        chunks = [messages[i::workers] for i in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox') as pool:
+            sent = sum(pool.map(_deliver_chunk_in_thread, chunks))
+    return sent, len(messages) - sent
@@ -0,0 +1,269 @@
+"""
+Page weight: what a first visit to each page downloads.
+
+``measure`` renders a page in-process and collects the scripts,
+stylesheets, icons, images and media its HTML references, then follows
+``url()``/``@import`` in stylesheets and static asset paths quoted in
+scripts. Every asset is counted once per page with its raw size and its
+transfer size under gzip and, when the ``brotli`` package is installed,
+Brotli; formats that are already compressed (images, fonts) are sent as
+they are. For responsive images the widest candidate is counted.
+
+``compare`` checks measurements against the committed baseline
+(PAGE_WEIGHT_BASELINE) and its thresholds.
+"""
+import gzip
+import json
+import os
+import re
+from html.parser import HTMLParser
+from urllib.parse import parse_qsl, urljoin, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.test import Client
+from django.utils._os import safe_join
+from whitenoise.compress import Compressor
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+METRICS = ('requests', 'raw', 'gzip', 'brotli')
+DEFAULT_THRESHOLDS = {'percent': 5, 'bytes': 1024, 'requests': 0}
+LINK_RELS = {'stylesheet', 'icon', 'shortcut', 'apple-touch-icon', 'modulepreload', 'preload', 'manifest'}
+
+_CSS_REFERENCE = re.compile(r'''(@import\s+)?url\(\s*(['"]?)([^'")]+)\2\s*\)|@import\s+(['"])([^'"]+)\4''')
+_STYLE_URL = re.compile(r'''url\(\s*['"]?([^'")]+)['"]?\s*\)''')
+_compressor = Compressor(quiet=True)
+
+
+def _widest(srcset):
+    """
+    The candidate of a ``srcset`` a large screen would pick
+    """
+    best, best_size = None, -1
+    for candidate in srcset.split(','):
+        parts = candidate.split()
+        if not parts:
+            continue
+        # One srcset uses either width (w) or density (x) descriptors, never both
+        descriptor = parts[1] if len(parts) > 1 else '1x'
+        try:
+            size = float(descriptor[:-1])
+        except ValueError:
+            size = 0
+        if size > best_size:
+            best, best_size = parts[0], size
+    return best
+
+
+class AssetCollector(HTMLParser):
+    """
+    ``(kind, url)`` of every subresource an HTML document loads
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.assets = []
+        self.picture = None
+
+    def add(self, kind, url):
+        if url and not url.startswith(('data:', '#', 'javascript:')):
+            self.assets.append((kind, url.strip()))
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        for url in _STYLE_URL.findall(attrs.get('style') or ''):
+            self.add('image', url)
+        if tag == 'script':
+            self.add('script', attrs.get('src'))
+        elif tag == 'link':
+            rels = set((attrs.get('rel') or '').lower().split())
+            if rels & LINK_RELS:
+                kind = 'stylesheet' if 'stylesheet' in rels else attrs.get('as') or 'link'
+                self.add(kind, attrs.get('href'))
+        elif tag == 'picture':
+            self.picture = []
+        elif tag == 'source' and self.picture is not None:
+            # The browser takes the first source it supports; assume it supports them all
+            self.picture.append(_widest(attrs.get('srcset') or '') or attrs.get('src'))
+        elif tag == 'img':
+            url = _widest(attrs.get('srcset') or '') or attrs.get('src')
+            if self.picture:
+                url = self.picture[0]
+            self.add('image', url)
+        elif tag in ('video', 'audio', 'source', 'track', 'embed'):
+            self.add('media', attrs.get('src'))
+            if tag == 'video':
+                self.add('image', attrs.get('poster'))
+
+    def handle_endtag(self, tag):
+        if tag == 'picture':
+            self.picture = None
+
+
+def static_asset_pattern():
+    return re.compile(
+        r'''["'`](%s[^"'`\s]+\.(?:png|jpe?g|gif|webp|avif|svg|ico|woff2?|ttf|otf|css|js|mp4|webm))["'`]'''
+        % re.escape(settings.STATIC_URL),
+        re.IGNORECASE,
+    )
+
+
+def _kind(url):
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    if extension == '.css':
+        return 'stylesheet'
+    if extension in ('.js', '.mjs'):
+        return 'script'
+    if extension in ('.woff', '.woff2', '.ttf', '.otf'):
+        return 'font'
+    return 'image'
+
+
+def sizes(name, data):
+    """
+    Raw and transfer sizes of one response body
+    """
+    if not _compressor.should_compress(name):
+        return {'raw': len(data), 'gzip': len(data), 'brotli': len(data) if brotli else None}
+    return {
+        'raw': len(data),
+        'gzip': len(gzip.compress(data, compresslevel=9, mtime=0)),
+        'brotli': len(brotli.compress(data)) if brotli else None,
+    }
+
+
+def _static_file(name):
+    if '..' in name.split('/'):
+        return None
+    try:
+        path = finders.find(name)
+        if not path and settings.STATIC_ROOT:
+            candidate = safe_join(settings.STATIC_ROOT, name)
+            path = candidate if os.path.isfile(candidate) else None
+    except SuspiciousFileOperation:
+        return None
+    return path
+
+
+class PageWeigher:
+
+    def __init__(self, host=None):
+        self.host = host
+        extra = {'HTTP_HOST': host} if host else {}
+        self.client = Client(raise_request_exception=False, **extra)
+
+    def fetch(self, url):
+        """
+        Body of a same-site URL: static files from disk, anything else through the app
+        """
+        parts = urlsplit(url)
+        if parts.path.startswith(settings.STATIC_URL):
+            path = _static_file(parts.path[len(settings.STATIC_URL):])
+            if path:
+                with open(path, 'rb') as f:
+                    return 200, f.read()
+        response = self.client.get(parts.path, data=parse_qsl(parts.query))
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, body
+
+    def measure(self, path):
+        status, html = self.fetch(path)
+        document = dict(url=path, kind='document', status=status, **sizes('page.html', html))
+        assets = [document]
+        if status != 200:
+            return self._summary(path, assets)
+        collector = AssetCollector()
+        collector.feed(html.decode('utf-8', 'replace'))
+        pending = [(kind, urljoin(path, url)) for kind, url in collector.assets]
+        seen = set()
+        static_assets = static_asset_pattern()
+        while pending:
+            kind, url = pending.pop(0)
+            parts = urlsplit(url)
+            if parts.scheme not in ('', 'http', 'https') or url in seen:
+                continue
+            seen.add(url)
+            if parts.netloc and parts.netloc != self.host:
+                # Another origin: one more request of unknown size
+                assets.append({'url': url, 'kind': kind, 'status': None, 'raw': None, 'gzip': None, 'brotli': None})
+                continue
+            status, body = self.fetch(url)
+            assets.append(dict(url=url, kind=kind, status=status, **sizes(parts.path, body)))
+            if status != 200:
+                continue
+            if kind == 'stylesheet':
+                text = body.decode('utf-8', 'replace')
+                for match in _CSS_REFERENCE.finditer(text):
+                    nested = match.group(3) or match.group(5)
+                    if not nested.startswith(('data:', '#')):
+                        nested = urljoin(url, nested)
+                        pending.append(('stylesheet' if match.group(1) or match.group(5) else _kind(nested), nested))
+            elif kind == 'script':
+                for nested in static_assets.findall(body.decode('utf-8', 'replace')):
+                    pending.append((_kind(nested), nested))
+        return self._summary(path, assets)
+
+    def _summary(self, path, assets):
+        totals = {'requests': len(assets)}
+        for metric in ('raw', 'gzip', 'brotli'):
+            values = [asset[metric] for asset in assets if asset[metric] is not None]
+            totals[metric] = sum(values) if metric != 'brotli' or brotli else None
+        return {'path': path, 'totals': totals, 'assets': assets}
+
+
+def baseline_path():
+    return getattr(settings, 'PAGE_WEIGHT_BASELINE', None) or os.path.join(settings.BASE_DIR, 'page-weight.json')
+
+
+def load_baseline(path=None):
+    try:
+        with open(path or baseline_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'thresholds': dict(DEFAULT_THRESHOLDS), 'pages': {}}
+
+
+def write_baseline(results, path=None, thresholds=None):
+    path = path or baseline_path()
+    baseline = {
+        'thresholds': thresholds or load_baseline(path).get('thresholds') or dict(DEFAULT_THRESHOLDS),
+        'pages': {
+            result['path']: dict(result['totals'], assets={
+                asset['url']: asset['gzip'] for asset in result['assets']
+            })
+            for result in results
+        },
+    }
+    with open(path + '.tmp', 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(path + '.tmp', path)
+    return baseline
+
+
+def compare(result, baseline):
+    """
+    Regressions of one page against the baseline, as messages
+    """
+    thresholds = dict(DEFAULT_THRESHOLDS, **baseline.get('thresholds', {}))
+    previous = baseline.get('pages', {}).get(result['path'])
+    if previous is None:
+        return []
+    regressions = []
+    for metric in METRICS:
+        before, now = previous.get(metric), result['totals'][metric]
+        if before is None or now is None:
+            continue
+        growth = now - before
+        if metric == 'requests':
+            regressed = growth > thresholds['requests']
+        else:
+            regressed = growth > thresholds['bytes'] and growth > before * thresholds['percent'] / 100
+        if regressed:
+            regressions.append(f"{result['path']}: {metric} {before} -> {now} (+{growth})")
+    return regressions
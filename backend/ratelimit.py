@@ -0,0 +1,119 @@
+"""
+Token bucket rate limiting backed by the Django cache.
+
+A limit of ``(limit, period)`` is a bucket holding up to ``limit`` tokens,
+refilled continuously at ``limit`` tokens per ``period`` seconds; each
+request takes one. A burst can therefore never exceed ``limit`` requests,
+wherever it falls, and a client that used them all gets one more every
+``period / limit`` seconds.
+
+The bucket is kept as the generic cell rate algorithm (GCRA) does: one
+float per key, the time at which the bucket will be full again. Each check
+reads it, works out the refill from the current time and writes it back
+through ``backend.cache.atomic_update``, so concurrent workers sharing the
+cache never both spend the same token.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .cache import atomic_update
+
+logger = logging.getLogger(__name__)
+
+
+def count_request(name, limit, period, now=None):
+    """
+    Take a token from bucket ``name`` for a request.
+
+    Returns 0 if the request is within the limit, otherwise the number of
+    seconds until the bucket has a token again.
+    """
+    now = time.time() if now is None else now
+    interval = period / limit
+
+    def take(full_at):
+        # Taking a token pushes the time the bucket is full again one
+        # interval further; more than a whole period ahead means it's empty.
+        full_at = max(now if full_at is None else full_at, now) + interval
+        if full_at - now > period:
+            return None, full_at - now - period
+        return full_at, 0
+
+    cache = caches[getattr(settings, 'RATELIMIT_CACHE_ALIAS', 'default')]
+    try:
+        return atomic_update(cache, f'rl:{name}', take, timeout=period + 1)
+    except TimeoutError:
+        # Other workers are hammering the same bucket; that's a burst
+        return interval
+
+
+def client_ip(request):
+    """
+    The client address, taking ``RATELIMIT_PROXY_COUNT`` trusted proxies into account
+    """
+    proxies = getattr(settings, 'RATELIMIT_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        # Each trusted proxy appends the address it received the request from,
+        # so count from the right; anything further left is client-supplied.
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_rate_limits(request, scope, per_ip, overall):
+    """
+    Count the request against the per-IP and the global limit for ``scope``.
+
+    ``per_ip`` and ``overall`` are ``(limit, period)`` tuples or None.
+    Returns 0 if the request may proceed, otherwise the Retry-After seconds.
+    """
+    try:
+        if per_ip:
+            retry_after = count_request(f'{scope}:ip:{client_ip(request)}', *per_ip)
+            if retry_after:
+                return retry_after
+        if overall:
+            return count_request(f'{scope}:all', *overall)
+    except Exception:
+        # Fail open: an unavailable cache shouldn't take the contact form down
+        logger.exception('Rate limit check failed')
+    return 0
+
+
+class RateLimitMixin:
+    """
+    Reject POSTs over the configured limits before the view runs.
+
+    Works for both sync and async class-based views.
+    """
+    rate_limit_scope = 'contact'
+    rate_limit_methods = ('POST',)
+
+    def get_rate_limits(self):
+        return (
+            getattr(settings, 'CONTACT_RATE_LIMIT_PER_IP', None),
+            getattr(settings, 'CONTACT_RATE_LIMIT_GLOBAL', None),
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in self.rate_limit_methods:
+            retry_after = check_rate_limits(request, self.rate_limit_scope, *self.get_rate_limits())
+            if retry_after:
+                response = self.rate_limited(request, retry_after)
+                if self.view_is_async:
+                    async def rejected():
+                        return response
+                    return rejected()
+                return response
+        return super().dispatch(request, *args, **kwargs)
+
+    def rate_limited(self, request, retry_after):
+        response = HttpResponse('Too many requests, please try again later.',
+                                status=429, content_type='text/plain')
+        response['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+        return response
@@ -0,0 +1,52 @@
+"""
+Ranked full-text search over contact submissions.
+
+Backed by the index created in migration 0004: FTS5 with bm25 ranking on
+SQLite, a GIN-indexed tsvector with ts_rank_cd on Postgres. Other
+databases fall back to an unranked ``icontains`` scan.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import ContactSubmission
+
+FTS_TABLE = 'backend_contactsubmission_fts'
+
+
+def fts5_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+
+def search_submissions(text, limit=50):
+    """
+    Return ``(pk, rank)`` pairs for submissions matching ``text``, best match first
+    """
+    if not text.strip():
+        return []
+    if connection.vendor == 'sqlite':
+        query = fts5_query(text)
+        if not query:
+            return []
+        # bm25() is lower for better matches; name and email weigh more than the message
+        sql = (f'SELECT rowid, -bm25({FTS_TABLE}, 5.0, 5.0, 1.0) AS rank FROM {FTS_TABLE} '
+               f'WHERE {FTS_TABLE} MATCH %s ORDER BY rank DESC LIMIT %s')
+        params = [query, limit]
+    elif connection.vendor == 'postgresql':
+        sql = ("SELECT id, ts_rank_cd(search_vector, query) AS rank "
+               "FROM backend_contactsubmission, websearch_to_tsquery('english', %s) query "
+               "WHERE search_vector @@ query ORDER BY rank DESC, id DESC LIMIT %s")
+        params = [text, limit]
+    else:
+        matches = ContactSubmission.objects.filter(
+            Q(name__icontains=text) | Q(email__icontains=text) | Q(message__icontains=text)
+        ).values_list('pk', flat=True)[:limit]
+        return [(pk, None) for pk in matches]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(pk, rank) for pk, rank in cursor.fetchall()]
@@ -0,0 +1,39 @@
+"""
+Per-connection SQLite tuning.
+
+``apply_sqlite_pragmas`` runs on every new SQLite connection (via the
+``connection_created`` signal) and applies ``settings.SQLITE_PRAGMAS``,
+e.g. WAL journaling so readers don't block on writers.
+"""
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_PRAGMAS = {
+    'journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout',
+    'temp_store', 'wal_autocheckpoint', 'journal_size_limit', 'foreign_keys',
+}
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    if getattr(connection, 'pool_reused', False):
+        # Pragmas stick to the raw connection; backend.dbpool already applied them
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            if name not in ALLOWED_PRAGMAS:
+                logger.warning('Ignoring unsupported SQLite pragma %r', name)
+                continue
+            if name == 'journal_mode' and connection.is_in_memory_db():
+                # In-memory databases can't use WAL
+                continue
+            if not str(value).lstrip('-').isalnum():
+                raise ValueError(f'Invalid value for PRAGMA {name}: {value!r}')
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -1,25 +1,314 @@
-from django.contrib.staticfiles.storage import StaticFilesStorage
-from django.core.files.storage import get_storage_class
+import hashlib
+import json
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlsplit
+
 from django.conf import settings
-from django.utils.functional import LazyObject
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import FileSystemStorage
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from .cssprune import pruned_stylesheets
+
+BUILD_CACHE_VERSION = 1
+
 
-class CachedStaticFilesStorage(StaticFilesStorage):
+def _file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IncrementalManifestStaticFilesStorage(CompressedManifestStaticFilesStorage):
     """
-    Custom static files storage that adds cache headers
+    WhiteNoise's hashed, compressed storage, but ``collectstatic`` only
+    post-processes what changed since the last build.
+
+    STATICFILES_BUILD_CACHE records, per file, the source's size, mtime and
+    content hash, its hashed name, and the files it references (for CSS/JS).
+    A file is reused when its stat or, failing that, its content hash is
+    unchanged and its hashed copy still exists. Changed files and everything
+    that references them, transitively, are hashed and rewritten as usual;
+    compression then runs on STATICFILES_COMPRESS_WORKERS threads.
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.max_age = getattr(settings, 'STATIC_FILE_MAX_AGE', 31536000)
-    
-    def url(self, name):
+        self.incremental = getattr(settings, 'STATICFILES_INCREMENTAL', True)
+        self.build_cache_path = getattr(settings, 'STATICFILES_BUILD_CACHE', None) or os.path.join(
+            settings.BASE_DIR, '.static-build-cache.json',
+        )
+        self.compress_workers = getattr(settings, 'STATICFILES_COMPRESS_WORKERS', None) or os.cpu_count() or 1
+        self.build_stats = {}
+        self._reused = {}
+        self._dependencies = {}
+        self._referencing = None
+
+    def _signature(self):
+        # A new STATIC_URL or hashing scheme invalidates every hashed name
+        return f'{type(self).__module__}.{type(self).__name__}:{settings.STATIC_URL}:{self.max_post_process_passes}'
+
+    def load_build_cache(self):
+        try:
+            with open(self.build_cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if cache.get('version') != BUILD_CACHE_VERSION or cache.get('signature') != self._signature():
+            return {}
+        return cache['files']
+
+    def save_build_cache(self, files):
+        os.makedirs(os.path.dirname(self.build_cache_path) or '.', exist_ok=True)
+        with open(self.build_cache_path + '.tmp', 'w') as f:
+            json.dump({'version': BUILD_CACHE_VERSION, 'signature': self._signature(), 'files': files}, f)
+        os.replace(self.build_cache_path + '.tmp', self.build_cache_path)
+
+    def _fingerprint(self, storage, path, entry):
+        """
+        ``(stat, digest, unchanged)`` for one source file
+        """
+        try:
+            stat = os.stat(storage.path(path))
+        except NotImplementedError:
+            return None, None, False
+        stat_key = [stat.st_size, stat.st_mtime_ns]
+        if entry and entry['stat'] == stat_key:
+            return stat_key, entry['hash'], True
+        # A fresh checkout changes every mtime; the content decides
+        digest = _file_digest(storage.path(path))
+        return stat_key, digest, bool(entry) and entry['hash'] == digest
+
+    def plan(self, paths, cache):
         """
-        Return the URL for the file, with cache-busting if needed
+        Split ``paths`` into ``(dirty, fingerprints)``: the names to process
+        and each name's ``(stat, digest)``.
         """
-        url = super().url(name)
+        names = list(paths)
+        with ThreadPoolExecutor(max_workers=self.compress_workers) as pool:
+            results = pool.map(
+                lambda name: self._fingerprint(*paths[name], cache.get(self.clean_name(name))), names,
+            )
+            fingerprints = dict(zip(names, results))
+
+        changed = {
+            self.clean_name(name) for name, (_, _, unchanged) in fingerprints.items()
+            if not unchanged or not self.exists(cache[self.clean_name(name)]['stored'])
+        }
+        # Removed files are "changed" too: whatever referenced them must be rechecked
+        changed |= set(cache) - {self.clean_name(name) for name in paths}
+        dependents = {}
+        for name, entry in cache.items():
+            for dependency in entry.get('deps', []):
+                dependents.setdefault(dependency, set()).add(name)
+        dirty, pending = set(), list(changed)
+        while pending:
+            name = pending.pop()
+            if name not in dirty:
+                dirty.add(name)
+                pending.extend(dependents.get(name, ()))
+        return {name for name in paths if self.clean_name(name) in dirty}, fingerprints
+
+    def post_process(self, paths, dry_run=False, **options):
+        self.build_stats = {'processed': len(paths), 'reused': 0, 'compressed': 0}
+        if dry_run or not self.incremental:
+            self._reused = {}
+            yield from super().post_process(paths, dry_run, **options)
+            return
+
+        cache = self.load_build_cache()
+        dirty, fingerprints = self.plan(paths, cache)
+        self._reused = {
+            self.hash_key(self.clean_name(name)): cache[self.clean_name(name)]['stored']
+            for name in paths if name not in dirty
+        }
+        self._dependencies = {}
+        failed = False
+        for name, hashed_name, processed in super().post_process(
+            {name: paths[name] for name in dirty}, dry_run, **options
+        ):
+            failed = failed or isinstance(processed, Exception)
+            yield name, hashed_name, processed
+        self.build_stats.update(processed=len(dirty), reused=len(paths) - len(dirty))
+        if failed:
+            return
+
+        files = {}
+        for name in paths:
+            clean = self.clean_name(name)
+            stat, digest, _ = fingerprints[name]
+            if stat is None:
+                continue
+            if name in dirty:
+                deps = sorted(self._dependencies.get(name, ()))
+            else:
+                deps = cache[clean].get('deps', [])
+            files[clean] = {
+                'stat': stat, 'hash': digest, 'deps': deps,
+                'stored': self.hashed_files[self.hash_key(clean)],
+            }
+        self.save_build_cache(files)
+
+    def _post_process(self, paths, adjustable_paths, hashed_files):
+        # Unchanged files keep their hashed names without being reread
+        for key, hashed_name in self._reused.items():
+            hashed_files.setdefault(key, hashed_name)
+        yield from super()._post_process(paths, adjustable_paths, hashed_files)
+
+    def url_converter(self, name, hashed_files, template=None):
+        convert = super().url_converter(name, hashed_files, template)
+
+        def converter(matchobj):
+            self._referencing = name
+            try:
+                return convert(matchobj)
+            finally:
+                self._referencing = None
+        return converter
+
+    def _stored_name(self, name, hashed_files):
+        if self._referencing is not None:
+            target = self.clean_name(posixpath.normpath(urlsplit(name).path))
+            self._dependencies.setdefault(self._referencing, set()).add(target)
+        return super()._stored_name(name, hashed_files)
+
+    def compress_files(self, names):
+        extensions = getattr(settings, 'WHITENOISE_SKIP_COMPRESS_EXTENSIONS', None)
+        compressor = self.create_compressor(extensions=extensions, quiet=True)
+        names = [name for name in names if compressor.should_compress(name)]
+
+        def compress(name):
+            path = self.path(name)
+            prefix_len = len(path) - len(name)
+            return [(name, compressed[prefix_len:]) for compressed in compressor.compress(path)]
+
+        # zlib and Brotli release the GIL, so threads compress in parallel
+        with ThreadPoolExecutor(max_workers=self.compress_workers) as pool:
+            for compressed in pool.map(compress, names):
+                yield from compressed
+        self.build_stats['compressed'] = len(names)
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+class CachedStaticFilesStorage(IncrementalManifestStaticFilesStorage):
+    """
+    Hashed static files with URL lookups that never touch the filesystem.
+
+    The manifest is parsed once per process and shared by every instance;
+    ``url()`` is then a dictionary lookup (memoised per name). In DEBUG, when
+    nothing is hashed, URLs carry ``?v=<mtime and size>`` instead so edits
+    still bust the browser cache.
+
+    ``cache_control(name)`` tells the serving layer how long a file may be
+    cached: hashed names (and, in DEBUG, current ``?v=`` URLs) forever,
+    anything else only STATIC_FILE_UNHASHED_MAX_AGE seconds.
+
+    With CSS_PRUNE_ENABLED, stylesheets ``prune_css`` wrote a pruned copy of
+    resolve to that copy instead.
+    """
+
+    hashed_names = frozenset()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_age = getattr(settings, 'STATIC_FILE_MAX_AGE', 31536000)
+        self.unhashed_max_age = getattr(settings, 'STATIC_FILE_UNHASHED_MAX_AGE', 3600)
+        self.prune_css = getattr(settings, 'CSS_PRUNE_ENABLED', False)
+        self._urls = {}
+
+    def load_manifest(self):
+        path = self.path(self.manifest_name)
+        try:
+            stat = os.stat(path)
+        except (OSError, NotImplementedError):
+            return super().load_manifest()
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with _manifests_lock:
+            if key not in _manifests:
+                hashed_files, manifest_hash = super().load_manifest()
+                _manifests.clear()
+                _manifests[key] = (hashed_files, manifest_hash, frozenset(hashed_files.values()))
+            hashed_files, manifest_hash, self.hashed_names = _manifests[key]
+        # Shared, not copied: post_process replaces hashed_files rather than mutating it
+        return hashed_files, manifest_hash
+
+    def post_process(self, *args, **kwargs):
+        yield from super().post_process(*args, **kwargs)
+        self.hashed_names = frozenset(self.hashed_files.values())
+        self._urls = {}
+
+    def url(self, name, force=False):
+        if self.prune_css:
+            name = pruned_stylesheets().get(name, name)
+        if settings.DEBUG and not force:
+            return self.versioned_url(name)
+        url = self._urls.get(name)
+        if url is None:
+            hashed_name = self.hashed_files.get(self.hash_key(name))
+            if hashed_name is not None:
+                url = self._plain_url(hashed_name)
+            elif self.manifest_strict or '?' in name or '#' in name or name.endswith('/'):
+                # Fragments, directories and strict misses keep Django's handling
+                return super().url(name, force)
+            else:
+                url = self._plain_url(name)
+            self._urls[name] = url
         return url
-    
-    def get_cache_control_header(self):
+
+    def _plain_url(self, name):
+        # What HashedFilesMixin._url builds, minus the lookups
+        return unquote(FileSystemStorage.url(self, name))
+
+    def version(self, name):
         """
-        Return the cache control header for static files
+        Cache-busting token for an unhashed file, from its source's stat
         """
-        return f'public, max-age={self.max_age}, immutable'
\ No newline at end of file
+        path = finders.find(name)
+        if not path:
+            return None
+        stat = os.stat(path)
+        return f'{stat.st_mtime_ns:x}{stat.st_size:x}'[-10:]
+
+    def versioned_url(self, name):
+        url = self._plain_url(name)
+        version = self.version(name)
+        return f'{url}?v={version}' if version else url
+
+    def cache_control(self, name, version=None):
+        """
+        ``Cache-Control`` for the file served as ``name``
+        """
+        immutable = name in self.hashed_names or (
+            version is not None and settings.DEBUG and version == self.version(name)
+        )
+        if immutable:
+            return f'public, max-age={self.max_age}, immutable'
+        if settings.DEBUG:
+            return 'no-cache'
+        return f'public, max-age={self.unhashed_max_age}'
+
+
+def static_cache_control(name, version=None):
+    """
+    ``Cache-Control`` for a static file, or None if the storage doesn't decide
+    """
+    if hasattr(staticfiles_storage, 'cache_control'):
+        return staticfiles_storage.cache_control(name, version)
+    return None
+
+
+def add_static_headers(headers, path, url):
+    """
+    WHITENOISE_ADD_HEADERS_FUNCTION: per-file Cache-Control from the storage
+    """
+    cache_control = static_cache_control(url[len(settings.STATIC_URL):])
+    if cache_control:
+        headers['Cache-Control'] = cache_control
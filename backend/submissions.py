@@ -0,0 +1,28 @@
+"""
+Accepting contact form submissions.
+"""
+from django.db import transaction
+
+from .dedupe import is_duplicate, remember
+from .digest import should_hold
+from .models import ContactSubmission
+from .outbox import enqueue_contact_message
+
+
+def accept_submission(name, email, message, sent=False):
+    """
+    Store a validated submission and queue its notification email.
+
+    ``sent`` means the notification already went out directly, so only the
+    submission is stored. Returns the new ``ContactSubmission``, or None if
+    it repeats a recent submission and was dropped.
+    """
+    if is_duplicate(name, email, message):
+        return None
+    with transaction.atomic():
+        submission = ContactSubmission.objects.create(name=name, email=email, message=message)
+        if not sent:
+            enqueue_contact_message(name, email, message, hold=should_hold(message))
+        # Only a stored submission counts; a failed one must stay retryable
+        transaction.on_commit(lambda: remember(name, email, message))
+    return submission
@@ -0,0 +1,32 @@
+"""
+``{% js_bundle %}`` loads a JS_BUNDLES entry:
+
+    {% load asset_bundles %}
+    {% js_bundle 'legacy' %}
+
+With JS_BUNDLE_ENABLED and the bundle built (``python manage.py
+bundle_js``) that is one deferred ``<script>``; otherwise each file of the
+bundle gets its own, also deferred, so they run in the same order either way.
+"""
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from ..jsbundle import js_bundles
+
+register = template.Library()
+
+
+@register.simple_tag
+def js_bundle(name):
+    """
+    ``<script defer>`` for the built bundle, or for each of its files
+    """
+    files = getattr(settings, 'JS_BUNDLES', {}).get(name)
+    if files is None:
+        raise template.TemplateSyntaxError(f'{name!r} is not in JS_BUNDLES')
+    output = js_bundles().get(name) if getattr(settings, 'JS_BUNDLE_ENABLED', False) else None
+    if output:
+        return format_html('<script defer src="{}"></script>', static(output))
+    return format_html_join('\n', '<script defer src="{}"></script>', ((static(file),) for file in files))
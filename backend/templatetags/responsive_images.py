@@ -0,0 +1,103 @@
+"""
+``{% picture %}`` renders a static image as ``<picture>`` markup from the
+build-time image index (``python manage.py build_images``):
+
+    {% load responsive_images %}
+    {% picture 'assets/IMG_9169.JPG' alt='Portrait' sizes='(max-width: 768px) 100vw, 50vw' class='hero' %}
+
+The ``<img>`` carries the intrinsic width and height, so the browser
+reserves its box before anything loads, and the dominant colour and blurred
+placeholder as its background until the image paints over them. Prebuilt
+derivatives are offered per format; images without them but wide enough to
+be worth resizing get ``/img/`` URLs instead. Nothing here touches the
+filesystem: the index is read once per process.
+"""
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+
+from ..imagecache import CONTENT_TYPES, allowed_formats, allowed_widths
+from ..images import FORMATS, image_index
+
+register = template.Library()
+
+
+def _derivative_srcsets(entry):
+    srcsets = {}
+    for derivative in entry['derivatives']:
+        widths = srcsets.setdefault(derivative['format'], {})
+        # Narrow originals produce the same width under several suffixes
+        widths.setdefault(derivative['width'], static(derivative['name']))
+    return srcsets
+
+
+def _resized_srcsets(path, entry):
+    if entry['width'] < getattr(settings, 'IMAGE_DERIVATIVE_MIN_WIDTH', 400):
+        return {}
+    allowed = sorted(allowed_widths())
+    # srcset descriptor -> width to request
+    widths = {width: width for width in allowed if width < entry['width']}
+    larger = [width for width in allowed if width >= entry['width']]
+    if larger:
+        # Never upscaled, so this renders at the original size
+        widths[entry['width']] = larger[0]
+    return {
+        format_name: {
+            descriptor: f"{reverse('resized_image', args=[width, format_name, path])}?v={entry['hash']}"
+            for descriptor, width in widths.items()
+        }
+        for format_name in allowed_formats()
+    }
+
+
+def _srcset(urls):
+    return ', '.join(f'{url} {width}w' for width, url in sorted(urls.items()))
+
+
+def _placeholder_style(entry):
+    if entry.get('alpha'):
+        # A placeholder would show through the transparent parts
+        return ''
+    return f"background:{entry['color']} url({entry['lqip']}) center/cover no-repeat"
+
+
+@register.simple_tag
+def picture(path, alt='', sizes='100vw', loading='lazy', **attrs):
+    """
+    ``<picture>`` for a static image, or a plain ``<img>`` if it isn't indexed
+    """
+    entry = image_index().get(path)
+    attrs = {'alt': alt, 'loading': loading, 'decoding': 'async', **attrs}
+    if entry is None:
+        return format_html('<img src="{}"{}>', static(path), _attributes(attrs))
+
+    srcsets = _derivative_srcsets(entry) or _resized_srcsets(path, entry)
+    sources = [
+        (CONTENT_TYPES[format_name], _srcset(srcsets[format_name]))
+        for format_name in FORMATS
+        if format_name in srcsets and format_name != 'jpeg'
+    ]
+    attrs = {'width': entry['width'], 'height': entry['height'], **attrs}
+    style = '; '.join(filter(None, [_placeholder_style(entry), attrs.pop('style', '')]))
+    if style:
+        attrs['style'] = style
+    if 'jpeg' in srcsets:
+        attrs.update(srcset=_srcset(srcsets['jpeg']), sizes=sizes)
+    img = format_html('<img src="{}"{}>', static(path), _attributes(attrs))
+    if not sources:
+        return img
+    return format_html(
+        '<picture>{}{}</picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', (
+            (content_type, srcset, sizes) for content_type, srcset in sources
+        )),
+        img,
+    )
+
+
+def _attributes(attrs):
+    return format_html_join('', ' {}="{}"', (
+        (name.replace('_', '-'), value) for name, value in attrs.items() if value is not None
+    ))
@@ -1,3 +1,1861 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import importlib
+import json
+import os
+import re
+import tempfile
+import socketserver
+import sqlite3
+from io import BytesIO, StringIO
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils.cache import get_cache_key
+from django.db import connection, connections
+from django.utils import timezone
+
+from . import aiosmtp, dbpool, views
+from .cache import deploy_version
+from .cache.shm import SharedMemoryCache
+from .cache.tiered import TieredCache
+from .admin import ContactSubmissionAdmin
+from .cssprune import drop_unused_keyframes, parse, prune, pruned_stylesheets, script_selectors, serialize
+from .jsbundle import js_bundles, minify
+from .images import build_derivatives, build_index, image_index
+from . import imagecache
+from .dbpool.sqlite3.base import DatabaseWrapper as PooledSQLiteWrapper
+from .dedupe import RotatingBloomFilter, fingerprint
+from .digest import flush_digest
+from .middleware import (
+    REVALIDATE_FLAG, QueryInstrumentationMiddleware, StaleFetchFromCacheMiddleware, stale_cache,
+)
+from .middleware import QueryRecorder, statement_shape
+from .mail import PoolTimeout, close_pools, get_metrics, get_pool
+from .models import ContactSubmission, OutboxMessage
+from .outbox import claim_due_messages, deliver_due, enqueue
+from .pageweight import AssetCollector, PageWeigher, compare
+from .ratelimit import client_ip, count_request
+from .search import search_submissions
+from .storage import CachedStaticFilesStorage, add_static_headers
+
+
+def production_setting(name):
+    """
+    The value ``name`` ends up with under my_Portfolio.production_settings
+    """
+    return getattr(importlib.import_module('my_Portfolio.production_settings'), name)
+
+
+class SMTPStandIn:
+    """
+    Minimal threaded SMTP server that records the messages it accepts.
+
+    ``reject`` makes it answer MAIL FROM with a temporary failure.
+    """
+
+    def __init__(self, reject=False):
+        self.messages = []
+        self.connections = 0
+        self.reject = reject
+        stand_in = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b'\r\n')
+
+            def handle(self):
+                stand_in.connections += 1
+                self.reply('220 localhost stand-in')
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode().strip().split(' ', 1)[0].upper()
+                    if command in ('EHLO', 'HELO'):
+                        self.reply('250 localhost')
+                    elif command == 'MAIL' and stand_in.reject:
+                        self.reply('451 try again later')
+                    elif command in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                        self.reply('250 OK')
+                    elif command == 'DATA':
+                        self.reply('354 end with .')
+                        data = []
+                        for raw in iter(self.rfile.readline, b''):
+                            if raw in (b'.\r\n', b'.\n'):
+                                break
+                            data.append(raw)
+                        stand_in.messages.append(b''.join(data).decode())
+                        self.reply('250 queued')
+                    elif command == 'QUIT':
+                        self.reply('221 bye')
+                        return
+                    else:
+                        self.reply('502 not implemented')
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def settings(self):
+        return override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            EMAIL_TIMEOUT=5,
+        )
+
+
+class ContactFormViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_valid_submission_is_queued_without_smtp(self):
+        response = self.client.post(reverse('contact'), {
+            'name': 'Ada', 'email': 'ada@example.com', 'message': 'Hello there',
+        })
+
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+        submission = ContactSubmission.objects.get()
+        self.assertEqual((submission.name, submission.status), ('Ada', ContactSubmission.NEW))
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.status, OutboxMessage.PENDING)
+        self.assertEqual(message.subject, 'New Contact Form Message from Ada')
+        self.assertEqual(message.reply_to, 'ada@example.com')
+
+    def test_missing_fields_are_not_queued(self):
+        self.client.post(reverse('contact'), {'name': 'Ada', 'email': '', 'message': ''})
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=3, OUTBOX_BACKOFF_BASE=60)
+class OutboxDeliveryTests(TestCase):
+
+    def queue(self, count=1):
+        return [enqueue(f'Subject {i}', 'Body', ['admin@example.com']) for i in range(count)]
+
+    def test_delivers_due_messages(self):
+        self.queue(3)
+
+        with SMTPStandIn() as smtp, smtp.settings():
+            sent, failed = deliver_due(concurrency=1)
+
+        self.assertEqual((sent, failed), (3, 0))
+        self.assertEqual(len(smtp.messages), 3)
+        # One connection is reused for the whole chunk
+        self.assertEqual(smtp.connections, 1)
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxMessage.SENT).exists())
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        message, = self.queue()
+
+        with SMTPStandIn(reject=True) as smtp, smtp.settings(), self.assertLogs('backend.outbox', 'WARNING'):
+            self.assertEqual(deliver_due(), (0, 1))
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('451', message.last_error)
+        self.assertGreaterEqual(message.next_attempt_at, timezone.now() + timedelta(seconds=59))
+        # Not due again until the backoff has elapsed
+        self.assertEqual(claim_due_messages(10), [])
+
+    def test_message_is_dead_lettered_after_max_attempts(self):
+        message, = self.queue()
+        OutboxMessage.objects.filter(pk=message.pk).update(attempts=2)
+
+        with SMTPStandIn(reject=True) as smtp, smtp.settings(), self.assertLogs('backend.outbox', 'ERROR'):
+            deliver_due()
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.DEAD)
+        self.assertEqual(message.attempts, 3)
+
+    def test_unreachable_server_counts_as_failure(self):
+        message, = self.queue()
+        smtp = SMTPStandIn()
+        smtp.server.server_close()
+
+        with smtp.settings(), self.assertLogs('backend.outbox', 'WARNING'):
+            self.assertEqual(deliver_due(), (0, 1))
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.PENDING)
+        self.assertEqual(message.attempts, 1)
+
+    def test_claimed_messages_are_not_claimed_twice(self):
+        self.queue(2)
+
+        self.assertEqual(len(claim_due_messages(10)), 2)
+        self.assertEqual(claim_due_messages(10), [])
+
+    def test_stale_claims_are_recovered(self):
+        message, = self.queue()
+        OutboxMessage.objects.filter(pk=message.pk).update(
+            status=OutboxMessage.SENDING, locked_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual([m.pk for m in claim_due_messages(10)], [message.pk])
+
+    def test_worker_command_once(self):
+        self.queue(2)
+
+        with SMTPStandIn() as smtp, smtp.settings():
+            call_command('deliver_outbox', '--once', '--concurrency=1', stdout=StringIO())
+
+        self.assertEqual(len(smtp.messages), 2)
+
+
+class PooledEmailBackendTests(TestCase):
+
+    def tearDown(self):
+        close_pools()
+
+    def send(self, count):
+        connection = mail.get_connection('backend.mail.PooledEmailBackend')
+        for i in range(count):
+            mail.EmailMessage(f'Subject {i}', 'Body', 'from@example.com', ['to@example.com'],
+                              connection=connection).send()
+
+    def test_connection_is_reused_across_sends(self):
+        with SMTPStandIn() as smtp, smtp.settings():
+            self.send(5)
+            stats = get_metrics()[f'127.0.0.1:{smtp.port}']
+
+        self.assertEqual(len(smtp.messages), 5)
+        self.assertEqual(smtp.connections, 1)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 4)
+        self.assertEqual(stats['messages_sent'], 5)
+        self.assertIsNotNone(stats['avg_send_ms'])
+
+    def test_batch_is_sent_over_one_connection(self):
+        messages = [mail.EmailMessage(f'Subject {i}', 'Body', 'from@example.com', ['to@example.com'])
+                    for i in range(3)]
+
+        with SMTPStandIn() as smtp, smtp.settings():
+            sent = mail.get_connection('backend.mail.PooledEmailBackend').send_messages(messages)
+
+        self.assertEqual(sent, 3)
+        self.assertEqual(smtp.connections, 1)
+
+    @override_settings(EMAIL_POOL_HEALTH_CHECK_AFTER=0)
+    def test_dead_idle_connection_is_replaced(self):
+        with SMTPStandIn() as smtp, smtp.settings():
+            self.send(1)
+            pool = get_pool()
+            backend, _ = pool._idle[0]
+            backend.connection.close()
+            self.send(1)
+            stats = pool.stats()
+
+        self.assertEqual(len(smtp.messages), 2)
+        self.assertEqual(stats['health_check_failures'], 1)
+        self.assertEqual(stats['connections_opened'], 2)
+
+    @override_settings(EMAIL_POOL_SIZE=1, EMAIL_POOL_TIMEOUT=0.05)
+    def test_acquire_waits_for_a_bounded_time(self):
+        with SMTPStandIn() as smtp, smtp.settings():
+            pool = get_pool()
+            backend = pool.acquire()
+            with self.assertRaises(PoolTimeout):
+                pool.acquire()
+            pool.release(backend)
+            self.assertIs(pool.acquire(), backend)
+
+
+class AsyncSMTPStandIn:
+    """
+    asyncio SMTP server running on its own event loop thread.
+
+    ``greet=False`` accepts connections but never sends the greeting, to
+    exercise client timeouts.
+    """
+
+    def __init__(self, greet=True):
+        self.greet = greet
+        self.messages = []
+        self.auth = []
+        self.envelope = []
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.handlers = set()
+
+    async def handle(self, reader, writer):
+        self.handlers.add(asyncio.current_task())
+        def reply(line):
+            writer.write(line.encode() + b'\r\n')
+
+        if not self.greet:
+            # Stay silent for longer than the client timeouts used in tests
+            await asyncio.sleep(0.5)
+            writer.close()
+            return
+        reply('220 localhost async stand-in')
+        while line := await reader.readline():
+            command, _, argument = line.decode().strip().partition(' ')
+            command = command.upper()
+            if command == 'EHLO':
+                reply('250-localhost')
+                reply('250 AUTH PLAIN')
+            elif command == 'AUTH':
+                self.auth.append(base64.b64decode(argument.split(' ', 1)[1]).decode())
+                reply('235 authenticated')
+            elif command in ('MAIL', 'RCPT'):
+                self.envelope.append(argument)
+                reply('250 OK')
+            elif command == 'DATA':
+                reply('354 end with .')
+                data = []
+                while (raw := await reader.readline()) not in (b'.\r\n', b''):
+                    data.append(raw)
+                self.messages.append(b''.join(data).decode())
+                reply('250 queued')
+            elif command == 'QUIT':
+                reply('221 bye')
+                break
+            await writer.drain()
+        writer.close()
+
+    def __enter__(self):
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, '127.0.0.1', 0), self.loop
+        ).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def shutdown(self):
+        self.server.close()
+        if self.handlers:
+            # Clients have hung up by now; let the handlers return
+            await asyncio.wait(self.handlers, timeout=2)
+        await self.server.wait_closed()
+
+    def settings(self, **overrides):
+        return override_settings(**{
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': '127.0.0.1',
+            'EMAIL_PORT': self.port,
+            'EMAIL_USE_TLS': False,
+            'EMAIL_HOST_USER': '',
+            'EMAIL_HOST_PASSWORD': '',
+            'EMAIL_CONNECT_TIMEOUT': 1,
+            'EMAIL_TIMEOUT': 1,
+            **overrides,
+        })
+
+
+class AsyncContactTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_client_sends_message(self):
+        email = mail.EmailMessage('Hi', '.leading dot\nbody', 'from@example.com', ['to@example.com'])
+
+        with AsyncSMTPStandIn() as smtp, smtp.settings(EMAIL_HOST_USER='user', EMAIL_HOST_PASSWORD='secret'):
+            self.assertEqual(await aiosmtp.send_message(email), 1)
+
+        self.assertEqual(smtp.auth, ['\0user\0secret'])
+        self.assertIn('..leading dot', smtp.messages[0])
+
+    async def test_envelope_carries_bare_addresses(self):
+        email = mail.EmailMessage('Hi', 'Body', 'Eben <from@example.com>', ['Ada Lovelace <to@example.com>'])
+
+        with AsyncSMTPStandIn() as smtp, smtp.settings():
+            self.assertEqual(await aiosmtp.send_message(email), 1)
+
+        self.assertEqual(smtp.envelope, ['FROM:<from@example.com>', 'TO:<to@example.com>'])
+        self.assertIn('From: Eben <from@example.com>', smtp.messages[0])
+
+    async def test_client_times_out_on_silent_server(self):
+        email = mail.EmailMessage('Hi', 'Body', 'from@example.com', ['to@example.com'])
+
+        with AsyncSMTPStandIn(greet=False) as smtp, smtp.settings(EMAIL_TIMEOUT=0.2):
+            with self.assertRaises(asyncio.TimeoutError):
+                await aiosmtp.send_message(email)
+
+    async def test_view_sends_without_queueing(self):
+        with AsyncSMTPStandIn() as smtp, smtp.settings():
+            response = await self.async_client.post(reverse('contact_async'), {
+                'name': 'Ada', 'email': 'ada@example.com', 'message': 'Hello there',
+            })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(smtp.messages), 1)
+        self.assertIn('Reply-To: ada@example.com', smtp.messages[0])
+        self.assertFalse(await OutboxMessage.objects.aexists())
+        self.assertEqual(await ContactSubmission.objects.acount(), 1)
+
+    def test_view_does_not_send_a_repeat_twice(self):
+        data = {'name': 'Ada', 'email': 'ada@example.com', 'message': 'Hello there'}
+        with AsyncSMTPStandIn() as smtp, smtp.settings():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('contact_async'), data)
+            self.client.post(reverse('contact_async'), data)
+
+        self.assertEqual(len(smtp.messages), 1)
+        self.assertEqual(ContactSubmission.objects.count(), 1)
+
+    async def test_view_queues_message_when_smtp_fails(self):
+        with AsyncSMTPStandIn(greet=False) as smtp, smtp.settings(EMAIL_TIMEOUT=0.2):
+            with self.assertLogs('backend.views', 'WARNING'):
+                await self.async_client.post(reverse('contact_async'), {
+                    'name': 'Ada', 'email': 'ada@example.com', 'message': 'Hello there',
+                })
+
+        self.assertEqual(await OutboxMessage.objects.acount(), 1)
+
+    async def test_view_rejects_invalid_form(self):
+        await self.async_client.post(reverse('contact_async'), {'name': 'Ada', 'email': 'nope', 'message': 'Hi'})
+
+        self.assertFalse(await OutboxMessage.objects.aexists())
+
+
+@override_settings(CONTACT_RATE_LIMIT_PER_IP=(2, 60), CONTACT_RATE_LIMIT_GLOBAL=(3, 60))
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.sent = 0
+
+    def post(self, ip, url='contact'):
+        self.sent += 1
+        return self.client.post(reverse(url), {
+            'name': 'Ada', 'email': 'ada@example.com', 'message': f'Hello there #{self.sent}',
+        }, REMOTE_ADDR=ip)
+
+    def test_per_ip_limit(self):
+        self.assertEqual(self.post('10.0.0.1').status_code, 302)
+        self.assertEqual(self.post('10.0.0.1').status_code, 302)
+
+        response = self.post('10.0.0.1')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+    def test_global_limit(self):
+        for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+            self.assertEqual(self.post(ip).status_code, 302)
+
+        self.assertEqual(self.post('10.0.0.4').status_code, 429)
+
+    def test_async_view_is_limited(self):
+        self.post('10.0.0.1', 'contact_async')
+        self.post('10.0.0.1', 'contact_async')
+
+        self.assertEqual(self.post('10.0.0.1', 'contact_async').status_code, 429)
+
+    def test_tokens_refill_over_the_period(self):
+        self.assertEqual(count_request('test', 1, 60, now=120.0), 0)
+        self.assertEqual(count_request('test', 1, 60, now=150.0), 30.0)
+        self.assertEqual(count_request('test', 1, 60, now=180.0), 0)
+
+    def test_burst_across_a_window_boundary_is_limited_to_the_capacity(self):
+        allowed = [count_request('burst', 2, 60, now=now) == 0 for now in (119.0, 119.5, 120.0, 120.5, 121.0)]
+        self.assertEqual(allowed, [True, True, False, False, False])
+        # One token back every 30 seconds after the first one was taken
+        self.assertEqual(count_request('burst', 2, 60, now=148.0), 1.0)
+        self.assertEqual(count_request('burst', 2, 60, now=149.0), 0)
+        self.assertGreater(count_request('burst', 2, 60, now=149.5), 0)
+
+    def test_idle_bucket_holds_no_more_than_the_capacity(self):
+        count_request('idle', 2, 60, now=0.0)
+        allowed = [count_request('idle', 2, 60, now=3600.0) == 0 for _ in range(4)]
+        self.assertEqual(allowed, [True, True, False, False])
+
+    def test_contended_bucket_is_limited(self):
+        cache.add('rl:busy:lock', 1)
+        with mock.patch('backend.cache.time.sleep') as sleep:
+            self.assertEqual(count_request('busy', 2, 60, now=120.0), 30.0)
+        self.assertTrue(sleep.called)
+        cache.delete('rl:busy:lock')
+        self.assertEqual(count_request('busy', 2, 60, now=120.0), 0)
+
+    @override_settings(RATELIMIT_PROXY_COUNT=1)
+    def test_client_ip_uses_trusted_proxy_entry(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2', REMOTE_ADDR='10.0.0.9')
+
+        self.assertEqual(client_ip(request), '2.2.2.2')
+
+
+@override_settings(CONTACT_DIGEST_ENABLED=True, CONTACT_DIGEST_MAX_MESSAGES=3, CONTACT_DIGEST_INTERVAL=10)
+class DigestModeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def submit(self, message='Hello there'):
+        self.client.post(reverse('contact'), {'name': 'Ada', 'email': 'ada@example.com', 'message': message})
+
+    def test_submissions_are_held(self):
+        self.submit()
+
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.HELD)
+        self.assertIsNone(flush_digest())
+
+    def test_urgent_messages_skip_the_digest(self):
+        self.submit('This is URGENT, please call')
+
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.PENDING)
+
+    def test_digest_sent_after_max_messages(self):
+        for i in range(4):
+            self.submit(f'Message {i}')
+
+        digest = flush_digest()
+
+        self.assertEqual(digest.status, OutboxMessage.PENDING)
+        self.assertEqual(digest.subject, 'Contact form digest: 3 new messages')
+        self.assertIn('Message 0', digest.body)
+        self.assertIn('Message 2', digest.body)
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.DIGESTED).count(), 3)
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.HELD).count(), 1)
+        self.assertIsNone(flush_digest())
+
+    def test_digest_sent_after_interval(self):
+        self.submit()
+        OutboxMessage.objects.update(created_at=timezone.now() - timedelta(minutes=11))
+
+        self.assertEqual(flush_digest().subject, 'Contact form digest: 1 new message')
+
+    def test_worker_flushes_and_delivers_digest(self):
+        for i in range(3):
+            self.submit(f'Message {i}')
+
+        with SMTPStandIn() as smtp, smtp.settings():
+            call_command('deliver_outbox', '--once', stdout=StringIO())
+
+        self.assertEqual(len(smtp.messages), 1)
+        self.assertIn('Contact form digest: 3 new messages', smtp.messages[0])
+
+    def test_worker_releases_held_messages_once_digest_mode_is_off(self):
+        for i in range(2):
+            self.submit(f'Message {i}')
+
+        with override_settings(CONTACT_DIGEST_ENABLED=False), SMTPStandIn() as smtp, smtp.settings():
+            call_command('deliver_outbox', '--once', '--concurrency=1', stdout=StringIO())
+
+        self.assertEqual(len(smtp.messages), 2)
+        self.assertNotIn('digest', smtp.messages[0])
+        self.assertFalse(OutboxMessage.objects.filter(status=OutboxMessage.HELD).exists())
+
+
+class DuplicateFilterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def submit(self, **data):
+        data = {'name': 'Ada', 'email': 'ada@example.com', 'message': 'Hello there', **data}
+        return self.client.post(reverse('contact'), data)
+
+    def test_repeat_submission_is_acknowledged_without_email(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.submit()
+        with self.assertLogs('backend.dedupe', 'INFO'):
+            response = self.submit(message='  hello   THERE ')
+
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_failed_submission_can_be_retried(self):
+        with mock.patch('backend.submissions.enqueue_contact_message', side_effect=OSError('disk full')), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.submit()
+        self.assertEqual(ContactSubmission.objects.count(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.submit()
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_failed_async_submission_can_be_retried(self):
+        # The sync client runs the async view on this thread's connection,
+        # where the on-commit callbacks are captured
+        data = {'name': 'Ada', 'email': 'ada@example.com', 'message': 'Hello there'}
+        with self.settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'), \
+                mock.patch('backend.submissions.enqueue_contact_message', side_effect=OSError('disk full')), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('contact_async'), data)
+        self.assertFalse(OutboxMessage.objects.exists())
+        # Rolled back with the failed enqueue
+        self.assertFalse(ContactSubmission.objects.exists())
+
+        with self.settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('contact_async'), data)
+            self.client.post(reverse('contact_async'), data)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_different_submissions_are_kept(self):
+        self.submit()
+        self.submit(message='Something else')
+
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+    def test_filter_expires_after_two_windows(self):
+        bloom = RotatingBloomFilter('test', window=60)
+        digest = fingerprint('Ada', 'ada@example.com', 'Hi')
+
+        self.assertFalse(bloom.check_and_add(digest, now=0))
+        self.assertTrue(bloom.check_and_add(digest, now=59))
+        self.assertTrue(bloom.check_and_add(digest, now=61))
+        self.assertFalse(bloom.check_and_add(digest, now=300))
+
+    def test_false_positive_rate_stays_low(self):
+        bloom = RotatingBloomFilter('test', window=60)
+        for i in range(2000):
+            bloom.check_and_add(fingerprint('n', f'{i}@example.com', 'm'), now=0)
+
+        false_positives = sum(
+            bloom.check_and_add(fingerprint('n', f'{i}@example.org', 'm'), now=0) for i in range(2000)
+        )
+        self.assertLess(false_positives, 20)
+
+
+class SubmissionAdminTests(TestCase):
+
+    def setUp(self):
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin_user)
+        self.submissions = [
+            ContactSubmission.objects.create(name=f'Visitor {i}', email=f'v{i}@example.com', message='Hi')
+            for i in range(5)
+        ]
+        self.url = reverse('admin:backend_contactsubmission_changelist')
+
+    def names(self, response):
+        return [s.name for s in response.context['cl'].result_list]
+
+    @mock.patch.object(ContactSubmissionAdmin, 'list_per_page', 2)
+    def test_keyset_pages(self):
+        first = self.client.get(self.url)
+        second = self.client.get(self.url + first.context['cl'].next_page_url)
+        last = self.client.get(self.url + second.context['cl'].next_page_url)
+
+        self.assertEqual(self.names(first), ['Visitor 4', 'Visitor 3'])
+        self.assertEqual(self.names(second), ['Visitor 2', 'Visitor 1'])
+        self.assertEqual(self.names(last), ['Visitor 0'])
+        self.assertIsNone(last.context['cl'].next_page_url)
+        self.assertContains(second, 'Newest')
+
+    def test_filters_apply_before_the_keyset(self):
+        ContactSubmission.objects.filter(pk=self.submissions[1].pk).update(status=ContactSubmission.SPAM)
+
+        response = self.client.get(self.url, {'status__exact': 'spam', 'before': self.submissions[4].pk})
+
+        self.assertEqual(self.names(response), ['Visitor 1'])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {'before': 'abc'})
+
+        self.assertEqual(response.status_code, 302)
+
+
+class SubmissionExportTests(TestCase):
+
+    def setUp(self):
+        admin_user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin_user)
+        now = timezone.now()
+        for i, days_ago in enumerate([10, 5, 1]):
+            ContactSubmission.objects.create(name=f'Visitor {i}', email=f'v{i}@example.com',
+                                             message=f'Line one\nLine, two {i}',
+                                             created_at=now - timedelta(days=days_ago))
+        self.url = reverse('admin:backend_contactsubmission_export')
+
+    def test_csv_export_streams(self):
+        response = self.client.get(self.url, {'format': 'csv'})
+
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines(keepends=True)))
+        self.assertEqual(rows[0], ['id', 'name', 'email', 'message', 'status', 'created_at'])
+        self.assertEqual([row[1] for row in rows[1:]], ['Visitor 0', 'Visitor 1', 'Visitor 2'])
+        self.assertEqual(rows[1][3], 'Line one\nLine, two 0')
+
+    def test_csv_cells_are_not_formulas(self):
+        ContactSubmission.objects.create(name='=HYPERLINK("http://evil.example","x")', email='e@example.com',
+                                         message='@SUM(1+1)', created_at=timezone.now())
+
+        response = self.client.get(self.url, {'format': 'csv'})
+
+        row = list(csv.reader(b''.join(response.streaming_content).decode().splitlines(keepends=True)))[-1]
+        self.assertEqual(row[1], '\'=HYPERLINK("http://evil.example","x")')
+        self.assertEqual(row[3], "'@SUM(1+1)")
+        self.assertEqual(row[2], 'e@example.com')
+
+    def test_gzipped_ndjson_export_with_date_range(self):
+        since = (timezone.now() - timedelta(days=7)).date().isoformat()
+
+        response = self.client.get(self.url, {'format': 'ndjson', 'gzip': '1', 'since': since})
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        records = [json.loads(line) for line in
+                   gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()]
+        self.assertEqual([r['name'] for r in records], ['Visitor 1', 'Visitor 2'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, 400)
+
+    def test_export_requires_staff(self):
+        self.client.logout()
+
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_management_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'export.csv.gz')
+            call_command('export_submissions', '--gzip', '-o', path)
+            with gzip.open(path, 'rt') as f:
+                self.assertEqual(len(list(csv.reader(f))), 4)
+
+
+class SubmissionSearchTests(TestCase):
+
+    def setUp(self):
+        self.kubernetes = ContactSubmission.objects.create(
+            name='Grace', email='grace@example.com', message='Question about Kubernetes networking')
+        self.both = ContactSubmission.objects.create(
+            name='Kubernetes Fan', email='fan@example.com', message='Kubernetes and Terraform work')
+        self.other = ContactSubmission.objects.create(
+            name='Alan', email='alan@example.com', message='Hiring for a security role')
+
+    def ids(self, text):
+        return [pk for pk, _ in search_submissions(text)]
+
+    def test_ranked_matches(self):
+        # The name match weighs more than a message-only match
+        self.assertEqual(self.ids('kubernetes'), [self.both.pk, self.kubernetes.pk])
+        self.assertEqual(self.ids('terraform kube'), [self.both.pk])
+        self.assertEqual(self.ids('"); DROP TABLE'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.other.message = 'Now about Kubernetes too'
+        self.other.save()
+        self.kubernetes.delete()
+
+        self.assertEqual(set(self.ids('kubernetes')), {self.both.pk, self.other.pk})
+        self.assertEqual(self.ids('hiring'), [])
+
+    def test_admin_search(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'a@example.com', 'pw'))
+
+        changelist = self.client.get(reverse('admin:backend_contactsubmission_changelist'), {'q': 'kubernetes'})
+        api = self.client.get(reverse('admin:backend_contactsubmission_search'), {'q': 'kubernetes'}).json()
+
+        self.assertEqual([s.pk for s in changelist.context['cl'].result_list], [self.both.pk, self.kubernetes.pk])
+        self.assertEqual([r['id'] for r in api['results']], [self.both.pk, self.kubernetes.pk])
+        self.assertGreater(api['results'][0]['rank'], api['results'][1]['rank'])
+
+
+class ContactAPITests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('contact_api')
+
+    def post(self, data, content_type='application/json'):
+        return self.client.post(self.url, json.dumps(data) if content_type == 'application/json' else data,
+                                content_type=content_type)
+
+    def test_valid_submission_returns_202(self):
+        response = self.post({'name': 'Ada', 'email': 'ada@example.com', 'message': 'Hello', 'company': 'X'})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'status': 'accepted'})
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertEqual(ContactSubmission.objects.count(), 1)
+
+    def test_field_errors(self):
+        response = self.post({'name': 'Ada', 'email': 'not-an-email'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'email', 'message'})
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_rejects_non_json(self):
+        response = self.client.post(self.url, {'name': 'Ada', 'email': 'ada@example.com', 'message': 'Hi'})
+
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(self.client.post(self.url, '[1, 2]', content_type='application/json').status_code, 400)
+
+    def test_csrf_token_not_required(self):
+        client = self.client_class(enforce_csrf_checks=True)
+
+        response = client.post(self.url, json.dumps({'name': 'Ada', 'email': 'ada@example.com', 'message': 'Hi'}),
+                               content_type='application/json')
+
+        self.assertEqual(response.status_code, 202)
+
+    @override_settings(CONTACT_RATE_LIMIT_PER_IP=(1, 60))
+    def test_rate_limited_response_is_json(self):
+        self.post({'name': 'Ada', 'email': 'ada@example.com', 'message': 'One'})
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.post({'name': 'Ada', 'email': 'ada@example.com', 'message': 'Two'})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('error', response.json())
+
+
+class SQLitePragmaTests(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_to_connections(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('temp_store'), 2)  # MEMORY
+
+    def test_journal_mode_on_file_database(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            wrapper = connections.create_connection('default')
+            wrapper.settings_dict = dict(wrapper.settings_dict, NAME=os.path.join(tmp, 'db.sqlite3'))
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+            finally:
+                wrapper.close()
+
+
+class DatabasePoolTests(TestCase):
+
+    def connect(self):
+        return sqlite3.connect(':memory:', check_same_thread=False)
+
+    def tearDown(self):
+        dbpool.close_pools()
+
+    def test_wrapper_returns_connections_to_pool(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            settings_dict = dict(
+                connections['default'].settings_dict,
+                ENGINE='backend.dbpool.sqlite3',
+                NAME=os.path.join(tmp, 'pooled.sqlite3'),
+                CONN_MAX_AGE=0,
+                POOL={'MIN_SIZE': 1, 'MAX_SIZE': 2},
+            )
+            wrapper = PooledSQLiteWrapper(settings_dict, alias='pooltest')
+            wrapper.ensure_connection()
+            raw = wrapper.connection
+            self.assertFalse(wrapper.pool_reused)
+            wrapper.close()
+
+            with wrapper.cursor() as cursor:
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], 5000)
+            self.assertIs(wrapper.connection, raw)
+            self.assertTrue(wrapper.pool_reused)
+            wrapper.close()
+
+            stats = dbpool.get_metrics()['pooltest']
+            self.assertEqual(stats['connections_opened'], 1)
+            self.assertEqual(stats['connections_reused'], 1)
+            self.assertEqual((stats['in_use'], stats['idle']), (0, 1))
+
+    def test_bounded_wait(self):
+        pool = dbpool.ConnectionPool(min_size=0, max_size=1, timeout=0.05)
+        held, _ = pool.acquire(self.connect)
+        with self.assertRaises(dbpool.PoolTimeout):
+            pool.acquire(self.connect)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+        pool.timeout = 5
+        threading.Timer(0.05, pool.release, [held]).start()
+        connection, reused = pool.acquire(self.connect)
+        self.assertIs(connection, held)
+        self.assertTrue(reused)
+        self.assertGreater(pool.stats()['wait_seconds_max'], 0.01)
+        pool.release(connection)
+        pool.close()
+
+    def test_health_check_replaces_broken_connections(self):
+        pool = dbpool.ConnectionPool(min_size=0, max_size=1, health_check_after=0)
+        broken, _ = pool.acquire(self.connect)
+        pool.release(broken)
+        broken.close()
+
+        connection, reused = pool.acquire(self.connect)
+        self.assertIsNot(connection, broken)
+        self.assertFalse(reused)
+        stats = pool.stats()
+        self.assertEqual(stats['health_check_failures'], 1)
+        self.assertEqual(stats['size'], 1)
+        pool.release(connection)
+        pool.close()
+
+    def test_min_size_and_idle_reaping(self):
+        pool = dbpool.ConnectionPool(min_size=2, max_size=4, max_idle=0)
+        first, _ = pool.acquire(self.connect)
+        self.assertEqual(pool.stats()['size'], 2)
+        second, _ = pool.acquire(self.connect)
+        third, _ = pool.acquire(self.connect)
+        for connection in (first, second, third):
+            pool.release(connection)
+        # Spare connections past max_idle are closed, down to min_size
+        self.assertEqual(pool.stats()['size'], 2)
+        pool.close()
+
+    def test_metrics_view_is_staff_only(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'a@example.com', 'pw'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('database_pools', response.json())
+        self.assertIn('email_pools', response.json())
+
+
+@override_settings(
+    QUERY_INSTRUMENTATION_ENABLED=True,
+    QUERY_INSTRUMENTATION_SAMPLE_RATE=1.0,
+    QUERY_INSTRUMENTATION_HEADERS=True,
+    QUERY_INSTRUMENTATION_REPEAT_THRESHOLD=5,
+)
+class QueryInstrumentationTests(TestCase):
+
+    def n_plus_one_view(self, request):
+        for pk in range(6):
+            ContactSubmission.objects.filter(pk=pk).exists()
+        return HttpResponse('ok')
+
+    def test_statement_shape(self):
+        self.assertEqual(
+            statement_shape('SELECT * FROM t WHERE id IN (%s, %s, %s) AND n = 10 AND s = \'x\''),
+            'SELECT * FROM t WHERE id IN (%s, ...) AND n = ? AND s = ?',
+        )
+
+    def test_recorder_counts_repeated_shapes(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            self.n_plus_one_view(None)
+            ContactSubmission.objects.count()
+        summary = recorder.summary(slowest=2, repeat_threshold=5)
+        self.assertEqual(summary['count'], 7)
+        self.assertEqual(len(summary['slowest']), 2)
+        self.assertEqual(len(summary['repeated']), 1)
+        self.assertEqual(summary['repeated'][0][1], 6)
+
+    def test_logs_and_headers(self):
+        middleware = QueryInstrumentationMiddleware(self.n_plus_one_view)
+        with self.assertLogs('backend.queries', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/report/'))
+        self.assertIn('Possible N+1 on GET /report/: 6 x', logs.output[0])
+        self.assertEqual(response['X-DB-Query-Count'], '6')
+        self.assertEqual(response['X-DB-Repeated-Queries'], '6')
+        self.assertIn('X-DB-Time-Ms', response)
+
+    def test_unsampled_requests_are_untouched(self):
+        with override_settings(QUERY_INSTRUMENTATION_SAMPLE_RATE=0):
+            middleware = QueryInstrumentationMiddleware(self.n_plus_one_view)
+        response = middleware(RequestFactory().get('/report/'))
+        self.assertNotIn('X-DB-Query-Count', response)
+
+
+def _increment_shared_counter(location, options, times):
+    shared = SharedMemoryCache(location, {'OPTIONS': options})
+    for _ in range(times):
+        shared.incr('counter')
+
+
+def _take_shared_tokens(location, options, times):
+    shared = SharedMemoryCache(location, {'OPTIONS': options})
+    for _ in range(times):
+        shared.update('tokens', lambda taken: (taken + 1, None))
+
+
+class SharedMemoryCacheTests(TestCase):
+    options = {'SLOTS': 64, 'SLOT_SIZE': 512, 'WAYS': 4}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.tmp.name, 'cache')
+        self.cache = SharedMemoryCache(self.location, {'OPTIONS': self.options})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_basic_operations(self):
+        shared = self.cache
+        self.assertIsNone(shared.get('missing'))
+        shared.set('key', {'value': [1, 2, 3]})
+        self.assertEqual(shared.get('key'), {'value': [1, 2, 3]})
+        self.assertFalse(shared.add('key', 'other'))
+        self.assertTrue(shared.add('new', 1))
+        self.assertEqual(shared.incr('new', 4), 5)
+        self.assertTrue(shared.delete('key'))
+        self.assertFalse(shared.has_key('key'))
+        with self.assertRaises(ValueError):
+            shared.incr('key')
+
+        shared.set('short', 'lived', timeout=60)
+        with mock.patch('backend.cache.shm.time.time', return_value=time.time() + 61):
+            self.assertIsNone(shared.get('short'))
+        shared.set('gone', 'now', timeout=0)
+        self.assertFalse(shared.has_key('gone'))
+
+        shared.clear()
+        self.assertIsNone(shared.get('new'))
+
+    def test_visible_to_other_instances(self):
+        self.cache.set('key', 'shared')
+        other = SharedMemoryCache(self.location, {'OPTIONS': self.options})
+        self.assertEqual(other.get('key'), 'shared')
+
+    def test_large_values_are_compressed_or_skipped(self):
+        self.cache.set('compressible', 'x' * 5000)
+        self.assertEqual(self.cache.get('compressible'), 'x' * 5000)
+        self.cache.set('too_big', os.urandom(2000))
+        self.assertIsNone(self.cache.get('too_big'))
+        self.assertEqual(self.cache.stats()['oversize'], 1)
+
+    def test_clock_eviction_keeps_recently_read_entries(self):
+        shared = SharedMemoryCache(self.location, {'OPTIONS': {'SLOTS': 4, 'SLOT_SIZE': 512, 'WAYS': 4}})
+        for key in 'abcd':
+            shared.set(key, key)
+        shared.get('a')
+        shared.set('e', 'e')
+        self.assertEqual(shared.get('a'), 'a')
+        self.assertIsNone(shared.get('b'))
+        self.assertEqual(shared.get('e'), 'e')
+        self.assertEqual(shared.stats()['evictions'], 1)
+
+    def test_incr_is_atomic_across_processes_and_threads(self):
+        import multiprocessing
+
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_increment_shared_counter, args=(self.location, self.options, 200))
+            for _ in range(3)
+        ]
+        threads = [
+            threading.Thread(target=_increment_shared_counter, args=(self.location, self.options, 200))
+            for _ in range(3)
+        ]
+        for worker in workers + threads:
+            worker.start()
+        for worker in workers + threads:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 1200)
+
+    def test_update_is_atomic_across_processes_and_threads(self):
+        import multiprocessing
+
+        self.cache.set('tokens', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_take_shared_tokens, args=(self.location, self.options, 200))
+            for _ in range(3)
+        ]
+        threads = [
+            threading.Thread(target=_take_shared_tokens, args=(self.location, self.options, 200))
+            for _ in range(3)
+        ]
+        for worker in workers + threads:
+            worker.start()
+        for worker in workers + threads:
+            worker.join()
+        self.assertEqual(self.cache.get('tokens'), 1200)
+
+    def test_update_can_leave_the_entry_alone(self):
+        self.assertEqual(self.cache.update('key', lambda value: (None, value)), None)
+        self.assertFalse(self.cache.has_key('key'))
+        self.assertEqual(self.cache.update('key', lambda value: ('new', value)), None)
+        self.assertEqual(self.cache.update('key', lambda value: (None, value)), 'new')
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-default'},
+    'l2': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-l2'},
+})
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        self.tiered = TieredCache('tiered-test-%s' % self._testMethodName, {'OPTIONS': {'L2': 'l2', 'L1_TIMEOUT': 5}})
+        self.l2 = caches['l2']
+        self.l2.clear()
+
+    def test_reads_fill_l1_with_short_ttl(self):
+        self.tiered.set('key', ['value'])
+        made = self.tiered.make_key('key')
+        self.assertEqual(self.l2.get(made), ['value'])
+
+        self.l2.delete(made)
+        value = self.tiered.get('key')
+        self.assertEqual(value, ['value'])
+        value.append('mutated')
+        self.assertEqual(self.tiered.get('key'), ['value'])
+
+        later = time.monotonic() + 6
+        with mock.patch('backend.cache.tiered.time.monotonic', return_value=later):
+            self.assertIsNone(self.tiered.get('key'))
+
+        self.l2.set(made, 'refilled')
+        self.assertEqual(self.tiered.get('key'), 'refilled')
+        stats = self.tiered.stats()
+        self.assertEqual((stats['l1_hits'], stats['l1_misses']), (2, 2))
+        self.assertEqual((stats['l2_hits'], stats['l2_misses']), (1, 1))
+
+    def test_counters_stay_in_l2(self):
+        self.assertTrue(self.tiered.add('count', 1))
+        self.assertFalse(self.tiered.add('count', 1))
+        self.assertEqual(self.tiered.incr('count'), 2)
+        self.assertEqual(self.tiered.get('count'), 2)
+        self.assertEqual(self.tiered.get_many(['count', 'missing']), {'count': 2})
+        self.assertEqual(self.tiered.update('count', lambda count: (count + 1, count + 1)), 3)
+        self.assertEqual(self.tiered.get('count'), 3)
+
+    def test_keys_are_namespaced_by_deploy(self):
+        with mock.patch('backend.cache.tiered.deploy_version', return_value='old'):
+            self.tiered.set('page', 'old page')
+            self.assertEqual(self.tiered.get('page'), 'old page')
+        with mock.patch('backend.cache.tiered.deploy_version', return_value='new'):
+            self.assertIsNone(self.tiered.get('page'))
+
+    def test_deploy_version_sources(self):
+        deploy_version.cache_clear()
+        self.addCleanup(deploy_version.cache_clear)
+        with override_settings(DEPLOY_VERSION='release-42'):
+            self.assertEqual(deploy_version(), 'release-42')
+        deploy_version.cache_clear()
+        with mock.patch.dict(os.environ, {'RENDER_GIT_COMMIT': '0123456789abcdef'}):
+            self.assertEqual(deploy_version(), '0123456789ab')
+
+
+class WarmCachesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_prerenders_pages_into_page_cache(self):
+        out = StringIO()
+        call_command('warm_caches', tasks=['templates', 'pages'], hosts=['testserver'], scheme='http', stdout=out)
+        self.assertIn('pages          1 done', out.getvalue())
+
+        page_cache = stale_cache('default')
+        key = get_cache_key(RequestFactory().get('/'), method='GET', cache=page_cache)
+        self.assertIsNotNone(key)
+        self.assertEqual(page_cache.get(key).status_code, 200)
+
+    def test_compresses_stale_static_files(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'app.css')
+            with open(path, 'w') as f:
+                f.write('body { color: red; }\n' * 200)
+            with override_settings(STATIC_ROOT=root):
+                out = StringIO()
+                call_command('warm_caches', tasks=['static'], stdout=out)
+                self.assertIn('static         1 done', out.getvalue())
+                self.assertTrue(os.path.exists(path + '.gz'))
+
+                out = StringIO()
+                call_command('warm_caches', tasks=['static'], stdout=out)
+                self.assertIn('static         0 done', out.getvalue())
+
+    def test_strict_fails_on_errors(self):
+        with self.assertRaises(CommandError):
+            call_command('warm_caches', tasks=['pages'], hosts=['testserver'], paths=['/missing/'],
+                         scheme='http', strict=True, stdout=StringIO(), stderr=StringIO())
+
+
+@override_settings(CACHE_MIDDLEWARE_SECONDS=60, CACHE_MIDDLEWARE_STALE_SECONDS=600)
+class StaleWhileRevalidateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.get('/')
+        self.later = time.time() + 61
+
+    def test_fresh_pages_come_from_cache(self):
+        with mock.patch('backend.views.render') as render:
+            response = self.client.get('/')
+        render.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+
+    def test_stale_page_served_while_one_request_regenerates(self):
+        with mock.patch('backend.middleware.time.time', return_value=self.later):
+            response = self.client.get('/')
+            self.assertEqual(response.status_code, 200)
+            response.wsgi_request._cache_revalidation.result(timeout=5)
+
+            # The background render stored a fresh copy and released the lock
+            response = self.client.get('/')
+            self.assertFalse(hasattr(response.wsgi_request, '_cache_revalidation'))
+        self.assertEqual([key for key in cache._cache if 'revalidating' in key], [])
+
+    def test_single_flight_across_threads(self):
+        middleware = StaleFetchFromCacheMiddleware(lambda request: HttpResponse('rendered'))
+        submitted = []
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda *args: submitted.append(args)
+        barrier = threading.Barrier(8)
+
+        def fetch():
+            request = RequestFactory().get('/')
+            barrier.wait()
+            self.assertIsNotNone(middleware.process_request(request))
+
+        with mock.patch('backend.middleware.time.time', return_value=self.later), \
+                mock.patch('backend.middleware._revalidation_executor', return_value=executor):
+            threads = [threading.Thread(target=fetch) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(submitted), 1)
+        self.assertTrue(submitted[0][1][REVALIDATE_FLAG])
+
+    def test_revalidation_request_bypasses_cache(self):
+        middleware = StaleFetchFromCacheMiddleware(lambda request: HttpResponse('rendered'))
+        request = RequestFactory().get('/', **{REVALIDATE_FLAG: True})
+        self.assertIsNone(middleware.process_request(request))
+        self.assertTrue(request._cache_update_cache)
+
+
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        from PIL import Image
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = os.path.join(self.tmp.name, 'source')
+        self.output = os.path.join(self.tmp.name, 'out')
+        os.makedirs(os.path.join(self.source, 'photos'))
+        # Stored landscape, EXIF says rotate to portrait
+        photo = Image.new('RGB', (120, 80), (200, 30, 30))
+        exif = photo.getexif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Camera Maker'
+        photo.save(os.path.join(self.source, 'photos', 'me.jpg'), exif=exif)
+        Image.new('RGBA', (60, 60), (0, 0, 255, 128)).save(os.path.join(self.source, 'logo.png'))
+
+        overrides = override_settings(
+            IMAGE_DERIVATIVE_WIDTHS={'small': 40, 'big': 400},
+            IMAGE_DERIVATIVE_FORMATS=['webp', 'jpeg'],
+            IMAGE_DERIVATIVE_MIN_WIDTH=10,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def build(self, **kwargs):
+        return build_derivatives([self.source], self.output, workers=1, **kwargs)
+
+    def test_writes_derivatives_and_manifest(self):
+        from PIL import Image
+
+        built, skipped, removed, failed = self.build()
+        self.assertEqual(sorted(built), ['logo.png', 'photos/me.jpg'])
+
+        with Image.open(os.path.join(self.output, 'photos', 'me_small.jpg')) as small:
+            self.assertEqual(small.size, (40, 60))  # rotated, then resized
+            self.assertEqual(len(small.getexif()), 0)
+            self.assertTrue(small.info.get('progressive'))
+        with Image.open(os.path.join(self.output, 'photos', 'me_big.webp')) as big:
+            self.assertEqual(big.size, (80, 120))  # never upscaled
+        with Image.open(os.path.join(self.output, 'logo_small.webp')) as logo:
+            self.assertEqual(logo.mode, 'RGBA')
+
+        with open(os.path.join(self.output, 'manifest.json')) as f:
+            manifest = json.load(f)
+        entry = manifest['images']['photos/me.jpg']
+        self.assertEqual((entry['width'], entry['height']), (80, 120))
+        self.assertEqual(len(entry['derivatives']), 4)
+
+    def test_skips_unchanged_and_prunes_removed_images(self):
+        from PIL import Image
+
+        self.build()
+        built, skipped, removed, failed = self.build()
+        self.assertEqual((built, sorted(skipped)), ([], ['logo.png', 'photos/me.jpg']))
+
+        Image.new('RGBA', (60, 60), (0, 255, 0, 255)).save(os.path.join(self.source, 'logo.png'))
+        os.remove(os.path.join(self.source, 'photos', 'me.jpg'))
+        built, skipped, removed, failed = self.build()
+        self.assertEqual((built, removed), (['logo.png'], ['photos/me.jpg']))
+        self.assertFalse(os.path.exists(os.path.join(self.output, 'photos', 'me_small.jpg')))
+
+    def test_unreadable_images_are_reported_once(self):
+        with open(os.path.join(self.source, 'icon.png'), 'w') as f:
+            f.write('<svg xmlns="http://www.w3.org/2000/svg"/>')
+        failed = self.build()[3]
+        self.assertEqual([name for name, _ in failed], ['icon.png'])
+        self.assertEqual(self.build()[3], [])
+
+
+class ResizedImageTests(TestCase):
+
+    def setUp(self):
+        from PIL import Image
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.static_dir = os.path.join(tmp.name, 'static')
+        os.makedirs(os.path.join(self.static_dir, 'photos'))
+        Image.new('RGB', (800, 600), (10, 120, 200)).save(os.path.join(self.static_dir, 'photos', 'big.jpg'))
+
+        overrides = override_settings(
+            STATICFILES_DIRS=[self.static_dir],
+            IMAGE_CACHE_DIR=os.path.join(tmp.name, 'cache'),
+            IMAGE_RESIZE_WIDTHS=[320, 1024],
+            IMAGE_RESIZE_FORMATS=['webp', 'jpeg'],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch.object(imagecache, '_renderer', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_resizes_and_caches(self):
+        from PIL import Image
+
+        url = reverse('resized_image', args=[320, 'webp', 'photos/big.jpg'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (320, 240))
+
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # Never upscaled
+        response = self.client.get(reverse('resized_image', args=[1024, 'jpeg', 'photos/big.jpg']))
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (800, 600))
+
+    def test_versioned_urls_are_immutable(self):
+        url = imagecache.resized_image_url('photos/big.jpg', 320, 'jpeg')
+        self.assertIn('?v=', url)
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_rejects_unlisted_sizes_and_paths(self):
+        for args in ([321, 'webp', 'photos/big.jpg'], [320, 'gif', 'photos/big.jpg'],
+                     [320, 'webp', 'photos/missing.jpg'], [320, 'webp', '../static/photos/big.jpg']):
+            with self.subTest(args=args):
+                self.assertEqual(self.client.get(reverse('resized_image', args=args)).status_code, 404)
+
+    def test_concurrent_requests_share_one_render(self):
+        cache_dir = os.path.join(self.static_dir, 'variants')
+        renderer = imagecache.VariantRenderer(imagecache.DiskCache(cache_dir, 10 ** 6), workers=2)
+        source = os.path.join(self.static_dir, 'photos', 'big.jpg')
+        barrier = threading.Barrier(6)
+        results = []
+
+        def slow_render(*args):
+            time.sleep(0.1)
+            return b'variant'
+
+        def fetch():
+            barrier.wait()
+            results.append(renderer.get(source, 320, 'webp'))
+
+        with mock.patch('backend.imagecache.render_variant', side_effect=slow_render) as render:
+            threads = [threading.Thread(target=fetch) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(len(set(results)), 1)
+
+    def test_disk_cache_evicts_least_recently_used(self):
+        disk = imagecache.DiskCache(os.path.join(self.static_dir, 'lru'), max_bytes=250)
+        for i, name in enumerate(['a.webp', 'b.webp']):
+            path = disk.put(name, b'x' * 100)
+            os.utime(path, (1000 + i, 1000 + i))
+        disk.get('a.webp')  # now the most recently used
+        disk.put('c.webp', b'x' * 100)
+        self.assertEqual(sorted(os.listdir(disk.directory)), ['a.webp', 'c.webp'])
+
+
+class ImageIndexTests(TestCase):
+
+    def setUp(self):
+        from PIL import Image
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        static_dir = os.path.join(tmp.name, 'static')
+        os.makedirs(os.path.join(static_dir, 'photos'))
+        os.makedirs(os.path.join(static_dir, 'plain'))
+        photo = Image.new('RGB', (800, 600), (10, 120, 200))
+        photo.paste((250, 250, 250), (0, 0, 100, 100))
+        # PNG so the dominant colour comes back exact
+        photo.save(os.path.join(static_dir, 'photos', 'big.png'))
+        photo.save(os.path.join(static_dir, 'plain', 'wide.jpg'))
+        Image.new('RGBA', (32, 32), (0, 0, 0, 0)).save(os.path.join(static_dir, 'plain', 'icon.png'))
+
+        overrides = override_settings(
+            STATICFILES_DIRS=[static_dir],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            IMAGE_SOURCE_DIRS=[os.path.join(static_dir, 'photos')],
+            IMAGE_DERIVATIVE_ROOT=os.path.join(static_dir, 'responsive'),
+            IMAGE_INDEX_PATH=os.path.join(tmp.name, 'index.json'),
+            IMAGE_DERIVATIVE_WIDTHS={'small': 320},
+            IMAGE_DERIVATIVE_FORMATS=['webp', 'jpeg'],
+            IMAGE_RESIZE_WIDTHS=[320, 1024],
+            IMAGE_RESIZE_FORMATS=['webp', 'jpeg'],
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        image_index.cache_clear()
+        self.addCleanup(image_index.cache_clear)
+        build_derivatives(workers=1)
+        self.indexed, self.failed = build_index()
+
+    def render(self, source):
+        return Template('{% load responsive_images %}' + source).render(Context())
+
+    def test_index_records_dimensions_colour_and_placeholder(self):
+        from PIL import Image
+
+        self.assertEqual(self.indexed, ['photos/big.png', 'plain/icon.png', 'plain/wide.jpg'])
+        entry = image_index()['photos/big.png']
+        self.assertEqual((entry['width'], entry['height']), (800, 600))
+        self.assertEqual(entry['color'], '#0a78c8')
+        self.assertEqual(entry['hash'], imagecache.source_hash(imagecache.find_source('photos/big.png')))
+        header, data = entry['lqip'].split(',', 1)
+        self.assertEqual(header, 'data:image/webp;base64')
+        with Image.open(BytesIO(base64.b64decode(data))) as placeholder:
+            self.assertEqual(placeholder.size, (16, 12))
+        self.assertEqual(
+            [(d['name'], d['format']) for d in entry['derivatives']],
+            [('responsive/big_small.webp', 'webp'), ('responsive/big_small.jpg', 'jpeg')],
+        )
+
+    def test_picture_tag_uses_derivatives_and_reserves_space(self):
+        image_index()
+        # The index is already in memory: rendering must not read any file
+        with mock.patch('builtins.open', side_effect=AssertionError('filesystem access')):
+            html = self.render("{% picture 'photos/big.png' alt='Me' sizes='50vw' class='hero' %}")
+        self.assertIn('<source type="image/webp" srcset="/static/responsive/big_small.webp 320w" sizes="50vw">', html)
+        self.assertIn('width="800" height="600" alt="Me" loading="lazy"', html)
+        self.assertIn('class="hero"', html)
+        self.assertIn('srcset="/static/responsive/big_small.jpg 320w"', html)
+        self.assertIn('background:#0a78c8 url(data:image/webp;base64,', html)
+
+    def test_picture_tag_falls_back_to_on_demand_resizing(self):
+        html = self.render("{% picture 'plain/wide.jpg' %}")
+        version = image_index()['plain/wide.jpg']['hash']
+        self.assertIn(f'/img/320/webp/plain/wide.jpg?v={version} 320w, '
+                      f'/img/1024/webp/plain/wide.jpg?v={version} 800w', html)
+
+        icon = self.render("{% picture 'plain/icon.png' alt='' %}")
+        self.assertNotIn('<picture>', icon)
+        self.assertNotIn('background', icon)  # transparent: no placeholder
+        self.assertIn('width="32" height="32"', icon)
+
+        missing = self.render("{% picture 'plain/missing.jpg' alt='x' %}")
+        self.assertEqual(missing, '<img src="/static/plain/missing.jpg" alt="x" loading="lazy" decoding="async">')
+
+
+class IncrementalStaticFilesTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.source = os.path.join(tmp.name, 'static')
+        os.makedirs(os.path.join(self.source, 'css'))
+        self.write('img/logo.png', b'\x89PNG first')
+        self.write('css/base.css', b'.logo { background: url("../img/logo.png"); }')
+        self.write('css/site.css', b'@import url("base.css");')
+        self.write('app.js', b'console.log(1);' * 50)
+
+        overrides = override_settings(
+            DEBUG=False,
+            STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATIC_ROOT=os.path.join(tmp.name, 'root'),
+            STATICFILES_BUILD_CACHE=os.path.join(tmp.name, 'build-cache.json'),
+            STATICFILES_COMPRESS_WORKERS=2,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'backend.storage.IncrementalManifestStaticFilesStorage'},
+            },
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def write(self, name, content):
+        path = os.path.join(self.source, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def collect(self):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(settings.STATIC_ROOT, 'staticfiles.json')) as f:
+            return staticfiles_storage.build_stats, json.load(f)['paths']
+
+    def test_only_changed_files_and_their_dependents_are_reprocessed(self):
+        stats, first = self.collect()
+        self.assertEqual((stats['processed'], stats['reused']), (4, 0))
+        self.assertTrue(os.path.exists(os.path.join(settings.STATIC_ROOT, first['app.js'] + '.gz')))
+
+        stats, second = self.collect()
+        self.assertEqual((stats['processed'], stats['reused'], stats['compressed']), (0, 4, 0))
+        self.assertEqual(second, first)
+
+        # The image changes, so both stylesheets pointing at it (one indirectly) get new names
+        self.write('img/logo.png', b'\x89PNG second')
+        stats, third = self.collect()
+        self.assertEqual((stats['processed'], stats['reused']), (3, 1))
+        self.assertEqual(third['app.js'], first['app.js'])
+        for name in ('img/logo.png', 'css/base.css', 'css/site.css'):
+            self.assertNotEqual(third[name], first[name])
+        with open(os.path.join(settings.STATIC_ROOT, third['css/site.css'])) as f:
+            self.assertIn(os.path.basename(third['css/base.css']), f.read())
+
+    def test_missing_output_is_rebuilt(self):
+        _, first = self.collect()
+        os.remove(os.path.join(settings.STATIC_ROOT, first['app.js']))
+        stats, second = self.collect()
+        self.assertEqual(stats['processed'], 1)
+        self.assertTrue(os.path.exists(os.path.join(settings.STATIC_ROOT, second['app.js'])))
+
+
+class CachedStaticFilesStorageTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        source = os.path.join(tmp.name, 'static')
+        os.makedirs(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'site.css'), 'w') as f:
+            f.write('body { color: #333; }')
+
+        overrides = override_settings(
+            DEBUG=False,
+            STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATIC_ROOT=os.path.join(tmp.name, 'root'),
+            STATICFILES_BUILD_CACHE=os.path.join(tmp.name, 'build-cache.json'),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_urls_resolve_from_a_manifest_read_once(self):
+        from django.templatetags.static import static
+
+        with mock.patch.object(CachedStaticFilesStorage, 'read_manifest', autospec=True,
+                               side_effect=CachedStaticFilesStorage.read_manifest) as read:
+            storages = [CachedStaticFilesStorage(), CachedStaticFilesStorage()]
+        self.assertLessEqual(read.call_count, 1)
+
+        url = static('css/site.css')
+        self.assertRegex(url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+        with mock.patch('builtins.open', side_effect=AssertionError('filesystem access')), \
+                mock.patch('os.stat', side_effect=AssertionError('filesystem access')):
+            self.assertEqual(storages[1].url('css/site.css'), url)
+            self.assertEqual(static('css/missing.css'), '/static/css/missing.css')
+
+        storage = storages[0]
+        self.assertEqual(storage.cache_control(url[len('/static/'):]), 'public, max-age=31536000, immutable')
+        self.assertEqual(storage.cache_control('css/site.css'), 'public, max-age=3600')
+
+        headers = {}
+        add_static_headers(headers, '/unused', url)
+        self.assertEqual(headers['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_debug_urls_carry_a_version_that_earns_long_caching(self):
+        from django.templatetags.static import static
+
+        with self.settings(DEBUG=True):
+            url = static('css/site.css')
+            self.assertRegex(url, r'^/static/css/site\.css\?v=[0-9a-f]+$')
+            document_root = settings.STATICFILES_DIRS[0]
+            request = RequestFactory().get(url)
+            response = views.cached_static_serve(request, 'css/site.css', document_root)
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+            response = views.cached_static_serve(RequestFactory().get('/static/css/site.css?v=old'),
+                                                 'css/site.css', document_root)
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+            response = views.cached_static_serve(
+                RequestFactory().get(url, HTTP_IF_NONE_MATCH=response['ETag']), 'css/site.css', document_root,
+            )
+            self.assertEqual(response.status_code, 304)
+
+
+
+class CSSPruneTests(TestCase):
+
+    def test_prunes_rules_nothing_matches_and_minifies_the_rest(self):
+        css = """
+            @import url("fonts.css");
+            .nav a:hover, .unused > li { color: red; }
+            #hero .title::before { content: "a  b"; }
+            .missing { display: none }
+            input[type="text"]:not(.missing) { border : 1px  solid #ccc !important ; }
+            @media (max-width: 600px) { .gone { margin: 0 } }
+            @media print { .nav { display : none } }
+            @keyframes spin { to { transform: rotate(360deg) } }
+            @keyframes pulse { to { opacity: 0 } }
+            .loader.spinning { animation: spin 1s linear infinite; }
+        """
+        nodes, seen, removed = prune(parse(css), {'nav', 'title', 'loader', 'spinning'}, {'hero'}, [])
+        self.assertEqual((seen, removed), (7, 2))
+        self.assertEqual(serialize(drop_unused_keyframes(nodes)), (
+            '@import url("fonts.css");'
+            '.nav a:hover{color:red}'
+            '#hero .title::before{content:"a  b"}'
+            'input[type="text"]:not(.missing){border:1px solid #ccc!important}'
+            '@media print{.nav{display:none}}'
+            '@keyframes spin{to{transform:rotate(360deg)}}'
+            '.loader.spinning{animation:spin 1s linear infinite}'
+        ))
+
+    def test_classes_scripts_add_at_runtime_are_kept(self):
+        classes, ids = script_selectors("""
+            el.classList.add('fade-in', "visible");
+            document.querySelectorAll('.card .title, #contact');
+            document.getElementById('menu').className = 'open ' + state;
+            list.innerHTML = `<li class="item ${kind}">`;
+        """)
+        self.assertEqual(classes, {'fade-in', 'visible', 'card', 'title', 'open', 'item'})
+        self.assertEqual(ids, {'contact', 'menu'})
+
+        nodes, _, removed = prune(parse('.alert-success{color:green}.alert{color:red}'), set(), set(),
+                                  [re.compile(r'alert-\w+')])
+        self.assertEqual((serialize(nodes), removed), ('.alert-success{color:green}', 1))
+
+    def test_production_serves_the_hashed_copies_the_build_writes(self):
+        from django.templatetags.static import static
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        source = os.path.join(tmp.name, 'static')
+        os.makedirs(source)
+        files = {
+            'site.css': '.used { color: red }\n.unused { color: blue }\n.toggled { color: green }\n',
+            'site.js': "button.classList.toggle('toggled');",
+            'page.html': '{% if False %}<p class="used">{% endif %}',
+        }
+        for name, content in files.items():
+            with open(os.path.join(source, name), 'w') as f:
+                f.write(content)
+
+        overrides = override_settings(
+            DEBUG=production_setting('DEBUG'),
+            STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATIC_ROOT=os.path.join(tmp.name, 'root'),
+            STATICFILES_BUILD_CACHE=os.path.join(tmp.name, 'build-cache.json'),
+            CSS_PRUNE_ENABLED=production_setting('CSS_PRUNE_ENABLED'),
+            CSS_PRUNE_STYLESHEETS=['site.css'],
+            CSS_PRUNE_TEMPLATES=[os.path.join(source, 'page.html')],
+            CSS_PRUNE_SCRIPTS=['site.js'],
+            CSS_PRUNE_SAFELIST=[],
+            CSS_PRUNE_ROOT=os.path.join(source, 'pruned'),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        pruned_stylesheets.cache_clear()
+        self.addCleanup(pruned_stylesheets.cache_clear)
+
+        out = StringIO()
+        call_command('prune_css', stdout=out)
+        self.assertIn('1 of 3 rules removed', out.getvalue())
+        output = pruned_stylesheets()['site.css']
+        self.assertRegex(output, r'^pruned/site\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(source, output)) as f:
+            self.assertEqual(f.read(), '.used{color:red}.toggled{color:green}')
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.assertRegex(static('site.css'), r'^/static/pruned/site\.[0-9a-f]{12}\.[0-9a-f]{12}\.css$')
+        with self.settings(CSS_PRUNE_ENABLED=False, STATIC_URL='/static/'):
+            self.assertRegex(static('site.css'), r'^/static/site\.[0-9a-f]{12}\.css$')
+
+
+
+class JSBundleTests(TestCase):
+
+    def test_minifies_without_touching_literals_or_line_breaks(self):
+        source = (
+            "// header\n"
+            "const pattern = /[/]\\/+/g, ratio = a / b;  /* inline */\n"
+            "\n"
+            "    if (x) {\n"
+            "        label.textContent = `${ count }  items // not a comment`;\n"
+            "        return  'two  spaces' + +value\n"
+            "    }\n"
+        )
+        self.assertEqual(minify(source), (
+            "const pattern= /[/]\\/+/g,ratio=a / b;\n"
+            "if(x){\n"
+            "label.textContent=`${count}  items // not a comment`;\n"
+            "return'two  spaces'+ +value\n"
+            "}"
+        ))
+
+    @override_settings(JS_BUNDLE_ENABLED=False)
+    def test_legacy_pages_load_the_webp_helper_first(self):
+        from .cssprune import render_template
+
+        for path in settings.CSS_PRUNE_TEMPLATES:
+            html, _ = render_template(path)
+            scripts = re.findall(r'<script defer src="/static/([^"?]+)', html)
+            self.assertEqual(scripts, settings.JS_BUNDLES['legacy'], path)
+            self.assertNotIn('<script async src="/static/', html)
+
+    def test_bundle_has_a_source_map_and_replaces_the_files_under_production_settings(self):
+        from django.templatetags.static import static
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        source = os.path.join(tmp.name, 'static')
+        os.makedirs(source)
+        files = {'a.js': '// a\nvar a = 1;\n\n  a++;\n', 'b.js': '(function () {})()\n'}
+        for name, content in files.items():
+            with open(os.path.join(source, name), 'w') as f:
+                f.write(content)
+
+        overrides = override_settings(
+            DEBUG=production_setting('DEBUG'),
+            STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATIC_ROOT=os.path.join(tmp.name, 'root'),
+            STATICFILES_BUILD_CACHE=os.path.join(tmp.name, 'build-cache.json'),
+            JS_BUNDLE_ENABLED=production_setting('JS_BUNDLE_ENABLED'),
+            JS_BUNDLES={'site': ['a.js', 'b.js']},
+            JS_BUNDLE_ROOT=os.path.join(source, 'bundles'),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        js_bundles.cache_clear()
+        self.addCleanup(js_bundles.cache_clear)
+        template = Template("{% load asset_bundles %}{% js_bundle 'site' %}")
+
+        with self.settings(JS_BUNDLE_ENABLED=False):
+            self.assertEqual(template.render(Context()), (
+                '<script defer src="/static/a.js"></script>\n<script defer src="/static/b.js"></script>'
+            ))
+
+        call_command('bundle_js', stdout=StringIO())
+        output = js_bundles()['site']
+        self.assertRegex(output, r'^bundles/site\.[0-9a-f]{12}\.js$')
+        with open(os.path.join(source, output)) as f:
+            code = f.read()
+        name = os.path.basename(output)
+        self.assertEqual(code, f'var a=1;\na++;\n;(function(){{}})()\n//# sourceMappingURL={name}.map\n')
+        with open(os.path.join(source, output + '.map')) as f:
+            source_map = json.load(f)
+        self.assertEqual(source_map['sources'], ['../a.js', '../b.js'])
+        self.assertEqual(source_map['sourcesContent'], list(files.values()))
+        # a.js line 2 column 1, a.js line 4 column 3, b.js line 1 column 1
+        self.assertEqual(source_map['mappings'], 'AACA;AAEE;ACHF')
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+        url = static(output)
+        self.assertRegex(url, r'^/static/bundles/site\.[0-9a-f]{12}\.[0-9a-f]{12}\.js$')
+        self.assertEqual(template.render(Context()), f'<script defer src="{url}"></script>')
+        with open(os.path.join(settings.STATIC_ROOT, url[len('/static/'):])) as f:
+            map_name = re.search(r'sourceMappingURL=(site\.[0-9a-f]{12}\.js\.[0-9a-f]{12}\.map)\n$', f.read()).group(1)
+        self.assertTrue(os.path.isfile(os.path.join(settings.STATIC_ROOT, 'bundles', map_name)))
+
+
+class PageWeightTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.baseline = os.path.join(tmp.name, 'page-weight.json')
+
+    def test_collects_the_assets_a_browser_would_load(self):
+        collector = AssetCollector()
+        collector.feed(
+            '<link rel="stylesheet" href="/static/site.css"><link rel="canonical" href="/">'
+            '<script src="/static/app.js"></script><script>inline()</script>'
+            '<picture><source type="image/webp" srcset="/a-320.webp 320w, /a-1024.webp 1024w">'
+            '<img src="/a.jpg" srcset="/a-320.jpg 320w"></picture>'
+            '<img src="/b.jpg" srcset="/b-1x.jpg 1x, /b-2x.jpg 2x">'
+            '<div style="background:#fff url(data:image/webp;base64,AAAA)"></div>'
+            '<div style="background-image: url(\'/hero.png\')"></div>'
+        )
+        self.assertEqual(collector.assets, [
+            ('stylesheet', '/static/site.css'), ('script', '/static/app.js'),
+            ('image', '/a-1024.webp'), ('image', '/b-2x.jpg'), ('image', '/hero.png'),
+        ])
+
+    def test_measures_the_home_page(self):
+        result = PageWeigher('localhost').measure('/')
+        kinds = {asset['kind'] for asset in result['assets']}
+        self.assertTrue({'document', 'script', 'stylesheet'} <= kinds)
+        # The bundle's image is found by following the script
+        self.assertTrue(any(asset['url'].endswith('.png') for asset in result['assets']))
+        self.assertEqual(result['totals']['requests'], len(result['assets']))
+        script = next(asset for asset in result['assets'] if asset['kind'] == 'script')
+        self.assertLess(script['gzip'], script['raw'])
+        image = next(asset for asset in result['assets'] if asset['url'].endswith('.png'))
+        self.assertEqual(image['gzip'], image['raw'])  # sent as is
+
+    def test_regressions_beyond_the_thresholds_fail_the_command(self):
+        out = StringIO()
+        call_command('page_weight', baseline=self.baseline, update=True, stdout=out)
+        call_command('page_weight', baseline=self.baseline, stdout=out)
+
+        with open(self.baseline) as f:
+            baseline = json.load(f)
+        page = baseline['pages']['/']
+        page['gzip'] -= 2000  # within 5%: still fine
+        page['requests'] -= 1
+        with open(self.baseline, 'w') as f:
+            json.dump(baseline, f)
+        with self.assertRaisesMessage(CommandError, '1 page-weight regression(s)'):
+            call_command('page_weight', baseline=self.baseline, stdout=out, stderr=StringIO())
+
+        result = {'path': '/', 'totals': dict(page, raw=page['raw'] * 1.2, gzip=page['gzip'] * 2, brotli=None)}
+        regressions = compare(result, {'thresholds': {'percent': 50}, 'pages': {'/': page}})
+        self.assertEqual([message.split()[1] for message in regressions], ['gzip'])
@@ -3,7 +3,8 @@ from django.core.mail import EmailMessage
 from django.shortcuts import redirect
 from django.template.loader import get_template
 from django.template import loader
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, JsonResponse
+from django.http import FileResponse, HttpResponseNotModified
 from django.views.generic import View
 from django.contrib import messages
 from django.core.mail import send_mail
@@ -11,53 +12,68 @@ from django.views import generic
 from django.conf import settings
 from django.views.generic import FormView, TemplateView
 from django.urls import reverse_lazy
-from django.utils.http import http_date
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+from django.utils.cache import get_max_age
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from PIL import UnidentifiedImageError
+from . import aiosmtp, dbpool, imagecache, mail
+from .dedupe import is_duplicate
+from .digest import should_hold
+from .forms import ContactForm
+from .outbox import build_contact_email
+from .ratelimit import RateLimitMixin
+from .storage import static_cache_control
+from .submissions import accept_submission
+import asyncio
+import json
+import logging
 import os
 import time
 import mimetypes
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 def index(request):
    return render(request, 'index.html')
 
-class SendFormEmail(View):
+
+def contact_form_error(form):
+    """
+    The message shown to the visitor when the contact form doesn't validate
+    """
+    if not all(form.data.get(field, '') for field in form.fields):
+        return 'All fields are required.'
+    if 'email' in form.errors:
+        return 'Please enter a valid email address.'
+    return 'Please check your message and try again.'
+
+
+class SendFormEmail(RateLimitMixin, View):
 
     def post(self, request):
-        # Get the form data from POST request
-        name = request.POST.get('name', '')
-        email = request.POST.get('email', '')
-        message = request.POST.get('message', '')
+        form = ContactForm(request.POST)
 
         # Validate required fields
-        if not all([name, email, message]):
-            messages.error(request, 'All fields are required.')
+        if not form.is_valid():
+            messages.error(request, contact_form_error(form))
             return redirect('index')
 
-        # Send email to admin with contact form details
-        admin_email = getattr(settings, 'ADMIN_EMAIL', 'admin@example.com')
-        
-        email_subject = f'New Contact Form Message from {name}'
-        email_body = f'''New contact form submission:
-
-Name: {name}
-Email: {email}
-Message:
-{message}
-
-Reply to: {email}'''
-        
+        # Store and queue the message; the deliver_outbox worker talks to SMTP.
+        # Repeats of a recent submission are acknowledged without another email.
         try:
-            send_mail(
-                email_subject,
-                email_body,
-                settings.DEFAULT_FROM_EMAIL,
-                [admin_email],
-                fail_silently=False,
-            )
+            accept_submission(**form.cleaned_data)
             messages.success(request, 'Thank you for your message! I will get back to you soon.')
-        except Exception as e:
+        except Exception:
+            logger.exception('Could not queue contact form message')
             messages.error(request, 'Sorry, there was an error sending your message. Please try again later.')
-            print(f'Email sending error: {e}')
 
         return redirect('index')
 
@@ -66,47 +82,217 @@ Reply to: {email}'''
         return redirect('index')
 
 
+class AsyncSendFormEmail(RateLimitMixin, View):
+    """
+    Contact form view for ASGI deployments.
+
+    The notification is handed straight to the SMTP server with an asyncio
+    client, so a slow server costs a suspended coroutine instead of a
+    blocked thread. If SMTP is not configured or the send fails, the
+    message is queued in the outbox instead. In digest mode non-urgent
+    messages are held for the next digest like in ``SendFormEmail``, and
+    the submission is stored and queued in one transaction the same way.
+    """
+
+    async def post(self, request):
+        form = ContactForm(request.POST)
+
+        if not form.is_valid():
+            messages.error(request, contact_form_error(form))
+            return redirect('index')
+
+        try:
+            await self.deliver(**form.cleaned_data)
+            messages.success(request, 'Thank you for your message! I will get back to you soon.')
+        except Exception:
+            logger.exception('Could not send or queue contact form message')
+            messages.error(request, 'Sorry, there was an error sending your message. Please try again later.')
+
+        return redirect('index')
+
+    async def get(self, request):
+        return redirect('index')
+
+    async def deliver(self, name, email, message):
+        # The cache helpers and the ORM block, so they run in a thread
+        if await sync_to_async(is_duplicate)(name, email, message):
+            return
+        sent = not should_hold(message) and await self.send(name, email, message)
+        # Stored, queued if not sent, and remembered on commit like SendFormEmail
+        await sync_to_async(accept_submission)(name, email, message, sent=sent)
+
+    async def send(self, name, email, message):
+        """
+        Send the notification straight to SMTP; False if it has to be queued
+        """
+        if not aiosmtp.smtp_configured():
+            return False
+        subject, body = build_contact_email(name, email, message)
+        admin_email = getattr(settings, 'ADMIN_EMAIL', 'admin@example.com')
+        email_message = EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [admin_email],
+                                     reply_to=[email])
+        try:
+            await aiosmtp.send_message(email_message)
+            return True
+        except (aiosmtp.AsyncSMTPError, OSError, asyncio.TimeoutError) as exc:
+            logger.warning('Async SMTP send failed, queueing message instead: %s', exc)
+            return False
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ContactAPIView(RateLimitMixin, View):
+    """
+    JSON contact endpoint for the React frontend.
+
+    Accepts ``{"name", "email", "message"}`` and answers ``202 Accepted``
+    once the message is stored and queued, or ``400`` with
+    ``{"errors": {field: [messages]}}``. There is no redirect, so a
+    submission is a single request.
+
+    CSRF checks are skipped because only ``application/json`` bodies are
+    accepted: browsers can't send those cross-site without a CORS preflight,
+    which this endpoint never approves.
+    """
+    http_method_names = ['post']
+
+    def post(self, request):
+        if request.content_type != 'application/json':
+            return JsonResponse({'error': 'Expected application/json'}, status=415)
+        try:
+            data = json.loads(request.body)
+        except (ValueError, UnicodeDecodeError):
+            data = None
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+        form = ContactForm(data)
+        if not form.is_valid():
+            errors = {field: [str(error) for error in field_errors] for field, field_errors in form.errors.items()}
+            return JsonResponse({'errors': errors}, status=400)
+
+        try:
+            accept_submission(**form.cleaned_data)
+        except Exception:
+            logger.exception('Could not queue contact form message')
+            return JsonResponse({'error': 'Could not accept the message, please try again later.'}, status=503)
+        return JsonResponse({'status': 'accepted'}, status=202)
+
+    def rate_limited(self, request, retry_after):
+        response = JsonResponse({'error': 'Too many requests, please try again later.'}, status=429)
+        response['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+        return response
+
+
+@never_cache
+@staff_member_required
+def metrics(request):
+    """
+    Connection pool and cache statistics for this worker process, for monitoring
+    """
+    return JsonResponse({
+        'pid': os.getpid(),
+        'database_pools': dbpool.get_metrics(),
+        'email_pools': mail.get_metrics(),
+        'caches': {
+            alias: caches[alias].stats()
+            for alias in settings.CACHES if hasattr(caches[alias], 'stats')
+        },
+    })
+
+
+@require_safe
+def resized_image(request, width, fmt, path):
+    """
+    ``/img/<width>/<format>/<path>``: a static image resized on demand.
+
+    Only IMAGE_RESIZE_WIDTHS and IMAGE_RESIZE_FORMATS are served. URLs
+    carrying the source's content hash as ``?v=`` (see
+    ``imagecache.resized_image_url``) are cached as immutable.
+    """
+    if width not in imagecache.allowed_widths() or fmt not in imagecache.allowed_formats():
+        raise Http404('Unsupported image size or format')
+    source = imagecache.find_source(path)
+    if source is None:
+        raise Http404('Image not found')
+
+    renderer = imagecache.get_renderer()
+    timeout = getattr(settings, 'IMAGE_RESIZE_TIMEOUT', 10)
+    try:
+        variant, etag = renderer.get(source, width, fmt, timeout=timeout)
+        try:
+            body = open(variant, 'rb')
+        except FileNotFoundError:
+            # Evicted by another worker in between; render it again
+            variant, etag = renderer.get(source, width, fmt, timeout=timeout)
+            body = open(variant, 'rb')
+    except (imagecache.Overloaded, FuturesTimeout):
+        response = HttpResponse('Image resizing is busy, please retry.', status=503, content_type='text/plain')
+        response['Retry-After'] = '2'
+        return response
+    except (UnidentifiedImageError, OSError):
+        raise Http404('Image could not be read')
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        body.close()
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(body, content_type=imagecache.CONTENT_TYPES[fmt])
+    response['ETag'] = etag
+    if request.GET.get('v') == etag.strip('"').split('-')[0]:
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = f"public, max-age={getattr(settings, 'IMAGE_RESIZE_MAX_AGE', 86400)}"
+    return response
+
+
 def cached_static_serve(request, path, document_root=None, show_indexes=False):
     """
     Serve static files with proper cache headers
     """
-    print(f"DEBUG: cached_static_serve called for path: {path}")
     if document_root is None:
         if settings.DEBUG:
             document_root = settings.STATICFILES_DIRS[0] if settings.STATICFILES_DIRS else settings.STATIC_ROOT
         else:
             document_root = settings.STATIC_ROOT
-    print(f"DEBUG: Using document_root: {document_root}")
-    
+
     # Get the file
     fullpath = os.path.join(document_root, path)
-    
+
     if not os.path.exists(fullpath):
         raise Http404('Static file not found')
-    
+
     # Get file stats
     statobj = os.stat(fullpath)
-    
-    # Determine content type
-    content_type, encoding = mimetypes.guess_type(fullpath)
-    content_type = content_type or 'application/octet-stream'
-    
-    # Read file content
-    with open(fullpath, 'rb') as f:
-        content = f.read()
-    
-    # Create response
-    response = HttpResponse(content, content_type=content_type)
-    
-    # Add cache headers
-    max_age = getattr(settings, 'STATIC_FILE_MAX_AGE', 31536000)  # 1 year
-    response['Cache-Control'] = f'public, max-age={max_age}, immutable'
-    response['Expires'] = http_date(time.time() + max_age)
-    response['Last-Modified'] = http_date(statobj.st_mtime)
-    response['ETag'] = f'"static-{statobj.st_mtime}-{statobj.st_size}"'
-    
-    # Add content disposition for certain file types
-    if path.endswith(('.css', '.js')):
-        response['Content-Disposition'] = f'inline; filename="{os.path.basename(path)}"'
-    
+    etag = f'"static-{statobj.st_mtime_ns:x}-{statobj.st_size:x}"'
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        # Determine content type
+        content_type, encoding = mimetypes.guess_type(fullpath)
+        content_type = content_type or 'application/octet-stream'
+
+        # Read file content
+        with open(fullpath, 'rb') as f:
+            content = f.read()
+
+        # Create response
+        response = HttpResponse(content, content_type=content_type)
+        response['Last-Modified'] = http_date(statobj.st_mtime)
+
+        # Add content disposition for certain file types
+        if path.endswith(('.css', '.js')):
+            response['Content-Disposition'] = f'inline; filename="{os.path.basename(path)}"'
+
+    # Add cache headers: a year for hashed or current ?v= URLs, otherwise per the storage
+    response['ETag'] = etag
+    cache_control = static_cache_control(path, request.GET.get('v'))
+    if cache_control is None:
+        max_age = getattr(settings, 'STATIC_FILE_MAX_AGE', 31536000)  # 1 year
+        cache_control = f'public, max-age={max_age}, immutable'
+    response['Cache-Control'] = cache_control
+    max_age = get_max_age(response)
+    if max_age:
+        response['Expires'] = http_date(time.time() + max_age)
+
     return response
@@ -0,0 +1,156 @@
+"""
+Cache warmup after a deploy.
+
+Each task returns ``(done, failures)`` and is safe to run in parallel:
+
+* ``templates`` compiles templates into the cached loader and builds the
+  URL resolver and the image index, all per process.
+* ``pages`` requests pages through the full middleware stack, as an
+  anonymous visitor on each public host, so ``UpdateCacheMiddleware`` stores
+  them under the same keys real requests will look up.
+* ``static`` loads the static manifest and writes missing or stale gzip
+  (and Brotli, when installed) variants next to the collected files.
+"""
+import io
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.urls import get_resolver
+from whitenoise.compress import Compressor
+
+from .images import image_index
+
+logger = logging.getLogger(__name__)
+
+TASKS = ('templates', 'pages', 'static')
+
+
+def warm_hosts():
+    """
+    WARM_CACHE_HOSTS, else the concrete (non-wildcard) ALLOWED_HOSTS
+    """
+    hosts = getattr(settings, 'WARM_CACHE_HOSTS', None)
+    if hosts:
+        return list(hosts)
+    return [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')] or ['localhost']
+
+
+def warm_templates():
+    done, failures = 0, []
+    # Imports the URLconf and builds the reverse lookup tables
+    get_resolver().reverse_dict
+    image_index()
+    for name in getattr(settings, 'WARM_CACHE_TEMPLATES', ['index.html']):
+        try:
+            get_template(name)
+            done += 1
+        except TemplateDoesNotExist as exc:
+            failures.append(f'template {name}: {exc}')
+    return done, failures
+
+
+def _fetch(handler, host, path, scheme):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': host,
+        'SERVER_PORT': '443' if scheme == 'https' else '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': host,
+        'HTTP_X_FORWARDED_PROTO': scheme,
+        'HTTP_USER_AGENT': 'warm_caches',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scheme,
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    statuses = []
+    try:
+        response = handler(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        for _ in response:
+            pass
+        response.close()
+    finally:
+        connections.close_all()
+    return statuses[0] if statuses else '500'
+
+
+def warm_pages(hosts=None, paths=None, scheme=None, workers=4):
+    hosts = hosts or warm_hosts()
+    paths = paths or getattr(settings, 'WARM_CACHE_PATHS', ['/'])
+    scheme = scheme or ('http' if settings.DEBUG else 'https')
+    handler = WSGIHandler()
+    targets = [(host, path) for host in hosts for path in paths]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        statuses = list(pool.map(lambda target: _fetch(handler, *target, scheme), targets))
+    failures = [
+        f'{scheme}://{host}{path}: {status}'
+        for (host, path), status in zip(targets, statuses)
+        if not status.startswith('200')
+    ]
+    return len(targets) - len(failures), failures
+
+
+def _compress_if_stale(compressor, path):
+    mtime = os.stat(path).st_mtime
+    variants = [path + '.gz'] + ([path + '.br'] if compressor.use_brotli else [])
+    if all(os.path.exists(variant) and os.stat(variant).st_mtime >= mtime for variant in variants):
+        return False
+    list(compressor.compress(path))
+    return True
+
+
+def warm_static(workers=4):
+    failures = []
+    # Instantiating the storage loads the manifest of hashed names
+    getattr(staticfiles_storage, 'hashed_files', None)
+    root = settings.STATIC_ROOT
+    if not root or not os.path.isdir(root):
+        return 0, failures
+    compressor = Compressor(quiet=True)
+    paths = [
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(root)
+        for filename in filenames
+        if compressor.should_compress(filename)
+    ]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        compressed = sum(pool.map(lambda path: _compress_if_stale(compressor, path), paths))
+    return compressed, failures
+
+
+def warm(tasks=TASKS, workers=4, hosts=None, paths=None, scheme=None):
+    """
+    Run the given tasks in parallel; return ``{task: (seconds, done, failures)}``
+    """
+    runners = {
+        'templates': warm_templates,
+        'pages': lambda: warm_pages(hosts, paths, scheme, workers),
+        'static': lambda: warm_static(workers),
+    }
+
+    def timed(task):
+        started = time.perf_counter()
+        try:
+            done, failures = runners[task]()
+        except Exception as exc:
+            logger.exception('Cache warmup task %s failed', task)
+            done, failures = 0, [f'{task}: {exc}']
+        return task, (time.perf_counter() - started, done, failures)
+
+    with ThreadPoolExecutor(max_workers=len(tasks) or 1) as pool:
+        return dict(pool.map(timed, tasks))
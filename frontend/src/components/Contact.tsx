@@ -2,21 +2,6 @@ import { useState } from 'react';
 import { motion } from 'motion/react';
 import { Mail, User, Building2, MessageSquare, Send, CheckCircle, Globe } from 'lucide-react';
 
-function getCookie(name: string) {
-  let cookieValue = null;
-  if (document.cookie && document.cookie !== '') {
-    const cookies = document.cookie.split(';');
-    for (let i = 0; i < cookies.length; i++) {
-      const cookie = cookies[i].trim();
-      if (cookie.substring(0, name.length + 1) === (name + '=')) {
-        cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
-        break;
-      }
-    }
-  }
-  return cookieValue;
-}
-
 export function Contact() {
   const [formData, setFormData] = useState({
     name: '',
@@ -29,30 +14,25 @@ export function Contact() {
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
     
-    const data = new FormData();
-    data.append('name', formData.name);
-    data.append('email', formData.email);
-    data.append('company', formData.company);
-    data.append('message', formData.message);
-
     try {
-      const response = await fetch('/contact/', {
+      // Answers 202 once the message is queued, or 400 with per-field errors
+      const response = await fetch('/api/contact/', {
         method: 'POST',
-        headers: {
-          'X-CSRFToken': getCookie('csrftoken') || '',
-        },
-        body: data,
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(formData),
       });
 
-      if (response.ok || response.redirected) {
+      if (response.status === 202) {
         setSubmitted(true);
         setTimeout(() => {
           setSubmitted(false);
           setFormData({ name: '', email: '', company: '', message: '' });
         }, 3000);
       } else {
-        console.error('Form submission failed');
-        alert('Failed to send message. Please try again.');
+        const body = await response.json().catch(() => ({}));
+        const fieldErrors: string[][] = Object.values(body.errors || {});
+        console.error('Form submission failed', body);
+        alert(fieldErrors[0]?.[0] || body.error || 'Failed to send message. Please try again.');
       }
     } catch (error) {
       console.error('Error:', error);
@@ -0,0 +1,23 @@
+"""
+Gunicorn settings, read automatically from the working directory.
+"""
+import io
+import os
+
+
+def post_worker_init(worker):
+    """
+    Compile templates and fill the page cache before the worker takes
+    requests; WARM_CACHES_ON_BOOT=false turns this off
+    """
+    if os.environ.get('WARM_CACHES_ON_BOOT', 'true').lower() not in ('1', 'true', 'yes'):
+        return
+    from django.core.management import call_command
+
+    output = io.StringIO()
+    try:
+        call_command('warm_caches', tasks=['templates', 'pages'], workers=2, stdout=output, stderr=output)
+    except Exception:
+        worker.log.exception('Cache warmup failed')
+    else:
+        worker.log.info('Cache warmup:\n%s', output.getvalue().rstrip())
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_Portfolio.settings')
+# Serve /contact/ with the async view, which sends mail without blocking a thread
+os.environ.setdefault('CONTACT_ASYNC', 'true')
 
 application = get_asgi_application()
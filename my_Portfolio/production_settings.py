@@ -36,14 +36,35 @@ if config('DATABASE_URL', default=None):
         'default': dj_database_url.config(conn_max_age=500)
     }
 else:
-    # Use SQLite for local production testing
+    # Use SQLite for local production testing. Pragmas come from SQLITE_PRAGMAS;
+    # IMMEDIATE transactions take the write lock up front so concurrent
+    # writers wait on busy_timeout instead of failing with "database is locked".
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': os.path.join(BASE_DIR, 'production_db.sqlite3'),
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+            },
         }
     }
 
+# DATABASE_POOL=true swaps in the pooled backend (backend.dbpool): each worker
+# keeps DATABASE_POOL_MIN..DATABASE_POOL_MAX connections and Django hands them
+# back to the pool at the end of every request instead of keeping its own.
+if config('DATABASE_POOL', default=False, cast=bool):
+    _engine = DATABASES['default']['ENGINE'].rsplit('.', 1)[-1]
+    if _engine in ('sqlite3', 'postgresql'):
+        DATABASES['default'].update({
+            'ENGINE': f'backend.dbpool.{_engine}',
+            'CONN_MAX_AGE': 0,
+            'POOL': {
+                'MIN_SIZE': config('DATABASE_POOL_MIN', default=1, cast=int),
+                'MAX_SIZE': config('DATABASE_POOL_MAX', default=10, cast=int),
+                'TIMEOUT': config('DATABASE_POOL_TIMEOUT', default=5, cast=float),
+            },
+        })
+
 # Static files configuration for production
 # Explicitly set BASE_DIR to root of project (assuming production_settings.py is in my_Portfolio/)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -52,10 +73,87 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# STORAGES (settings.py) hashes and compresses like WhiteNoise's
+# CompressedManifestStaticFilesStorage, but collectstatic only reprocesses
+# files that changed since the last build (and the files referencing them).
+# STATICFILES_INCREMENTAL=False rebuilds all.
+# A {% static %} name missing from the manifest gets a plain URL instead of
+# raising, so one uncollected file can't turn a page into a 500.
+WHITENOISE_MANIFEST_STRICT = False
+STATICFILES_INCREMENTAL = config('STATICFILES_INCREMENTAL', default=True, cast=bool)
+STATICFILES_BUILD_CACHE = config('STATICFILES_BUILD_CACHE', default=os.path.join(BASE_DIR, '.static-build-cache.json'))
+
+# settings.py derives these from its own DEBUG = True, before DEBUG is
+# switched off above, so production sets them itself.
+# Serve the copies `prune_css` writes in place of the full stylesheets
+CSS_PRUNE_ENABLED = config('CSS_PRUNE_ENABLED', default=True, cast=bool)
+# Link the bundles `bundle_js` writes instead of their separate scripts
+JS_BUNDLE_ENABLED = config('JS_BUNDLE_ENABLED', default=True, cast=bool)
+
+# 'shared' is one cache for every gunicorn worker on the node, so page
+# caching, rate limits and duplicate detection agree between workers.
+# 'default' puts a short-lived per-process LRU in front of it and prefixes
+# keys with the deploy version, so a deploy never serves the previous
+# deploy's cached pages.
+CACHES = {
+    'default': {
+        'BACKEND': 'backend.cache.tiered.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': config('CACHE_L1_MAX_ENTRIES', default=512, cast=int),
+            'L1_TIMEOUT': config('CACHE_L1_TIMEOUT', default=5, cast=int),
+        },
+    },
+    'shared': {
+        'BACKEND': 'backend.cache.shm.SharedMemoryCache',
+        'LOCATION': config(
+            'CACHE_LOCATION',
+            default='/dev/shm/portfolio-cache' if os.path.isdir('/dev/shm') else '/tmp/portfolio-cache',
+        ),
+        'OPTIONS': {
+            'SLOTS': config('CACHE_SLOTS', default=2048, cast=int),
+            'SLOT_SIZE': config('CACHE_SLOT_SIZE', default=16384, cast=int),
+            'WAYS': 8,
+        },
+    },
+}
+# Counters and the duplicate filter must see other workers' writes at once
+RATELIMIT_CACHE_ALIAS = 'shared'
+CONTACT_DEDUPE_CACHE_ALIAS = 'shared'
+
+# Hosts whose pages `warm_caches` prerenders (the page cache key includes the host)
+WARM_CACHE_HOSTS = [
+    h.strip() for h in config(
+        'WARM_CACHE_HOSTS',
+        default=','.join(filter(None, [
+            'ebenezerportfolio.com', 'www.ebenezerportfolio.com', os.environ.get('RENDER_EXTERNAL_HOSTNAME'),
+        ])),
+    ).split(',') if h.strip()
+]
+
+# Render's proxy appends the client address to X-Forwarded-For
+RATELIMIT_PROXY_COUNT = config('RATELIMIT_PROXY_COUNT', default=1, cast=int)
 
 # WhiteNoise middleware for serving static files
-MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+MIDDLEWARE.insert(
+    MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+)
+
+
+def _static_headers(headers, path, url):
+    # Imported here: settings load before the apps do
+    from backend.storage import add_static_headers
+    add_static_headers(headers, path, url)
+
+
+# Hashed files are cached for a year, anything else briefly (STATIC_FILE_UNHASHED_MAX_AGE)
+WHITENOISE_ADD_HEADERS_FUNCTION = _static_headers
+
+# Instrument a sample of requests; findings go to the backend.queries logger
+QUERY_INSTRUMENTATION_ENABLED = config('QUERY_INSTRUMENTATION_ENABLED', default=True, cast=bool)
+QUERY_INSTRUMENTATION_SAMPLE_RATE = config('QUERY_INSTRUMENTATION_SAMPLE_RATE', default=0.05, cast=float)
+QUERY_INSTRUMENTATION_HEADERS = False
 
 # Security settings for production
 SECURE_BROWSER_XSS_FILTER = True
@@ -86,6 +184,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'backend.queries': {
+            'handlers': ['file'],
+            'level': 'WARNING',
+        },
     },
 }
 
@@ -111,13 +213,16 @@ TEMPLATES = [
 ]
 
 # Email configuration
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# SMTP connections are pooled and reused by the outbox worker (see backend/mail.py)
+EMAIL_BACKEND = 'backend.mail.PooledEmailBackend'
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
 EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 EMAIL_USE_TLS = True
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@ebenezerportfolio.com')
 ADMIN_EMAIL = config('ADMIN_EMAIL', default='admin@ebenezerportfolio.com')
+CONTACT_DIGEST_ENABLED = config('CONTACT_DIGEST_ENABLED', default=False, cast=bool)
 if not EMAIL_HOST_USER or not EMAIL_HOST_PASSWORD:
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -44,8 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.middleware.cache.UpdateCacheMiddleware',
+    'backend.middleware.StaleUpdateCacheMiddleware',
     'backend.middleware.StaticFilesCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,7 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
+    'backend.middleware.StaleFetchFromCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'my_Portfolio.urls'
@@ -137,19 +138,25 @@ CACHES = {
     }
 }
 
-# Static files caching - Use ManifestStaticFilesStorage for better caching
-if DEBUG:
-    STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
-else:
-    STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+# Static files caching: hashed names from the collectstatic manifest, looked
+# up in memory; in DEBUG, ?v=<mtime> query strings instead (backend.storage)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'backend.storage.CachedStaticFilesStorage'},
+}
+WHITENOISE_MANIFEST_STRICT = False  # files missing from the manifest get plain, short-lived URLs
 
 # Cache timeout settings
 CACHE_MIDDLEWARE_ALIAS = 'default'
 CACHE_MIDDLEWARE_SECONDS = 600  # 10 minutes
+CACHE_MIDDLEWARE_STALE_SECONDS = 600  # serve expired pages this much longer while one request re-renders them
+CACHE_REVALIDATE_LOCK_TIMEOUT = 30    # seconds before a stuck regeneration can be retried
+CACHE_REVALIDATE_WORKERS = 2          # background regeneration threads per process
 CACHE_MIDDLEWARE_KEY_PREFIX = ''
 
 # Static files cache headers
 STATIC_FILE_MAX_AGE = 31536000  # 1 year for static files
+STATIC_FILE_UNHASHED_MAX_AGE = 3600  # files served without a content hash in their name
 
 # Only use DATABASE_URL if it's set (for production/Heroku)
 db_from_env = dj_database_url.config(conn_max_age=500)
@@ -160,8 +167,123 @@ else:
     print("Using SQLite database for local development")
 
 
+# Applied to every new SQLite connection by backend.sqlite.apply_sqlite_pragmas
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',          # readers don't block writers (persists in the file)
+    'synchronous': 'NORMAL',        # fsync at checkpoints only; safe with WAL
+    'mmap_size': 134217728,         # 128 MiB memory-mapped reads
+    'cache_size': -20000,           # ~20 MB page cache per connection
+    'busy_timeout': 5000,           # wait up to 5s for a write lock instead of failing
+    'temp_store': 'MEMORY',
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Contact form outbox, delivered by `python manage.py deliver_outbox`
+OUTBOX_MAX_ATTEMPTS = 6          # attempts before a message is dead-lettered
+OUTBOX_BACKOFF_BASE = 30         # seconds, doubled after every failed attempt
+OUTBOX_BACKOFF_MAX = 3600
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_CONCURRENCY = 2           # SMTP connections used at once by the worker
+OUTBOX_LOCK_TIMEOUT = 300        # reclaim messages from workers that died mid-send
+OUTBOX_POLL_INTERVAL = 5
+
+# Digest mode: hold contact messages and send one summary email every
+# CONTACT_DIGEST_INTERVAL minutes or CONTACT_DIGEST_MAX_MESSAGES messages
+# (turning it off releases held messages to go out one by one)
+CONTACT_DIGEST_ENABLED = False
+CONTACT_DIGEST_INTERVAL = 15
+CONTACT_DIGEST_MAX_MESSAGES = 25
+CONTACT_DIGEST_URGENT_KEYWORDS = ['urgent', 'asap', 'emergency']   # these skip the digest
+
+# Identical contact submissions within this many seconds are acknowledged
+# without another email (None disables). The Bloom filter has fixed size:
+# CONTACT_DEDUPE_BLOCKS x CONTACT_DEDUPE_BLOCK_BITS bits per generation.
+CONTACT_DEDUPE_WINDOW = 600
+CONTACT_DEDUPE_BLOCKS = 16
+CONTACT_DEDUPE_BLOCK_BITS = 4096
+CONTACT_DEDUPE_HASHES = 7
+CONTACT_DEDUPE_CACHE_ALIAS = 'default'
+
+# Send contact messages with the asyncio SMTP client instead of the outbox.
+# asgi.py turns this on so ASGI deployments don't block a thread per send.
+CONTACT_ASYNC = os.environ.get('CONTACT_ASYNC', '').lower() in ('1', 'true', 'yes')
+EMAIL_CONNECT_TIMEOUT = 5
+
+# SMTP connection pool used by backend.mail.PooledEmailBackend
+EMAIL_POOL_SIZE = OUTBOX_CONCURRENCY
+EMAIL_POOL_MAX_IDLE = 60               # seconds before an idle connection is dropped
+EMAIL_POOL_HEALTH_CHECK_AFTER = 10     # NOOP connections idle for longer than this
+EMAIL_POOL_TIMEOUT = 10                # seconds to wait for a free connection
+
+# Token bucket limits for /contact/ as (requests, period in seconds), or None to
+# disable: bursts of up to `requests`, refilled at `requests` per period. The
+# buckets live in this cache alias, so it must be shared between workers.
+CONTACT_RATE_LIMIT_PER_IP = (5, 600)
+CONTACT_RATE_LIMIT_GLOBAL = (100, 60)
+RATELIMIT_CACHE_ALIAS = 'default'
+RATELIMIT_PROXY_COUNT = 0              # trusted proxies adding X-Forwarded-For
+
+# Per-request SQL instrumentation (backend.middleware.QueryInstrumentationMiddleware)
+QUERY_INSTRUMENTATION_ENABLED = DEBUG
+QUERY_INSTRUMENTATION_SAMPLE_RATE = 1.0        # fraction of requests instrumented
+QUERY_INSTRUMENTATION_HEADERS = DEBUG          # add X-DB-Query-Count / X-DB-Time-Ms headers
+QUERY_INSTRUMENTATION_REPEAT_THRESHOLD = 5     # same statement shape this often looks like N+1
+QUERY_INSTRUMENTATION_SLOWEST = 3              # statements listed in slow-request warnings
+QUERY_INSTRUMENTATION_SLOW_MS = 200            # warn when a request spends this long in the DB
+
+# `python manage.py warm_caches` (also run by gunicorn.conf.py as each worker boots)
+WARM_CACHE_PATHS = ['/']
+WARM_CACHE_TEMPLATES = ['index.html']
+WARM_CACHE_HOSTS = []                         # empty: the concrete ALLOWED_HOSTS
+
+# Responsive image derivatives, built by `python manage.py build_images`.
+# Suffixes and widths match what static/responsive-images.js requests.
+IMAGE_SOURCE_DIRS = [os.path.join(BASE_DIR, 'static', 'assets')]
+IMAGE_DERIVATIVE_ROOT = os.path.join(BASE_DIR, 'static', 'responsive')   # served as /static/responsive/
+IMAGE_DERIVATIVE_WIDTHS = {'mobile': 320, 'tablet': 768, 'desktop': 1024, 'large': 1920}
+IMAGE_DERIVATIVE_FORMATS = ['avif', 'webp', 'jpeg']                     # avif only if Pillow can write it
+IMAGE_DERIVATIVE_QUALITY = {'avif': 55, 'webp': 80, 'jpeg': 82}
+IMAGE_DERIVATIVE_MIN_WIDTH = 400                                        # leave icons alone
+IMAGE_INDEX_PATH = os.path.join(IMAGE_DERIVATIVE_ROOT, 'index.json')    # read by {% picture %}
+IMAGE_PLACEHOLDER_WIDTH = 16                                            # px, inlined as base64
+
+# On-demand resizing at /img/<width>/<format>/<path> (backend.imagecache)
+IMAGE_RESIZE_WIDTHS = [160, 320, 480, 640, 768, 1024, 1280, 1920]
+IMAGE_RESIZE_FORMATS = ['avif', 'webp', 'jpeg']
+IMAGE_RESIZE_WORKERS = 2                        # render threads per process
+IMAGE_RESIZE_MAX_QUEUE = 16                     # distinct renders in flight before answering 503
+IMAGE_RESIZE_TIMEOUT = 10                       # seconds a request waits for its render
+IMAGE_RESIZE_MAX_AGE = 86400                    # Cache-Control for URLs without ?v=<hash>
+IMAGE_CACHE_DIR = os.path.join(BASE_DIR, '.image-cache')
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# `python manage.py page_weight`: fails when a page outgrows the committed
+# baseline by more than its thresholds; `--update` accepts the new sizes
+PAGE_WEIGHT_PATHS = ['/']
+PAGE_WEIGHT_BASELINE = os.path.join(BASE_DIR, 'page-weight.json')
+
+# `python manage.py prune_css`: copies of the legacy stylesheets without the
+# selectors the legacy page can't match, served in their place when enabled
+CSS_PRUNE_ENABLED = not DEBUG                 # production_settings.py sets its own
+CSS_PRUNE_STYLESHEETS = ['styles.css', 'main.css']
+CSS_PRUNE_TEMPLATES = [                       # every page linking CSS_PRUNE_STYLESHEETS
+    os.path.join(BASE_DIR, 'my_Portfolio', 'backend', 'Templates', 'index_old.html'),
+    os.path.join(BASE_DIR, 'my_Portfolio', 'my_Portfolio', 'backend', 'Templates', 'index_old.html'),
+]
+CSS_PRUNE_SCRIPTS = ['script.js', 'script-optimized.js', 'image-optimizer.js', 'responsive-images.js']
+CSS_PRUNE_SAFELIST = [r'alert-\w+']          # regexes for classes built at runtime (message tags)
+CSS_PRUNE_ROOT = os.path.join(BASE_DIR, 'static', 'pruned')     # served as /static/pruned/
+
+# `python manage.py bundle_js`: each bundle's scripts concatenated, minified and
+# fingerprinted into one deferred script with a source map. {% js_bundle %}
+# links the bundle when enabled and the separate files otherwise
+JS_BUNDLE_ENABLED = not DEBUG                 # production_settings.py sets its own
+JS_BUNDLES = {
+    'legacy': ['webp-support.js', 'responsive-images.js', 'image-optimizer.js', 'script-optimized.js'],
+}
+JS_BUNDLE_ROOT = os.path.join(BASE_DIR, 'static', 'bundles')     # served as /static/bundles/
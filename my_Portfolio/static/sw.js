@@ -3,10 +3,10 @@
 // Advanced caching strategies and offline functionality
 // ==========================================================================
 
-const CACHE_NAME = 'portfolio-v1.2';
-const STATIC_CACHE = 'static-v1.2';
-const DYNAMIC_CACHE = 'dynamic-v1.2';
-const IMAGE_CACHE = 'images-v1.2';
+const CACHE_NAME = 'portfolio-v1.3';
+const STATIC_CACHE = 'static-v1.3';
+const DYNAMIC_CACHE = 'dynamic-v1.3';
+const IMAGE_CACHE = 'images-v1.3';
 
 // Assets to cache immediately
 const STATIC_ASSETS = [
@@ -14,6 +14,7 @@ const STATIC_ASSETS = [
     '/static/critical.css',
     '/static/styles.css',
     '/static/script.js',
+    '/static/webp-support.js',
     '/static/image-optimizer.js',
     '/static/assets/favicon.svg',
     '/static/assets/apple-touch-icon.png'
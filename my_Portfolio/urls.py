@@ -21,7 +21,7 @@ from django.conf.urls.static import static
 from django.views.generic import TemplateView
 from django.http import HttpResponse
 from backend import views
-from backend.views import SendFormEmail
+from backend.views import AsyncSendFormEmail, ContactAPIView, SendFormEmail
 
 
 def vite_client_handler(request):
@@ -32,7 +32,11 @@ def vite_client_handler(request):
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.index, name='index'),
-    path('contact/', SendFormEmail.as_view(), name='contact'),
+    path('contact/', (AsyncSendFormEmail if settings.CONTACT_ASYNC else SendFormEmail).as_view(), name='contact'),
+    path('contact/async/', AsyncSendFormEmail.as_view(), name='contact_async'),
+    path('api/contact/', ContactAPIView.as_view(), name='contact_api'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('img/<int:width>/<str:fmt>/<path:path>', views.resized_image, name='resized_image'),
     path('@vite/client', vite_client_handler, name='vite_client'),
 ]
 
@@ -27,13 +27,10 @@ class ImageOptimizer {
 
     // Check if browser supports WebP format
     checkWebPSupport() {
-        return new Promise((resolve) => {
-            const webP = new Image();
-            webP.onload = webP.onerror = () => {
-                resolve(webP.height === 2);
-            };
-            webP.src = 'data:image/webp;base64,UklGRjoAAABXRUJQVlA4IC4AAACyAgCdASoCAAIALmk0mk0iIiIiIgBoSygABc6WWgAA/veff/0PP8bA//LwYAAA';
-        });
+        if (typeof window.webpSupport !== 'function') {
+            throw new Error('image-optimizer.js needs webp-support.js, load it first (or use {% js_bundle %})');
+        }
+        return window.webpSupport();
     }
 
     // Initialize intersection observer for lazy loading
@@ -19,14 +19,11 @@ class ResponsiveImageManager {
     async checkWebPSupport() {
         if (this.webpSupported !== null) return this.webpSupported;
         
-        return new Promise((resolve) => {
-            const webP = new Image();
-            webP.onload = webP.onerror = () => {
-                this.webpSupported = (webP.height === 2);
-                resolve(this.webpSupported);
-            };
-            webP.src = 'data:image/webp;base64,UklGRjoAAABXRUJQVlA4IC4AAACyAgCdASoCAAIALmk0mk0iIiIiIgBoSygABc6WWgAA/veff/0PP8bA//LwYAAA';
-        });
+        if (typeof window.webpSupport !== 'function') {
+            throw new Error('responsive-images.js needs webp-support.js, load it first (or use {% js_bundle %})');
+        }
+        this.webpSupported = await window.webpSupport();
+        return this.webpSupported;
     }
     
     // Get connection speed
@@ -0,0 +1,22 @@
+// ==========================================================================
+// WEBP DETECTION
+// One check per page, shared by image-optimizer.js and responsive-images.js
+// ==========================================================================
+
+window.webpSupport = window.webpSupport || (() => {
+    let detection = null;
+
+    // Resolves to true when the browser decodes a lossy WebP image
+    return () => {
+        if (!detection) {
+            detection = new Promise((resolve) => {
+                const webP = new Image();
+                webP.onload = webP.onerror = () => {
+                    resolve(webP.height === 2);
+                };
+                webP.src = 'data:image/webp;base64,UklGRjoAAABXRUJQVlA4IC4AAACyAgCdASoCAAIALmk0mk0iIiIiIgBoSygABc6WWgAA/veff/0PP8bA//LwYAAA';
+            });
+        }
+        return detection;
+    };
+})();